@@ -0,0 +1,41 @@
+"""Add channel_probes table
+
+Revision ID: add_channel_probes
+Revises: 95be4b375e68
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_channel_probes'
+down_revision: Union[str, None] = '95be4b375e68'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('channel_probes',
+        sa.Column('channel_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('http_status', sa.Integer(), nullable=True),
+        sa.Column('latency_ms', sa.Integer(), nullable=True),
+        sa.Column('codec', sa.String(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('consecutive_failures', sa.Integer(), nullable=True),
+        sa.Column('deactivated', sa.Boolean(), nullable=True),
+        sa.Column('checked_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('next_check_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['channel_id'], ['channels.id'], ),
+        sa.PrimaryKeyConstraint('channel_id')
+    )
+    op.create_index(op.f('ix_channel_probes_next_check_at'), 'channel_probes', ['next_check_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_channel_probes_next_check_at'), table_name='channel_probes')
+    op.drop_table('channel_probes')
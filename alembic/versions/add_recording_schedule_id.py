@@ -0,0 +1,32 @@
+"""Add schedule_id to recordings
+
+Revision ID: add_recording_schedule_id
+Revises: add_channel_probes
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_recording_schedule_id'
+down_revision: Union[str, None] = 'add_channel_probes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('recordings') as batch_op:
+        batch_op.add_column(sa.Column('schedule_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_recordings_schedule_id', 'recording_schedules', ['schedule_id'], ['id'], ondelete='SET NULL'
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('recordings') as batch_op:
+        batch_op.drop_constraint('fk_recordings_schedule_id', type_='foreignkey')
+        batch_op.drop_column('schedule_id')
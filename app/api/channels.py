@@ -1,21 +1,31 @@
-from typing import List, Optional
+from typing import Iterator, List, Optional
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, UploadFile, File, Body
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, UploadFile, File, Body, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app.models.channel import Channel, ChannelGroup
 from app.models.playlist import Playlist
 from app.auth.dependencies import get_current_user, require_admin
 from app.models.user import User
 from app.utils.m3u_parser import M3UParser
+from app.utils.render_cache import render_cache, artefact_response
+from app.config import get_settings
 from pydantic import BaseModel
 import httpx
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
+settings = get_settings()
+
 router = APIRouter()
 
+# Cached lineup artefacts when links follow the request's Host (no PUBLIC_BASE_URL)
+LINEUP_MAX_BASE_URLS = 8
+_lineup_base_urls = set()
+
 class ChannelResponse(BaseModel):
     id: int
     channel_id: str
@@ -86,6 +96,73 @@ async def get_channels(
         for ch in channels
     ]
 
+@router.get("/lineup.m3u")
+async def export_lineup_m3u(request: Request):
+    """Export all active channels as an M3U lineup pointing at the stream proxy.
+    
+    Served from the render cache so polling media servers get a 304 when
+    nothing changed. Stream URLs go through our proxy, so provider URLs are
+    never exposed and streaming auth settings still apply.
+    """
+    base_url = settings.public_base_url.rstrip('/') or str(request.base_url).rstrip('/')
+    if base_url not in _lineup_base_urls:
+        if len(_lineup_base_urls) >= LINEUP_MAX_BASE_URLS:
+            # The Host header is client-controlled: don't cache a lineup for every value
+            return StreamingResponse(generate_lineup_m3u(base_url), media_type="application/x-mpegurl")
+        _lineup_base_urls.add(base_url)
+    # One artefact per public base URL since stream URLs are absolute
+    name = f"lineup-{hashlib.sha1(base_url.encode()).hexdigest()[:8]}.m3u"
+    artefact = await render_cache.get(
+        name,
+        lambda: generate_lineup_m3u(base_url),
+        ("channels", "channel_groups")
+    )
+    return artefact_response(request, artefact, "application/x-mpegurl", "lineup.m3u")
+
+def _m3u_attr(value) -> str:
+    """A value safe inside a quoted EXTINF attribute"""
+    return str(value).replace('"', "'").replace(',', ' ').replace('\r', ' ').replace('\n', ' ')
+
+def _m3u_url(value: str) -> str:
+    """A URL safe inside a quoted EXTINF attribute (percent-encoded, so it still works)"""
+    return value.strip().replace('"', '%22').replace(',', '%2C')
+
+def generate_lineup_m3u(base_url: str) -> Iterator[bytes]:
+    """Yield an M3U lineup of all active channels in encoded chunks"""
+    db = SessionLocal()
+    try:
+        yield f'#EXTM3U url-tvg="{base_url}/api/epg/epg.xml"\n'.encode('utf-8')
+        
+        rows = db.query(
+            Channel.id, Channel.channel_id, Channel.epg_channel_id, Channel.name,
+            Channel.number, Channel.logo_url, ChannelGroup.name.label('group_name')
+        ).outerjoin(ChannelGroup, Channel.group_id == ChannelGroup.id).filter(
+            Channel.is_active == True
+        ).order_by(Channel.number, Channel.name)
+        
+        lines = []
+        for row in rows.yield_per(1000):
+            extinf = f'#EXTINF:-1 tvg-id="{_m3u_attr(row.epg_channel_id or f"channel-{row.id}")}"'
+            extinf += f' tvg-name="{_m3u_attr(row.name)}"'
+            if row.number:
+                extinf += f' tvg-chno="{_m3u_attr(row.number)}"'
+            if row.logo_url:
+                extinf += f' tvg-logo="{_m3u_url(row.logo_url)}"'
+            if row.group_name:
+                extinf += f' group-title="{_m3u_attr(row.group_name)}"'
+            title = row.name.replace('\r', ' ').replace('\n', ' ')
+            lines.append(f'{extinf},{title}')
+            lines.append(f'{base_url}/api/stream-proxy/channels/{row.id}/stream')
+            
+            if len(lines) >= 2000:
+                yield ('\n'.join(lines) + '\n').encode('utf-8')
+                lines = []
+        
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+    finally:
+        db.close()
+
 # Removed duplicate /groups endpoint - using the one at line 1091 instead
 
 @router.get("/playlists")
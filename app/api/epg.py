@@ -1,16 +1,20 @@
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFile, File, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app.models.epg import EPGProgram
 from app.models.channel import Channel
 from app.models.epg_source import EPGSource
 from app.auth.dependencies import get_current_user, require_admin
 from app.utils.xmltv_parser import XMLTVParser
+from app.utils.render_cache import render_cache, artefact_response
+from app.utils.series_matcher import series_matcher
 from pydantic import BaseModel
 import pytz
+import zlib
 
 router = APIRouter()
 
@@ -179,6 +183,16 @@ async def import_epg(
     background_tasks.add_task(import_epg_data, epg_data.url, db)
     return {"message": "EPG import started"}
 
+def schedule_new_episodes(db: Session, program_ids: List[int]):
+    """Match just-imported programmes against the series rules right away"""
+    if not program_ids:
+        return
+    try:
+        series_matcher.hand_off(series_matcher.match_programs(db, program_ids))
+    except Exception as e:
+        db.rollback()
+        print(f"Error matching imported programs to series rules: {e}")
+
 async def import_epg_data(url: str, db: Session):
     parser = XMLTVParser()
     try:
@@ -191,6 +205,7 @@ async def import_epg_data(url: str, db: Session):
         # Match channels and import programs
         channels = db.query(Channel).all()
         channel_map = {ch.epg_channel_id: ch.id for ch in channels if ch.epg_channel_id}
+        new_programs = []
         
         for program_data in epg_data['programs']:
             epg_channel_id = program_data['channel_id']
@@ -222,105 +237,175 @@ async def import_epg_data(url: str, db: Session):
                         is_repeat=program_data['is_repeat']
                     )
                     db.add(program)
+                    new_programs.append(program)
         
+        db.flush()
+        new_program_ids = [p.id for p in new_programs]
         db.commit()
+        schedule_new_episodes(db, new_program_ids)
         
     except Exception as e:
         print(f"Error importing EPG: {e}")
 
+# Number of programme rows fetched per round-trip while streaming the export
+EXPORT_BATCH_SIZE = 1000
+
+# Guide window served from the pre-rendered artefact; other windows are streamed live
+DEFAULT_EXPORT_DAYS = 7
+
 @router.get("/epg.xml")
 async def export_all_epg(
-    days: int = 7,
-    db: Session = Depends(get_db)
+    request: Request,
+    days: int = 7
 ):
-    """Export EPG data for all channels in XMLTV format"""
-    from fastapi.responses import Response
+    """Export EPG data for all channels in XMLTV format.
+    
+    The default window is served from the render cache with ETag/304
+    support. Other windows are streamed straight from a server-side cursor
+    so memory stays flat regardless of guide size; clients sending
+    ``Accept-Encoding: gzip`` get the body compressed on the fly.
+    """
+    if days == DEFAULT_EXPORT_DAYS:
+        artefact = await render_cache.get(
+            "epg.xml",
+            lambda: generate_xmltv(DEFAULT_EXPORT_DAYS),
+            ("channels", "epg_programs")
+        )
+        return artefact_response(request, artefact, "application/xml", "epg.xml")
     
-    # Get all active channels with EPG data
-    channels = db.query(Channel).filter(Channel.is_active == True).all()
-    
-    # Start building XMLTV
-    xml_lines = ['<?xml version="1.0" encoding="UTF-8"?>']
-    xml_lines.append('<!DOCTYPE tv SYSTEM "xmltv.dtd">')
-    xml_lines.append('<tv source-info-name="IPTV PVR" generator-info-name="IPTV PVR">')
-    
-    # Add channels
-    for channel in channels:
-        channel_id = channel.epg_channel_id or f"channel-{channel.id}"
-        xml_lines.append(f'  <channel id="{channel_id}">')
-        xml_lines.append(f'    <display-name>{channel.name}</display-name>')
-        if channel.number:
-            xml_lines.append(f'    <display-name>{channel.number}</display-name>')
-        if channel.logo_url:
-            xml_lines.append(f'    <icon src="{channel.logo_url}"/>')
-        xml_lines.append('  </channel>')
-    
-    # Get programs for next N days
-    start_time = datetime.now(pytz.UTC)
-    end_time = start_time + timedelta(days=days)
+    headers = {
+        "Content-Disposition": "inline; filename=epg.xml",
+        "Vary": "Accept-Encoding"
+    }
     
-    programs = db.query(EPGProgram).join(Channel).filter(
-        and_(
-            Channel.is_active == True,
-            EPGProgram.start_time >= start_time,
-            EPGProgram.end_time <= end_time
-        )
-    ).order_by(EPGProgram.start_time).all()
+    body = generate_xmltv(days)
+    if "gzip" in request.headers.get("accept-encoding", "").lower():
+        body = gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
     
-    # Add programs
-    for program in programs:
-        channel_id = program.channel.epg_channel_id or f"channel-{program.channel.id}"
-        start_str = program.start_time.strftime('%Y%m%d%H%M%S %z')
-        end_str = program.end_time.strftime('%Y%m%d%H%M%S %z')
-        
-        xml_lines.append(f'  <programme start="{start_str}" stop="{end_str}" channel="{channel_id}">')
-        xml_lines.append(f'    <title>{escape_xml(program.title)}</title>')
-        
-        if program.description:
-            xml_lines.append(f'    <desc>{escape_xml(program.description)}</desc>')
-        
-        if program.category:
-            xml_lines.append(f'    <category>{escape_xml(program.category)}</category>')
+    return StreamingResponse(body, media_type="application/xml", headers=headers)
+
+def generate_xmltv(days: int = 7) -> Iterator[bytes]:
+    """Yield an XMLTV document for all active channels in encoded chunks.
+    
+    This is a plain (sync) generator on purpose: Starlette iterates it in a
+    worker thread, so the blocking DB cursor never stalls the event loop.
+    It opens its own session because request-scoped dependencies are torn
+    down before a streaming body is sent.
+    """
+    db = SessionLocal()
+    try:
+        yield (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<!DOCTYPE tv SYSTEM "xmltv.dtd">\n'
+            '<tv source-info-name="IPTV PVR" generator-info-name="IPTV PVR">\n'
+        ).encode('utf-8')
         
-        if program.icon_url:
-            xml_lines.append(f'    <icon src="{program.icon_url}"/>')
+        # Channel id -> XMLTV id, built once so programmes never touch the relationship
+        xmltv_ids = {}
+        lines = []
+        channel_rows = db.query(
+            Channel.id, Channel.epg_channel_id, Channel.name, Channel.number, Channel.logo_url
+        ).filter(Channel.is_active == True).order_by(Channel.id)
         
-        # Episode info
-        if program.series_id or program.season_num or program.episode_num:
-            xmltv_ns = []
-            if program.season_num:
-                xmltv_ns.append(str(int(program.season_num) - 1))
-            else:
-                xmltv_ns.append('')
-            xmltv_ns.append('.')
-            if program.episode_num:
-                xmltv_ns.append(str(int(program.episode_num) - 1))
-            else:
-                xmltv_ns.append('')
-            xml_lines.append(f'    <episode-num system="xmltv_ns">{"".join(xmltv_ns)}</episode-num>')
+        for row in channel_rows.yield_per(EXPORT_BATCH_SIZE):
+            xmltv_id = row.epg_channel_id or f"channel-{row.id}"
+            xmltv_ids[row.id] = xmltv_id
+            lines.append(f'  <channel id="{escape_xml(xmltv_id)}">')
+            lines.append(f'    <display-name>{escape_xml(row.name)}</display-name>')
+            if row.number:
+                lines.append(f'    <display-name>{escape_xml(row.number)}</display-name>')
+            if row.logo_url:
+                lines.append(f'    <icon src="{escape_xml(row.logo_url)}"/>')
+            lines.append('  </channel>')
+            
+            if len(lines) >= EXPORT_BATCH_SIZE:
+                yield ('\n'.join(lines) + '\n').encode('utf-8')
+                lines = []
         
-        if program.is_new:
-            xml_lines.append('    <new/>')
+        # Get programs for next N days
+        start_time = datetime.now(pytz.UTC)
+        end_time = start_time + timedelta(days=days)
         
-        if program.is_repeat:
-            xml_lines.append('    <previously-shown/>')
+        # Plain column rows: nothing lands in the identity map, so memory stays flat
+        programs = db.query(
+            EPGProgram.channel_id, EPGProgram.title, EPGProgram.description,
+            EPGProgram.start_time, EPGProgram.end_time, EPGProgram.category,
+            EPGProgram.icon_url, EPGProgram.series_id, EPGProgram.season_num,
+            EPGProgram.episode_num, EPGProgram.is_new, EPGProgram.is_repeat,
+            EPGProgram.is_live
+        ).join(Channel).filter(
+            and_(
+                Channel.is_active == True,
+                EPGProgram.start_time >= start_time,
+                EPGProgram.end_time <= end_time
+            )
+        ).order_by(EPGProgram.start_time).execution_options(stream_results=True)
         
-        if program.is_live:
-            xml_lines.append('    <live/>')
+        for count, program in enumerate(programs.yield_per(EXPORT_BATCH_SIZE), 1):
+            xmltv_id = xmltv_ids.get(program.channel_id) or f"channel-{program.channel_id}"
+            lines.extend(_programme_lines(program, xmltv_id))
+            
+            if count % EXPORT_BATCH_SIZE == 0:
+                yield ('\n'.join(lines) + '\n').encode('utf-8')
+                lines = []
         
-        xml_lines.append('  </programme>')
-    
-    xml_lines.append('</tv>')
-    
-    xml_content = '\n'.join(xml_lines)
-    
-    return Response(
-        content=xml_content,
-        media_type="application/xml",
-        headers={
-            "Content-Disposition": f"inline; filename=epg.xml"
-        }
-    )
+        lines.append('</tv>')
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+    finally:
+        db.close()
+
+def _programme_lines(program, xmltv_id: str) -> List[str]:
+    """Render a single <programme> element as a list of lines"""
+    start_str = program.start_time.strftime('%Y%m%d%H%M%S %z')
+    end_str = program.end_time.strftime('%Y%m%d%H%M%S %z')
+    
+    lines = [f'  <programme start="{start_str}" stop="{end_str}" channel="{escape_xml(xmltv_id)}">']
+    lines.append(f'    <title>{escape_xml(program.title)}</title>')
+    
+    if program.description:
+        lines.append(f'    <desc>{escape_xml(program.description)}</desc>')
+    
+    if program.category:
+        lines.append(f'    <category>{escape_xml(program.category)}</category>')
+    
+    if program.icon_url:
+        lines.append(f'    <icon src="{escape_xml(program.icon_url)}"/>')
+    
+    # Episode info
+    if program.series_id or program.season_num or program.episode_num:
+        xmltv_ns = []
+        if program.season_num:
+            xmltv_ns.append(str(int(program.season_num) - 1))
+        else:
+            xmltv_ns.append('')
+        xmltv_ns.append('.')
+        if program.episode_num:
+            xmltv_ns.append(str(int(program.episode_num) - 1))
+        else:
+            xmltv_ns.append('')
+        lines.append(f'    <episode-num system="xmltv_ns">{"".join(xmltv_ns)}</episode-num>')
+    
+    if program.is_new:
+        lines.append('    <new/>')
+    
+    if program.is_repeat:
+        lines.append('    <previously-shown/>')
+    
+    if program.is_live:
+        lines.append('    <live/>')
+    
+    lines.append('  </programme>')
+    return lines
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Gzip-compress a byte stream on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
 
 def escape_xml(text):
     """Escape special XML characters"""
@@ -434,6 +519,7 @@ async def import_epg_from_file(file_path: str, db: Session):
         # Match channels and import programs
         channels = db.query(Channel).all()
         channel_map = {ch.epg_channel_id: ch.id for ch in channels if ch.epg_channel_id}
+        new_programs = []
         
         for program_data in epg_data['programs']:
             epg_channel_id = program_data['channel_id']
@@ -465,8 +551,12 @@ async def import_epg_from_file(file_path: str, db: Session):
                         is_repeat=program_data['is_repeat']
                     )
                     db.add(program)
+                    new_programs.append(program)
         
+        db.flush()
+        new_program_ids = [p.id for p in new_programs]
         db.commit()
+        schedule_new_episodes(db, new_program_ids)
         
     except Exception as e:
         print(f"Error importing EPG from file: {e}")
@@ -598,6 +688,7 @@ async def import_epg_data_with_progress(url: str, db: Session, import_id: str, s
         # Match channels and import programs
         channels = db.query(Channel).all()
         channel_map = {ch.epg_channel_id: ch.id for ch in channels if ch.epg_channel_id}
+        new_programs = []
         
         programs = epg_data.get('programs', [])
         total_programs = len(programs)
@@ -633,6 +724,7 @@ async def import_epg_data_with_progress(url: str, db: Session, import_id: str, s
                         is_repeat=program_data['is_repeat']
                     )
                     db.add(program)
+                    new_programs.append(program)
                     imported_count += 1
             
             # Send progress update every 100 programs
@@ -644,7 +736,10 @@ async def import_epg_data_with_progress(url: str, db: Session, import_id: str, s
                     "message": f"Importing programs: {i}/{total_programs}"
                 })
         
+        db.flush()
+        new_program_ids = [p.id for p in new_programs]
         db.commit()
+        schedule_new_episodes(db, new_program_ids)
         
         # Update source last_updated timestamp
         source = db.query(EPGSource).filter(EPGSource.id == source_id).first()
@@ -13,6 +13,7 @@ from app.models import User, UserRole
 from app.api.auth import get_current_user
 from app.utils.multicore_channel_ops import MultiCoreChannelOperations
 from app.api.websocket import manager as ws_manager
+from app.utils.change_tracker import change_tracker
 
 logger = logging.getLogger(__name__)
 
@@ -158,6 +159,9 @@ async def run_bulk_update(
             progress_callback
         )
         
+        # Worker processes write through their own engines, invisible to session events
+        change_tracker.mark_changed("channels")
+        
         # Send completion
         await ws_manager.broadcast_to_user({
             "type": "bulk_update_complete",
@@ -204,6 +208,8 @@ async def run_auto_map_epg(
             progress_callback
         )
         
+        change_tracker.mark_changed("channels")
+        
         # Send completion
         await ws_manager.broadcast_to_user({
             "type": "epg_mapping_complete",
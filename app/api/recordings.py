@@ -1,15 +1,24 @@
+import os
 from typing import List, Optional
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from urllib.parse import urlencode
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
 from app.database import get_db
 from app.models.recording import Recording, RecordingSchedule, RecordingStatus, RecordingType
 from app.models.epg import EPGProgram
 from app.models.channel import Channel
-from app.models.user import User
+from app.models.user import User, UserRole
 from app.auth.dependencies import get_current_user
-from app.utils.recorder import Recorder
+from app.api.stream_proxy import get_current_user_flexible
+from app.utils.recording_queue import recording_queue
+from app.utils.recording_scheduler import recording_scheduler
+from app.utils.series_matcher import series_matcher
+from app.utils.postprocess import postprocessor, remove_sidecars
+from app.utils.recording_vod import RecordingFileResponse, vod_playlist, follow_recording
+from app.utils.recorder import recorder
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -93,10 +102,17 @@ async def get_recordings(
         for r in recordings
     ]
 
+@router.get("/queue")
+async def get_recording_queue(
+    current_user: User = Depends(get_current_user)
+):
+    """Running and waiting recording jobs; admins see everyone's"""
+    user_id = None if current_user.role == UserRole.ADMIN else current_user.id
+    return recording_queue.get_stats(user_id=user_id)
+
 @router.post("/record-now")
 async def record_now(
     channel_id: int,
-    background_tasks: BackgroundTasks,
     duration_minutes: int = 60,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -135,9 +151,8 @@ async def record_now(
     db.commit()
     db.refresh(recording)
     
-    # Start recording in background
-    recorder = Recorder()
-    background_tasks.add_task(recorder.record, recording.id)
+    # Start recording through the queue (bounded by max_concurrent_recordings)
+    recording_queue.submit(recording)
     
     return {"message": "Recording started", "recording_id": recording.id}
 
@@ -173,6 +188,9 @@ async def schedule_recording(
     db.commit()
     db.refresh(recording)
     
+    # Start/stop events go straight onto the scheduler, however soon the start is
+    recording_scheduler.schedule(recording.id, recording.start_time, recording.end_time)
+    
     return {"message": "Recording scheduled", "recording_id": recording.id}
 
 @router.post("/schedule/series")
@@ -209,6 +227,9 @@ async def schedule_series_recording(
     db.commit()
     db.refresh(schedule)
     
+    # Schedule the episodes already in the guide now rather than at the next full scan
+    await series_matcher.scan(schedule_ids=[schedule.id])
+    
     return {"message": "Series recording scheduled", "schedule_id": schedule.id}
 
 @router.get("/schedules", response_model=List[RecordingScheduleResponse])
@@ -264,7 +285,9 @@ async def delete_recording(
                 os.remove(recording.file_path)
             except:
                 pass
+            remove_sidecars(recording.file_path)
         
+        recording_scheduler.cancel(recording.id)
         db.delete(recording)
         db.commit()
     
@@ -291,12 +314,89 @@ async def delete_recording_schedule(
     
     return {"message": "Schedule deleted"}
 
-@router.get("/{recording_id}/download")
+def _playable_recording(db: Session, recording_id: int, user: User) -> Recording:
+    recording = db.query(Recording).filter(
+        and_(
+            Recording.id == recording_id,
+            Recording.user_id == user.id
+        )
+    ).first()
+    
+    if not recording:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    
+    if not recording.file_path or recording.status != RecordingStatus.COMPLETED:
+        raise HTTPException(status_code=400, detail="Recording file not available")
+    
+    return recording
+
+async def get_player_user(current_user: Optional[User] = Depends(get_current_user_flexible)) -> User:
+    """Players can't set headers on media requests, so ``?token=`` is accepted too"""
+    if current_user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return current_user
+
+@router.api_route("/{recording_id}/download", methods=["GET", "HEAD"])
 async def download_recording(
     recording_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    recording = _playable_recording(db, recording_id, current_user)
+    return RecordingFileResponse(
+        recording.file_path,
+        media_type='video/mp2t',
+        filename=f"{recording.title}.ts"
+    )
+
+@router.api_route("/{recording_id}/media", methods=["GET", "HEAD"])
+async def recording_media(
+    recording_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_player_user)
+):
+    """The recording for in-browser playback (Range requests, used by the VOD playlist)"""
+    recording = _playable_recording(db, recording_id, current_user)
+    return RecordingFileResponse(recording.file_path, media_type='video/mp2t')
+
+@router.get("/{recording_id}/vod.m3u8")
+async def recording_vod_playlist(
+    recording_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_player_user)
+):
+    """HLS VOD playlist of byte ranges cut at keyframes; seeking needs no transcode"""
+    recording = _playable_recording(db, recording_id, current_user)
+    duration = (recording.end_time - recording.start_time).total_seconds()
+    index = await postprocessor.ensure_index(recording.file_path, duration)
+    if not index or not index["keyframes"]:
+        raise HTTPException(status_code=409, detail="No keyframes found in recording")
+    
+    # Relative segment URIs lose the query string, so carry the token explicitly
+    token = request.query_params.get("token")
+    media_uri = f"media?{urlencode({'token': token})}" if token else "media"
+    
+    return Response(
+        content=vod_playlist(index, media_uri),
+        media_type="application/vnd.apple.mpegurl",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@router.get("/{recording_id}/watch")
+async def watch_recording(
+    recording_id: int,
+    offset: int = 0,
+    start: Optional[float] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_player_user)
+):
+    """Watch a recording while it is still being recorded.
+    
+    Streams from ``offset`` bytes (or ``start`` seconds, estimated from the
+    bitrate so far) and follows the file as it grows until the recording
+    ends. Completed recordings are served as a plain seekable file.
+    """
     recording = db.query(Recording).filter(
         and_(
             Recording.id == recording_id,
@@ -307,12 +407,24 @@ async def download_recording(
     if not recording:
         raise HTTPException(status_code=404, detail="Recording not found")
     
-    if not recording.file_path or recording.status != RecordingStatus.COMPLETED:
-        raise HTTPException(status_code=400, detail="Recording file not available")
+    if recording.status == RecordingStatus.COMPLETED and recording.file_path:
+        return RecordingFileResponse(recording.file_path, media_type='video/mp2t')
     
-    from fastapi.responses import FileResponse
-    return FileResponse(
-        recording.file_path,
+    if recording.status != RecordingStatus.RECORDING:
+        raise HTTPException(status_code=400, detail="Recording is not in progress")
+    
+    # The capture file is the one being written, even for members whose own copy is made at the end
+    path = recorder.live_path(recording_id) or recording.file_path
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=409, detail="Recording has not started yet")
+    
+    if start is not None:
+        elapsed = (datetime.utcnow() - recording.start_time).total_seconds()
+        size = os.path.getsize(path)
+        offset = int(size * min(max(start, 0) / elapsed, 1)) if elapsed > 0 else 0
+    
+    return StreamingResponse(
+        follow_recording(path, max(offset, 0), lambda: recorder.live_path(recording_id) is not None),
         media_type='video/mp2t',
-        filename=f"{recording.title}.ts"
-    )
\ No newline at end of file
+        headers={"Cache-Control": "no-cache"}
+    )
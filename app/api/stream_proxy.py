@@ -1,36 +1,47 @@
-import asyncio
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Response, Query
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app.models.channel import Channel
-from app.auth.dependencies import get_current_user
+from app.auth.dependencies import get_optional_user, require_admin
 from app.models.user import User
-import httpx
+import itertools
 import subprocess
-import os
-import tempfile
-import shutil
-from typing import AsyncIterator, Optional
+from urllib.parse import urlencode
+from typing import AsyncIterator, Callable, List, Optional
 from jose import jwt, JWTError, ExpiredSignatureError
 from app.config import get_settings
 from datetime import datetime
 from app.auth.security import decode_access_token
+from app.auth.token_cache import token_cache
+from app.utils.stream_hub import stream_hub
+from app.utils.channel_index import channel_index
+from app.utils.stream_sources import stream_sources
+from app.utils.stream_sessions import stream_sessions, SessionStreamingResponse
+from app.utils.stream_redirects import stream_redirects
+from app.utils.tuner_slots import tuner_slots, SlotUnavailable
+from app.utils.hls_sessions import hls_sessions, rewrite_playlist, HLSSessionError
+from app.utils.hls_proxy import hls_proxy, is_hls_url, HLSProxyError
+from app.utils.transcoder import transcoder, TranscodeCapacityError
+from app.utils.transcode_profiles import PROFILES as TRANSCODE_PROFILES, DEFAULT_PROFILE, input_args
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 settings = get_settings()
 
+# Tuner slot holder ids, one per upstream broadcast
+_upstream_ids = itertools.count(1)
+
 async def get_current_user_flexible(
     token: Optional[str] = Query(None),
-    current_user: Optional[User] = Depends(get_current_user),
+    current_user: Optional[User] = Depends(get_optional_user),
     db: Session = Depends(get_db)
 ) -> Optional[User]:
     """
     Flexible authentication that accepts token from either:
-    1. Authorization header (via get_current_user)
+    1. Authorization header (via get_optional_user)
     2. Query parameter 'token'
     
     Returns None if authentication fails (for streaming endpoints to handle gracefully)
@@ -41,7 +52,13 @@ async def get_current_user_flexible(
     
     # Then try the query parameter token
     if token:
+        # Recently verified token: no decode, no users query
+        cached_user = token_cache.get(token, db)
+        if cached_user is not None:
+            return cached_user if cached_user.is_active else None
+        
         try:
+            cache_version = token_cache.version()
             # Use the existing decode_access_token function which handles expiration
             payload = decode_access_token(token)
             if payload is None:
@@ -73,6 +90,8 @@ async def get_current_user_flexible(
                 logger.warning(f"User not found: {username}")
                 return None
             
+            token_cache.put(token, user, exp, cache_version)
+            
             if not user.is_active:
                 logger.warning(f"User is inactive: {username}")
                 return None
@@ -91,106 +110,168 @@ async def get_current_user_flexible(
     # No authentication provided
     return None
 
-async def stream_generator(stream_url: str) -> AsyncIterator[bytes]:
+async def stream_generator(stream_urls: List[str], pool: Optional[int]) -> AsyncIterator[bytes]:
     """
-    Simple proxy streaming without transcoding.
-    For streams that are already in a compatible format.
+    Read an upstream stream without transcoding.
+    Tries the channel's alternative URLs in health order and fails over
+    between them; ``pool`` is the playlist whose tuner slot is held.
+    Viewers don't consume this directly; it feeds the shared channel
+    broadcast in ``stream_hub``.
     """
-    async with httpx.AsyncClient(timeout=None, follow_redirects=True) as client:
-        try:
-            async with client.stream('GET', stream_url) as response:
-                response.raise_for_status()
-                async for chunk in response.aiter_bytes(chunk_size=8192):
-                    yield chunk
-        except Exception as e:
-            logger.error(f"Stream proxy error: {e}")
-            raise
+    try:
+        async for chunk in stream_sources.open_stream(stream_urls, pool):
+            yield chunk
+    except Exception as e:
+        logger.error(f"Stream proxy error: {e}")
+        raise
+
+async def prewarm_channels():
+    """Open upstreams for the pinned warm channels (STREAM_WARM_CHANNELS)"""
+    if not stream_hub.warm_channels:
+        return
+    
+    db = SessionLocal()
+    try:
+        channels = db.query(Channel).filter(
+            Channel.id.in_(stream_hub.warm_channels),
+            Channel.is_active == True
+        ).all()
+        for channel in channels:
+            stream_urls = stream_sources.urls_for(db, channel)
+            stream_hub.prewarm(
+                channel.id,
+                lambda channel_id=channel.id, pool=channel.playlist_id, urls=stream_urls:
+                    _warm_stream(channel_id, pool, urls)
+            )
+        logger.info(f"Pre-warmed {len(channels)} pinned channels")
+    finally:
+        db.close()
+
+async def _warm_stream(channel_id: int, pool: Optional[int], stream_urls: List[str]) -> AsyncIterator[bytes]:
+    """
+    Upstream for a pinned warm channel. The slot is taken inside the
+    generator so the hub's periodic restarts respect provider limits too;
+    with no free slot the attempt fails and is retried later.
+    """
+    await tuner_slots.acquire(
+        channel_id,
+        pool,
+        preempt=lambda: stream_hub.stop(channel_id),
+        idle=lambda: stream_hub.is_idle(channel_id),
+        timeout=0
+    )
+    try:
+        async for chunk in stream_generator(stream_urls, pool):
+            yield chunk
+    finally:
+        tuner_slots.release(channel_id)
 
-async def transcode_stream(stream_url: str, output_format: str = "hls") -> AsyncIterator[bytes]:
+async def transcode_stream(channel_id: int, stream_url: str, profile: str = DEFAULT_PROFILE) -> AsyncIterator[bytes]:
     """
-    Transcode stream using FFmpeg to a browser-compatible format.
+    Transcode stream using FFmpeg to browser-compatible MPEG-TS.
+    Runs under the transcode supervisor and, like direct streams, feeds a
+    shared broadcast so identical (channel, profile) requests reuse one ffmpeg.
+    HLS output is handled by the shared segmenters in ``hls_sessions``.
     """
-    # Create temporary directory for HLS segments
-    temp_dir = tempfile.mkdtemp(prefix="iptv_stream_")
+    cmd = ['ffmpeg'] + input_args(stream_url) + TRANSCODE_PROFILES[profile] + ['-f', 'mpegts', '-']
+    try:
+        job = await transcoder.spawn(("mpegts", channel_id, profile), "mpegts", cmd)
+    except FileNotFoundError:
+        raise Exception("FFmpeg is not installed or not in PATH")
+    
+    async for chunk in transcoder.read_output(job):
+        yield chunk
+
+async def _subscribe(channel: Channel, key, open_upstream: Callable[[], AsyncIterator[bytes]]) -> AsyncIterator[bytes]:
+    """
+    Join the broadcast for ``key``, or start one that holds its own provider
+    tuner slot. Every upstream gets a holder of its own: a broadcast that is
+    not a transport stream can't be joined, so its next viewer opens another
+    upstream next to it, and each must free only its own slot.
+    """
+    if stream_hub.is_active(key):
+        return stream_hub.subscribe(key, open_upstream)
+    
+    holder = (key, next(_upstream_ids))
+    started = []  # The broadcast this slot belongs to, once it exists
+    
+    async def preempt():
+        if started:
+            await started[0].stop()
     
     try:
-        if output_format == "hls":
-            # HLS output configuration
-            playlist_path = os.path.join(temp_dir, "playlist.m3u8")
-            segment_pattern = os.path.join(temp_dir, "segment_%03d.ts")
-            
-            # FFmpeg command for HLS transcoding
-            cmd = [
-                'ffmpeg',
-                '-i', stream_url,
-                '-c:v', 'copy',  # Try to copy video codec if compatible
-                '-c:a', 'aac',   # Transcode audio to AAC
-                '-b:a', '128k',
-                '-f', 'hls',
-                '-hls_time', '4',
-                '-hls_list_size', '6',
-                '-hls_flags', 'delete_segments+append_list',
-                '-hls_segment_filename', segment_pattern,
-                playlist_path
-            ]
-        else:
-            # Direct MPEG-TS streaming
-            cmd = [
-                'ffmpeg',
-                '-i', stream_url,
-                '-c:v', 'copy',
-                '-c:a', 'aac',
-                '-b:a', '128k',
-                '-f', 'mpegts',
-                '-'
-            ]
-        
-        # Start FFmpeg process
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+        await tuner_slots.acquire(
+            holder,
+            channel.playlist_id,
+            preempt=preempt,
+            idle=lambda: bool(started) and not started[0].viewers
         )
-        
-        if output_format == "hls":
-            # Wait for initial segments to be created
-            for _ in range(50):  # Wait up to 5 seconds
-                if os.path.exists(playlist_path):
-                    await asyncio.sleep(0.5)  # Give it time to create segments
-                    break
-                await asyncio.sleep(0.1)
-            
-            # Stream the playlist and segments
-            while True:
-                if os.path.exists(playlist_path):
-                    with open(playlist_path, 'rb') as f:
-                        yield f.read()
-                await asyncio.sleep(1)
-        else:
-            # Stream direct output
-            while True:
-                chunk = await process.stdout.read(8192)
-                if not chunk:
-                    break
-                yield chunk
-        
-        # Wait for process to complete
-        await process.wait()
-        
-    except Exception as e:
-        logger.error(f"Transcoding error: {e}")
-        raise
-    finally:
-        # Cleanup
-        if process and process.returncode is None:
-            process.terminate()
-            await process.wait()
-        shutil.rmtree(temp_dir, ignore_errors=True)
+    except SlotUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if not tuner_slots.holds(holder):
+        # A recording took the slot back before the upstream opened
+        raise HTTPException(status_code=503, detail="Tuner slot was taken by a recording")
+    
+    # Someone else opened a shareable upstream while this one waited for a slot
+    if stream_hub.is_active(key):
+        tuner_slots.release(holder)
+        return stream_hub.subscribe(key, open_upstream)
+    
+    body = stream_hub.subscribe(key, open_upstream, on_close=lambda broadcast: tuner_slots.release(holder))
+    started.append(stream_hub.broadcasts[key])
+    return body
+
+async def _direct_stream(db: Session, channel: Channel) -> AsyncIterator[bytes]:
+    # Shared upstream: all viewers of this channel read from one connection
+    stream_urls = stream_sources.urls_for(db, channel)
+    pool = channel.playlist_id
+    return await _subscribe(channel, channel.id, lambda: stream_generator(stream_urls, pool))
+
+async def _transcoded_stream(db: Session, channel: Channel, profile: str) -> AsyncIterator[bytes]:
+    if profile not in TRANSCODE_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile: {profile}")
+    
+    key = ("transcode", channel.id, profile)
+    # Joining a running transcode is free; only a new ffmpeg needs a slot
+    if not stream_hub.is_active(key) and not transcoder.has_capacity():
+        raise HTTPException(status_code=503, detail="All transcode slots are in use")
+    
+    channel_id = channel.id
+    stream_url = stream_sources.urls_for(db, channel)[0]
+    return await _subscribe(channel, key, lambda: transcode_stream(channel_id, stream_url, profile))
+
+async def _redirect_response(db: Session, channel: Channel) -> RedirectResponse:
+    """302 straight to the healthiest upstream URL, past its redirect chain"""
+    url = await stream_redirects.resolve(stream_sources.urls_for(db, channel)[0])
+    stream_redirects.redirects += 1
+    return RedirectResponse(url, status_code=302, headers={"Cache-Control": "no-store"})
+
+def _session_response(
+    request: Request,
+    channel: Channel,
+    current_user: Optional[User],
+    mode: str,
+    body: AsyncIterator[bytes],
+    media_type: str
+) -> StreamingResponse:
+    """Track the stream in the session registry and wrap it in a response"""
+    session = stream_sessions.open(request, channel, current_user, mode)
+    return SessionStreamingResponse(
+        stream_sessions.track(session, body),
+        media_type=media_type,
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "Access-Control-Allow-Origin": "*",  # Allow CORS for video playback
+        }
+    )
 
 @router.get("/channels/{channel_id}/stream")
 async def proxy_channel_stream(
     channel_id: int,
+    request: Request,
     transcode: bool = False,
+    profile: str = DEFAULT_PROFILE,
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user_flexible)
 ):
@@ -200,6 +281,7 @@ async def proxy_channel_stream(
     Args:
         channel_id: The channel ID to stream
         transcode: Whether to transcode the stream (default: False)
+        profile: Transcode profile (copy, 720p, 480p)
     """
     # Check if authentication is required based on configuration
     if settings.require_auth_for_streaming and current_user is None:
@@ -222,29 +304,24 @@ async def proxy_channel_stream(
     else:
         logger.info(f"Anonymous streaming channel {channel_id}")
     
+    # Clients that can reach the provider themselves skip the proxy
+    if not transcode and stream_redirects.applies(channel.id, current_user):
+        return await _redirect_response(db, channel)
+    
+    # Provider serves HLS: relay it as HLS through the shared segment cache
+    if not transcode and is_hls_url(channel.stream_url):
+        return await _upstream_hls_response(request, channel, channel.stream_url, "upstream/")
+    
     try:
         if transcode:
             # Use FFmpeg transcoding
-            return StreamingResponse(
-                transcode_stream(channel.stream_url, "mpegts"),
-                media_type="video/mp2t",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "Access-Control-Allow-Origin": "*",  # Allow CORS for video playback
-                }
-            )
+            body = await _transcoded_stream(db, channel, profile)
+            return _session_response(request, channel, current_user, f"transcode:{profile}", body, "video/mp2t")
         else:
-            # Simple proxy without transcoding
-            return StreamingResponse(
-                stream_generator(channel.stream_url),
-                media_type="application/octet-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "Access-Control-Allow-Origin": "*",  # Allow CORS for video playback
-                }
-            )
+            body = await _direct_stream(db, channel)
+            return _session_response(request, channel, current_user, "direct", body, "application/octet-stream")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Stream error for channel {channel_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Stream error: {str(e)}")
@@ -252,13 +329,61 @@ async def proxy_channel_stream(
 @router.get("/channels/{channel_id}/stream.m3u8")
 async def proxy_channel_hls(
     channel_id: int,
+    request: Request,
+    profile: str = DEFAULT_PROFILE,
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user_flexible)
 ):
     """
     Proxy channel stream as HLS.
-    This endpoint generates an HLS playlist that points to transcoded segments.
+    Returns the live playlist of the shared segmenter session for this
+    channel and profile; segment URIs point at the session's segment route.
     """
+    channel = _get_hls_channel(channel_id, db, current_user)
+    return await _hls_playlist_response(request, channel, profile, prefix=f"hls/{profile}/")
+
+@router.get("/channels/{channel_id}/hls/{profile}/index.m3u8")
+async def get_hls_playlist(
+    channel_id: int,
+    profile: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user_flexible)
+):
+    """Live playlist for a channel's HLS session"""
+    channel = _get_hls_channel(channel_id, db, current_user)
+    return await _hls_playlist_response(request, channel, profile)
+
+@router.get("/channels/{channel_id}/hls/{profile}/{segment}")
+async def get_hls_segment(
+    channel_id: int,
+    profile: str,
+    segment: str,
+    current_user: Optional[User] = Depends(get_current_user_flexible)
+):
+    """Serve one segment of a running HLS session"""
+    if settings.require_auth_for_streaming and current_user is None:
+        raise HTTPException(status_code=401, detail="Authentication required for streaming")
+    
+    session = hls_sessions.find_session(channel_id, profile)
+    if not session:
+        raise HTTPException(status_code=404, detail="No active HLS session for this channel")
+    
+    path = hls_sessions.segment_path(session, segment)
+    if not path:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    
+    return FileResponse(
+        path,
+        media_type="video/mp2t",
+        headers={
+            # Segments never change once written
+            "Cache-Control": "public, max-age=60",
+            "Access-Control-Allow-Origin": "*",
+        }
+    )
+
+def _get_hls_channel(channel_id: int, db: Session, current_user: Optional[User]) -> Channel:
     # Check if authentication is required based on configuration
     if settings.require_auth_for_streaming and current_user is None:
         logger.warning(f"Unauthenticated access denied to channel {channel_id} HLS stream")
@@ -273,19 +398,37 @@ async def proxy_channel_hls(
     if not channel.is_active:
         raise HTTPException(status_code=403, detail="Channel is not active")
     
-    # Generate a simple HLS playlist that points to the transcoded stream
-    # In a production system, this would manage segments properly
-    playlist = f"""#EXTM3U
-#EXT-X-VERSION:3
-#EXT-X-TARGETDURATION:10
-#EXT-X-MEDIA-SEQUENCE:0
-#EXTINF:10.0,
-/api/stream-proxy/channels/{channel_id}/stream?transcode=true
-#EXT-X-ENDLIST
-"""
+    return channel
+
+async def _hls_playlist_response(request: Request, channel: Channel, profile: str, prefix: str = "") -> Response:
+    if profile not in TRANSCODE_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile: {profile}")
+    
+    key = ("hls", channel.id, profile)
+    try:
+        await tuner_slots.acquire(
+            key,
+            channel.playlist_id,
+            preempt=lambda: hls_sessions.stop(channel.id, profile),
+            idle=lambda: hls_sessions.is_idle(channel.id, profile)
+        )
+        session = await hls_sessions.get_session(
+            channel.id, channel.stream_url, profile,
+            on_close=lambda: tuner_slots.release(key)
+        )
+        playlist = hls_sessions.read_playlist(session)
+    except (SlotUnavailable, TranscodeCapacityError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except HLSSessionError as e:
+        logger.error(f"HLS session error for channel {channel.id}: {e}")
+        raise HTTPException(status_code=502, detail=f"Stream error: {str(e)}")
+    
+    # Relative segment URIs lose the query string, so carry the token explicitly
+    token = request.query_params.get("token")
+    query = urlencode({"token": token}) if token else ""
     
     return Response(
-        content=playlist,
+        content=rewrite_playlist(playlist, prefix, query),
         media_type="application/vnd.apple.mpegurl",
         headers={
             "Cache-Control": "no-cache",
@@ -293,10 +436,79 @@ async def proxy_channel_hls(
         }
     )
 
+@router.get("/channels/{channel_id}/upstream/{ref}")
+async def get_upstream_hls(
+    channel_id: int,
+    ref: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user_flexible)
+):
+    """Serve a variant playlist or segment of a relayed upstream HLS channel"""
+    if settings.require_auth_for_streaming and current_user is None:
+        raise HTTPException(status_code=401, detail="Authentication required for streaming")
+    
+    entry = hls_proxy.lookup(channel_id, ref)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Unknown upstream reference")
+    
+    if entry.kind == "playlist":
+        channel = _get_hls_channel(channel_id, db, current_user)
+        return await _upstream_hls_response(request, channel, entry.url, "")
+    
+    try:
+        data, media_type = await hls_proxy.segment(entry, ref)
+    except HLSProxyError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    
+    return Response(
+        content=data,
+        media_type=media_type,
+        headers={
+            "Cache-Control": "public, max-age=60",
+            "Access-Control-Allow-Origin": "*",
+        }
+    )
+
+async def _upstream_hls_response(request: Request, channel: Channel, url: str, prefix: str) -> Response:
+    # One tuner slot per relayed channel, held until nobody polls it
+    if not hls_proxy.is_open(channel.id):
+        key = ("hls-upstream", channel.id)
+        try:
+            await tuner_slots.acquire(
+                key,
+                channel.playlist_id,
+                preempt=lambda: hls_proxy.stop(channel.id),
+                idle=lambda: hls_proxy.is_idle(channel.id)
+            )
+        except SlotUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        hls_proxy.open(channel.id, on_close=lambda: tuner_slots.release(key))
+    
+    token = request.query_params.get("token")
+    query = urlencode({"token": token}) if token else ""
+    
+    try:
+        playlist = await hls_proxy.playlist(channel.id, url, prefix, query)
+    except HLSProxyError as e:
+        logger.error(f"Upstream HLS error for channel {channel.id}: {e}")
+        raise HTTPException(status_code=502, detail=f"Stream error: {str(e)}")
+    
+    return Response(
+        content=playlist,
+        media_type="application/vnd.apple.mpegurl",
+        headers={
+            "Cache-Control": "no-cache",
+            "Access-Control-Allow-Origin": "*",
+        }
+    )
+
 @router.get("/channels/v{channel_number}/stream")
 async def proxy_channel_by_number_stream(
     channel_number: str,
+    request: Request,
     transcode: bool = False,
+    profile: str = DEFAULT_PROFILE,
     token: Optional[str] = Query(None),
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user_flexible)
@@ -307,6 +519,7 @@ async def proxy_channel_by_number_stream(
     Args:
         channel_number: The channel number to stream
         transcode: Whether to transcode the stream (default: False)
+        profile: Transcode profile (copy, 720p, 480p)
         token: Authentication token (optional)
     """
     # Check if authentication is required based on configuration
@@ -317,18 +530,9 @@ async def proxy_channel_by_number_stream(
         # Allow streaming without authentication if not required
         logger.info(f"Unauthenticated access allowed to channel v{channel_number} stream")
     
-    # Find channel by number
-    channel = db.query(Channel).filter(Channel.number == channel_number).first()
-    
-    if not channel:
-        # Try to find by index in the channel list (Network Tuner compatibility)
-        try:
-            idx = int(channel_number) - 1
-            channels = db.query(Channel).filter(Channel.is_active == True).order_by(Channel.number, Channel.name).all()
-            if 0 <= idx < len(channels):
-                channel = channels[idx]
-        except ValueError:
-            pass
+    # Find channel by number, falling back to its position in the lineup (Network Tuner compatibility)
+    channel_id = channel_index.resolve(db, channel_number)
+    channel = db.get(Channel, channel_id) if channel_id is not None else None
     
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
@@ -342,33 +546,93 @@ async def proxy_channel_by_number_stream(
     else:
         logger.info(f"Anonymous streaming channel v{channel_number} (ID: {channel.id})")
     
+    # Clients that can reach the provider themselves skip the proxy
+    if not transcode and stream_redirects.applies(channel.id, current_user):
+        return await _redirect_response(db, channel)
+    
+    # Relative URIs resolve against /channels/v{number}/, so point them at the id routes
+    if not transcode and is_hls_url(channel.stream_url):
+        return await _upstream_hls_response(request, channel, channel.stream_url, f"../{channel.id}/upstream/")
+    
     try:
         if transcode:
             # Use FFmpeg transcoding
-            return StreamingResponse(
-                transcode_stream(channel.stream_url, "mpegts"),
-                media_type="video/mp2t",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "Access-Control-Allow-Origin": "*",
-                }
-            )
+            body = await _transcoded_stream(db, channel, profile)
+            return _session_response(request, channel, current_user, f"transcode:{profile}", body, "video/mp2t")
         else:
-            # Simple proxy without transcoding
-            return StreamingResponse(
-                stream_generator(channel.stream_url),
-                media_type="application/octet-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "Access-Control-Allow-Origin": "*",
-                }
-            )
+            body = await _direct_stream(db, channel)
+            return _session_response(request, channel, current_user, "direct", body, "application/octet-stream")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Stream error for channel v{channel_number}: {e}")
         raise HTTPException(status_code=500, detail=f"Stream error: {str(e)}")
 
+@router.get("/channels/{channel_id}/redirect-link")
+async def get_redirect_link(
+    channel_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user_flexible)
+):
+    """
+    Short-lived signed link that redirects to the channel's upstream.
+    For players that can't send credentials; the link carries no token.
+    """
+    if settings.require_auth_for_streaming and current_user is None:
+        raise HTTPException(status_code=401, detail="Authentication required for streaming")
+    
+    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+    if not channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
+    if not stream_redirects.applies(channel.id, current_user):
+        raise HTTPException(status_code=403, detail="Redirect passthrough is not enabled for this channel")
+    
+    params = stream_redirects.sign(channel.id, current_user.id if current_user else None)
+    base_url = str(request.base_url).rstrip('/')
+    return {
+        "url": f"{base_url}/api/stream-proxy/channels/{channel.id}/redirect?{urlencode(params)}",
+        "expires_at": params["expires"],
+    }
+
+@router.get("/channels/{channel_id}/redirect")
+async def follow_redirect_link(
+    channel_id: int,
+    user: int = 0,
+    expires: int = 0,
+    signature: str = "",
+    db: Session = Depends(get_db)
+):
+    """Redirect a signed link (see redirect-link) to the upstream"""
+    if not stream_redirects.verify(channel_id, user, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired link")
+    
+    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+    if not channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
+    if not channel.is_active:
+        raise HTTPException(status_code=403, detail="Channel is not active")
+    
+    return await _redirect_response(db, channel)
+
+@router.get("/channels/{channel_id}/sources")
+async def get_channel_sources(
+    channel_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin)
+):
+    """Alternative upstream URLs for a channel, in failover order, with health scores"""
+    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+    if not channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
+    return {
+        "channel_id": channel.id,
+        "sources": stream_sources.get_stats(stream_sources.urls_for(db, channel)),
+    }
+
 @router.get("/test-ffmpeg")
 async def test_ffmpeg():
     """Test if FFmpeg is available on the system."""
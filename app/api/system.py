@@ -29,6 +29,7 @@ class SystemStatus(BaseModel):
     services: Dict
     system_info: Dict
     storage: Dict
+    tuner_slots: Dict
 
 class ActivityLog(BaseModel):
     timestamp: datetime
@@ -103,6 +104,9 @@ async def get_system_status(
         "system": system_storage
     }
     
+    # Provider connection usage
+    from app.utils.tuner_slots import tuner_slots
+    
     return SystemStatus(
         cpu_usage=cpu_usage,
         memory_usage=memory_usage,
@@ -111,7 +115,8 @@ async def get_system_status(
         db_stats=db_stats,
         services=services,
         system_info=system_info,
-        storage=storage
+        storage=storage,
+        tuner_slots=tuner_slots.get_stats()
     )
 
 @router.get("/activity", response_model=List[ActivityLog])
@@ -164,9 +169,120 @@ async def clear_system_cache(
     current_user: User = Depends(require_admin)
 ):
     """Clear system caches"""
-    # Clear any application caches here
+    from app.utils.render_cache import render_cache
+    render_cache.invalidate()
     return {"message": "Cache cleared successfully"}
 
+@router.get("/http-clients")
+async def get_http_client_stats(
+    current_user: User = Depends(require_admin)
+):
+    """Get upstream connection pool statistics"""
+    from app.utils.http_clients import http_clients
+    return http_clients.get_stats()
+
+@router.get("/transcoders")
+async def get_transcoder_stats(
+    current_user: User = Depends(require_admin)
+):
+    """Get ffmpeg process usage (CPU, RSS) for capacity planning"""
+    from app.utils.transcoder import transcoder
+    from app.utils.hls_sessions import hls_sessions
+    return {
+        **transcoder.get_stats(),
+        "hls_sessions": hls_sessions.get_stats(),
+    }
+
+@router.get("/streams")
+async def get_active_streams(
+    current_user: User = Depends(require_admin)
+):
+    """Active proxied streams with bytes sent, bitrate and TTFB"""
+    from app.utils.stream_sessions import stream_sessions
+    from app.utils.stream_hub import stream_hub
+    from app.utils.stream_redirects import stream_redirects
+    from app.utils.hls_proxy import hls_proxy
+    return {
+        **stream_sessions.get_stats(),
+        "upstreams": stream_hub.get_stats(),
+        "hls_upstreams": hls_proxy.get_stats(),
+        "redirects": stream_redirects.get_stats(),
+    }
+
+@router.delete("/streams/{session_id}")
+async def stop_stream(
+    session_id: str,
+    current_user: User = Depends(require_admin)
+):
+    """Disconnect one stream session"""
+    from app.utils.stream_sessions import stream_sessions
+    if not stream_sessions.stop(session_id):
+        raise HTTPException(status_code=404, detail="Stream session not found")
+    return {"message": "Stream session stopped"}
+
+class StreamProbeRequest(BaseModel):
+    channel_ids: List[int] = []
+    playlist_id: Optional[int] = None
+
+@router.get("/stream-probe")
+async def get_stream_probe_status(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin)
+):
+    """Stream prober progress and per-status channel counts"""
+    from app.models.channel import ChannelProbe
+    from app.utils.stream_prober import stream_prober
+    
+    statuses = dict(
+        db.query(ChannelProbe.status, func.count(ChannelProbe.channel_id))
+        .group_by(ChannelProbe.status).all()
+    )
+    return {
+        **stream_prober.get_stats(),
+        "channels": {
+            "online": statuses.get("online", 0),
+            "offline": statuses.get("offline", 0),
+            "deactivated": db.query(ChannelProbe).filter(ChannelProbe.deactivated == True).count(),
+            "never_probed": db.query(Channel).filter(Channel.probe == None).count(),
+        },
+    }
+
+@router.post("/stream-probe")
+async def request_stream_probe(
+    probe_request: StreamProbeRequest,
+    current_user: User = Depends(require_admin)
+):
+    """Probe specific channels or a whole playlist now"""
+    from app.utils.stream_prober import stream_prober
+    if not probe_request.channel_ids and probe_request.playlist_id is None:
+        raise HTTPException(status_code=400, detail="Give channel_ids or playlist_id")
+    stream_prober.request(probe_request.channel_ids, probe_request.playlist_id)
+    return {"message": "Stream probe scheduled"}
+
+@router.get("/postprocess")
+async def get_postprocess_status(
+    current_user: User = Depends(require_admin)
+):
+    """Recording post-processing queue, per-stage timings and recent jobs"""
+    from app.utils.postprocess import postprocessor
+    return postprocessor.get_stats()
+
+@router.get("/series-matcher")
+async def get_series_matcher_status(
+    current_user: User = Depends(require_admin)
+):
+    """Last series rule matching run: rules, matches, recordings created, rules/sec"""
+    from app.utils.series_matcher import series_matcher
+    return series_matcher.get_stats()
+
+@router.get("/recording-scheduler")
+async def get_recording_scheduler_status(
+    current_user: User = Depends(require_admin)
+):
+    """Pending recording start/stop events and how punctually starts fired"""
+    from app.utils.recording_scheduler import recording_scheduler
+    return recording_scheduler.get_stats()
+
 @router.post("/optimize-db")
 async def optimize_database(
     db: Session = Depends(get_db),
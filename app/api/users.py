@@ -1,5 +1,6 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.user import User, UserRole
@@ -199,11 +200,11 @@ async def change_password(
     from app.auth.security import verify_password
     
     # Verify current password
-    if not verify_password(password_data.current_password, current_user.hashed_password):
+    if not await run_in_threadpool(verify_password, password_data.current_password, current_user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect current password")
     
     # Update password
-    current_user.hashed_password = get_password_hash(password_data.new_password)
+    current_user.hashed_password = await run_in_threadpool(get_password_hash, password_data.new_password)
     db.commit()
     
     return {"message": "Password changed successfully"}
\ No newline at end of file
@@ -1,11 +1,15 @@
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.user import User, UserRole
 from app.auth.security import decode_access_token
+from app.auth.token_cache import token_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+# Same header, but a request without one gets through (token may come in the query instead)
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
@@ -17,17 +21,22 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    payload = decode_access_token(token)
-    if payload is None:
-        raise credentials_exception
-    
-    username: str = payload.get("sub")
-    if username is None:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.username == username).first()
+    user = token_cache.get(token, db)
     if user is None:
-        raise credentials_exception
+        cache_version = token_cache.version()
+        payload = decode_access_token(token)
+        if payload is None:
+            raise credentials_exception
+        
+        username: str = payload.get("sub")
+        if username is None:
+            raise credentials_exception
+        
+        user = db.query(User).filter(User.username == username).first()
+        if user is None:
+            raise credentials_exception
+        
+        token_cache.put(token, user, payload.get("exp"), cache_version)
     
     if not user.is_active:
         raise HTTPException(
@@ -37,6 +46,15 @@ async def get_current_user(
     
     return user
 
+async def get_optional_user(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    db: Session = Depends(get_db)
+) -> Optional[User]:
+    """The Authorization header's user, or None when no header was sent"""
+    if token is None:
+        return None
+    return await get_current_user(token, db)
+
 async def get_current_active_user(
     current_user: User = Depends(get_current_user)
 ) -> User:
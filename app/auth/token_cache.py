@@ -0,0 +1,96 @@
+"""
+Verified-token cache
+
+Maps an access token that has already been decoded and checked to a
+snapshot of its user, so repeat requests from the same client (segment
+fetches, polling UIs) skip both the JWT decode and the users query.
+Entries live for at most ``auth_cache_ttl`` seconds (never past the
+token's own expiry) and the whole cache is dropped whenever the users
+table changes, which covers updates, deactivation and password changes.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.session import make_transient_to_detached
+
+from app.config import get_settings
+from app.models.user import User
+from app.utils.change_tracker import change_tracker
+
+
+class TokenCache:
+    """TTL-bounded LRU of token -> user snapshot"""
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, token: str, db: Session) -> Optional[User]:
+        """Cached user for ``token`` attached to ``db``, or None on a miss"""
+        if not token or self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self.entries.get(token)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self.entries[token]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(token)
+            self.hits += 1
+            snapshot = entry[1]
+
+        # Attach a copy to the request's session without a SELECT, so handlers
+        # can still lazy-load relationships and commit changes to the user
+        return db.merge(snapshot, load=False)
+
+    def version(self) -> int:
+        """Take before loading a user; pass to ``put`` to avoid caching a stale read"""
+        return change_tracker.version("users")
+
+    def put(self, token: str, user: User, exp: Optional[float], version: int):
+        if not token or self.ttl <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if exp:
+            expires_at = min(expires_at, float(exp))
+
+        snapshot = User(**{column.key: getattr(user, column.key) for column in User.__table__.columns})
+        make_transient_to_detached(snapshot)
+
+        with self._lock:
+            if version != self.version():
+                # Users changed while this one was being loaded
+                return
+            self.entries[token] = (expires_at, snapshot)
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self, *args):
+        with self._lock:
+            self.entries.clear()
+
+    def get_stats(self) -> Dict:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+settings = get_settings()
+
+# Global token cache instance
+token_cache = TokenCache(settings.auth_cache_size, settings.auth_cache_ttl)
+
+# Any committed change to users (role, activation, password, credits) invalidates every snapshot
+change_tracker.subscribe("users", token_cache.clear)
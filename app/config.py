@@ -6,9 +6,25 @@ class Settings(BaseSettings):
     secret_key: str = "your-secret-key-change-this-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 1440
+    auth_cache_ttl: int = 60  # Seconds a verified token -> user snapshot is reused (0 disables)
+    auth_cache_size: int = 1024
     
     recording_path: str = "./recordings"
     max_concurrent_recordings: int = 4
+    recording_engine: str = "native"  # "native" writes MPEG-TS sources in-process (ffmpeg for the rest); "ffmpeg" always spawns ffmpeg
+    recording_write_buffer: int = 4 * 1024 * 1024  # Bytes collected before each disk write
+    recording_start_spacing: float = 1.0  # Minimum seconds between two recording launches
+    recording_start_jitter: float = 10.0  # Scheduled recordings start up to this many seconds early, at random
+    series_full_scan_minutes: int = 360  # Full series rule rescan; EPG imports schedule new episodes right away
+    postprocess_stages: str = "index,checksum"  # Comma-separated: index, checksum, thumbnail, remux (thumbnail/remux need ffmpeg)
+    postprocess_workers: int = 1  # Processes in the post-processing pool
+    postprocess_nice: int = 10  # CPU niceness added to post-processing workers (I/O runs at idle priority)
+    postprocess_state_path: str = "./cache/postprocess.json"  # Job state, for resuming after a restart
+    
+    # Provider connection limits (tuner slots)
+    tuner_slots_per_playlist: int = 0  # Concurrent upstream connections per playlist (0 = unlimited)
+    tuner_slot_overrides: str = ""  # Per-playlist limits, e.g. "1:2,3:5" (playlist_id:slots)
+    tuner_queue_timeout: float = 0  # Seconds a live request waits for a slot before 503 (0 = fail fast)
     
     tuner_device_id: str = "IPTV-PVR"
     tuner_device_uuid: str = "12345678-1234-1234-1234-123456789012"
@@ -16,6 +32,7 @@ class Settings(BaseSettings):
     tuner_lineup_url: str = "http://localhost:8000/lineup.json"
     tuner_port: int = 5004
     server_port: int = 8000  # Main server port
+    public_base_url: str = ""  # URL clients reach the server at, e.g. http://pvr.lan:8000 (lineup.m3u links); empty = request Host
     
     default_m3u_url: str = ""
     default_epg_url: str = ""
@@ -27,6 +44,59 @@ class Settings(BaseSettings):
     # Streaming configuration
     require_auth_for_streaming: bool = False  # Set to True to require authentication for stream endpoints
     stream_auth_grace_period: int = 300  # Seconds to allow streaming after token expiration
+    stream_buffer_size: int = 16 * 1024 * 1024  # Ring buffer per shared channel upstream (bytes)
+    stream_linger_seconds: float = 10.0  # Keep a shared upstream open this long after the last viewer leaves
+    stream_max_skips: int = 3  # Slow viewers are dropped after falling out of the buffer this many times
+    stream_race_delay: float = 0.3  # Seconds without a first byte before racing the next alternative URL
+    stream_race_width: int = 2  # Alternative URLs connecting at the same time
+    stream_max_failovers: int = 5  # Mid-stream switches to another URL before giving up
+    stream_alternatives: str = ""  # Explicit alternative groups: "+"-joined channel ids, groups comma-separated
+    stream_warm_channels: str = ""  # Comma-separated channel ids kept warm (pre-opened at startup)
+    stream_warm_top_n: int = 0  # Also keep this many most-tuned channels warm after viewers leave
+    stream_warm_idle_timeout: int = 900  # Evict an unwatched warm channel after this many seconds
+    stream_warm_memory_budget: int = 64 * 1024 * 1024  # Total buffer bytes for unwatched warm channels
+    stream_redirect_channels: str = ""  # Channel ids answered with a 302 to the upstream ("*" for all)
+    stream_redirect_users: str = ""  # Usernames whose clients are always redirected
+    stream_redirect_ttl: int = 60  # Seconds a signed redirect link stays valid
+    stream_redirect_cache_ttl: int = 300  # Seconds a resolved upstream redirect chain is reused
+    
+    # Stream health prober
+    stream_probe_enabled: bool = False  # Periodically probe the whole lineup (test_streams imports are always probed)
+    stream_probe_concurrency: int = 200  # Probes in flight
+    stream_probe_per_host: int = 8  # Probes in flight against one provider host
+    stream_probe_interval: int = 86400  # Seconds between checks of a healthy channel
+    stream_probe_retry: int = 900  # First re-check of a failing channel; doubles per failure
+    stream_probe_deactivate_after: int = 3  # Consecutive failures before a channel is deactivated (0 = never)
+    stream_probe_ffprobe: bool = False  # Also record codecs with ffprobe (first successful probe only)
+    
+    # Upstream HTTP clients
+    upstream_http2: bool = False  # Requires the optional 'h2' package
+    upstream_max_connections_per_host: int = 10
+    upstream_dns_cache_ttl: int = 300  # Seconds
+    upstream_proxy: str = ""  # Proxy URL for all upstream requests (default: HTTP(S)_PROXY / NO_PROXY from the environment)
+    
+    # Pre-rendered XMLTV / M3U exports
+    render_cache_path: str = "./cache/render"
+    render_cache_max_age: int = 3600  # Re-render at least this often (guide window moves with time)
+    render_cache_debounce: int = 30  # Seconds to wait after a data change before re-rendering
+    channel_index_path: str = "./cache/channel_index.json"  # Persisted channel number -> id index
+    
+    # HLS sessions (ffmpeg segmenters)
+    hls_session_path: str = "/dev/shm/iptv-pvr-hls"  # tmpfs keeps segment churn off the disk
+    hls_segment_seconds: int = 4
+    hls_list_size: int = 6  # Segments kept in the live playlist
+    hls_idle_timeout: int = 60  # Stop a segmenter this many seconds after its last request
+    hls_start_timeout: int = 20  # Seconds to wait for the first segment
+    
+    # Upstream HLS proxy (providers serving .m3u8)
+    hls_proxy_memory_cache: int = 128 * 1024 * 1024  # Segment cache shared by all viewers (bytes)
+    hls_proxy_disk_cache: int = 0  # Spill evicted segments to disk up to this many bytes (0 disables)
+    hls_proxy_cache_path: str = "./cache/hls-proxy"
+    
+    # ffmpeg transcode supervisor
+    transcode_max_processes: int = 4  # Concurrent ffmpeg processes (transcodes + HLS segmenters)
+    transcode_idle_timeout: int = 60  # Reap a process nobody has read from for this many seconds
+    transcode_log_lines: int = 200  # stderr lines kept per process
     
     class Config:
         env_file = ".env"
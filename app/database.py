@@ -2,6 +2,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import get_settings
+from app.utils.change_tracker import change_tracker
 
 settings = get_settings()
 
@@ -14,6 +15,9 @@ engine = create_engine(
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Track committed changes per table so in-process caches know when to refresh
+change_tracker.install(SessionLocal)
+
 Base = declarative_base()
 
 def get_db():
@@ -87,6 +87,14 @@ async def startup_event():
     from app.tuner_discovery import start_discovery
     start_discovery()
     
+    # Open upstreams for pinned warm channels so the first tune is instant
+    from app.api.stream_proxy import prewarm_channels
+    await prewarm_channels()
+    
+    # Pick up recording post-processing interrupted by the last shutdown
+    from app.utils.postprocess import postprocessor
+    postprocessor.resume()
+    
     # NO AUTOMATIC IMPORTS AT STARTUP
     # - No channels will be imported automatically
     # - No EPG mapping will occur automatically
@@ -140,5 +148,29 @@ async def shutdown_event():
     import asyncio
     await asyncio.gather(*background_tasks, return_exceptions=True)
     
+    # Close shared channel upstreams
+    from app.utils.stream_hub import stream_hub
+    await stream_hub.stop_all()
+    
+    # Stop HLS segmenters and remove their segments
+    from app.utils.hls_sessions import hls_sessions
+    await hls_sessions.stop_all()
+    
+    # Release tuner slots held by relayed upstream HLS channels
+    from app.utils.hls_proxy import hls_proxy
+    hls_proxy.close_all()
+    
+    # Stop post-processing workers (unfinished stages resume on next start)
+    from app.utils.postprocess import postprocessor
+    postprocessor.shutdown()
+    
+    # Terminate any remaining ffmpeg processes
+    from app.utils.transcoder import transcoder
+    await transcoder.stop_all()
+    
+    # Close pooled upstream HTTP clients
+    from app.utils.http_clients import http_clients
+    await http_clients.close()
+    
     from app.utils.scheduler import stop_scheduler
     stop_scheduler()
\ No newline at end of file
@@ -1,5 +1,5 @@
 from .user import User, Role, UserRole
-from .channel import Channel, ChannelGroup
+from .channel import Channel, ChannelGroup, ChannelProbe
 from .epg import EPGProgram
 from .recording import Recording, RecordingSchedule
 from .playlist import Playlist
@@ -10,7 +10,7 @@ from .tuner import Tuner, StreamMapping, TunerHealthCheck, TunerStatus
 
 __all__ = [
     "User", "Role", "UserRole",
-    "Channel", "ChannelGroup", 
+    "Channel", "ChannelGroup", "ChannelProbe",
     "EPGProgram",
     "Recording", "RecordingSchedule",
     "Playlist",
@@ -39,4 +39,22 @@ class Channel(Base):
     playlist = relationship("Playlist", back_populates="channels")
     programs = relationship("EPGProgram", back_populates="channel")
     recordings = relationship("Recording", back_populates="channel")
-    epg_mappings = relationship("EPGChannelMapping", back_populates="channel", cascade="all, delete-orphan")
\ No newline at end of file
+    epg_mappings = relationship("EPGChannelMapping", back_populates="channel", cascade="all, delete-orphan")
+    probe = relationship("ChannelProbe", back_populates="channel", uselist=False, cascade="all, delete-orphan")
+
+class ChannelProbe(Base):
+    """Latest stream health check of a channel (see app.utils.stream_prober)"""
+    __tablename__ = "channel_probes"
+    
+    channel_id = Column(Integer, ForeignKey("channels.id"), primary_key=True)
+    status = Column(String)  # 'online', 'offline'
+    http_status = Column(Integer)
+    latency_ms = Column(Integer)  # Time to first byte
+    codec = Column(String)  # e.g. "h264 1920x1080, aac" (needs ffprobe)
+    error = Column(Text)
+    consecutive_failures = Column(Integer, default=0)
+    deactivated = Column(Boolean, default=False)  # is_active was cleared by the prober
+    checked_at = Column(DateTime(timezone=True))
+    next_check_at = Column(DateTime(timezone=True), index=True)
+    
+    channel = relationship("Channel", back_populates="probe")
\ No newline at end of file
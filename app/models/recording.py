@@ -23,6 +23,7 @@ class Recording(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
     program_id = Column(Integer, ForeignKey("epg_programs.id"))
+    schedule_id = Column(Integer, ForeignKey("recording_schedules.id", ondelete="SET NULL"))  # Series/recurring rule that created it
     title = Column(String, nullable=False)
     status = Column(Enum(RecordingStatus), default=RecordingStatus.SCHEDULED)
     start_time = Column(DateTime(timezone=True), nullable=False)
@@ -20,6 +20,7 @@ from app.utils.m3u_parser import M3UParser
 from app.utils.epg_auto_mapper import EPGAutoMapper, EPGChannel
 from app.utils.xmltv_parser import XMLTVParser
 from app.utils.import_manager import import_manager
+from app.utils.http_clients import http_clients
 from app.database import SessionLocal
 
 logger = logging.getLogger(__name__)
@@ -167,6 +168,7 @@ class ImportService:
         source_id_copy = source.id
         playlist_id_copy = playlist.id
         auto_refresh_copy = source.auto_refresh
+        test_streams_copy = bool((source.import_settings or {}).get('test_streams'))
         refresh_interval_copy = source.refresh_interval
         
         # Create enhanced progress callback
@@ -202,6 +204,11 @@ class ImportService:
                         # Calculate next refresh
                         if auto_refresh_copy:
                             source_obj.next_refresh_at = datetime.utcnow() + timedelta(seconds=refresh_interval_copy)
+                        
+                        # Check the freshly imported streams in the background
+                        if test_streams_copy:
+                            from app.utils.stream_prober import stream_prober
+                            stream_prober.request(playlist_id=playlist_id_copy)
                     
                     callback_db.commit()
             finally:
@@ -359,16 +366,14 @@ class ImportService:
         # Validate M3U
         if m3u_url:
             try:
-                import httpx
-                async with httpx.AsyncClient() as client:
-                    response = await client.head(m3u_url, follow_redirects=True)
-                    if response.status_code != 200:
-                        result["errors"].append(f"M3U URL returned status {response.status_code}")
-                        result["valid"] = False
-                    else:
-                        size = response.headers.get('content-length')
-                        if size:
-                            result["info"]["m3u_size"] = int(size)
+                response = await http_clients.get("probe").head(m3u_url)
+                if response.status_code != 200:
+                    result["errors"].append(f"M3U URL returned status {response.status_code}")
+                    result["valid"] = False
+                else:
+                    size = response.headers.get('content-length')
+                    if size:
+                        result["info"]["m3u_size"] = int(size)
             except Exception as e:
                 result["errors"].append(f"Cannot access M3U URL: {str(e)}")
                 result["valid"] = False
@@ -384,13 +389,11 @@ class ImportService:
         # Validate EPG
         if epg_url:
             try:
-                import httpx
-                async with httpx.AsyncClient() as client:
-                    response = await client.head(epg_url, follow_redirects=True)
-                    if response.status_code != 200:
-                        result["warnings"].append(f"EPG URL returned status {response.status_code}")
-                    else:
-                        result["info"]["epg_available"] = True
+                response = await http_clients.get("probe").head(epg_url)
+                if response.status_code != 200:
+                    result["warnings"].append(f"EPG URL returned status {response.status_code}")
+                else:
+                    result["info"]["epg_available"] = True
             except Exception as e:
                 result["warnings"].append(f"Cannot access EPG URL: {str(e)}")
         
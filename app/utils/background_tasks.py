@@ -104,6 +104,16 @@ async def monitor_import_health():
         # Check every minute
         await asyncio.sleep(60)
 
+async def probe_streams():
+    """Probe channel streams that are due (or requested) for a health check"""
+    from app.utils.stream_prober import stream_prober
+    await stream_prober.run_forever()
+
+async def run_recording_scheduler():
+    """Start and stop recordings as they come due"""
+    from app.utils.recording_scheduler import recording_scheduler
+    await recording_scheduler.run_forever()
+
 def start_background_tasks():
     """Start all background tasks"""
     # Start the scheduler (not async)
@@ -115,6 +125,8 @@ def start_background_tasks():
         asyncio.create_task(cleanup_import_jobs()),
         asyncio.create_task(auto_refresh_playlists()),
         asyncio.create_task(monitor_import_health()),
+        asyncio.create_task(probe_streams()),
+        asyncio.create_task(run_recording_scheduler()),
     ]
     
     logger.info("Background tasks started")
@@ -0,0 +1,96 @@
+"""
+Database change tracking
+
+Keeps a version counter per table that is bumped whenever a committed
+transaction in this process touched that table. Caches derived from the
+database (rendered exports, lookup indexes, ...) compare versions or
+subscribe to changes instead of re-querying on every request.
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Set
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = "changed_tables"
+
+
+class ChangeTracker:
+    """Per-table version counters driven by SQLAlchemy session events"""
+
+    def __init__(self):
+        self.versions: Dict[str, int] = defaultdict(int)
+        self.listeners: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def version(self, *tables: str) -> int:
+        """Combined version of one or more tables"""
+        return sum(self.versions[table] for table in tables)
+
+    def subscribe(self, table: str, callback: Callable[[str], None]):
+        """Call ``callback(table)`` after every commit that changed ``table``.
+
+        Callbacks run synchronously in the committing thread, which may be a
+        worker thread, so they must be cheap and thread-safe.
+        """
+        self.listeners[table].append(callback)
+
+    def mark_changed(self, *tables: str):
+        """Bump versions and notify listeners for the given tables.
+
+        Call this directly for writes the session events cannot see, e.g.
+        changes made from worker processes or raw SQL.
+        """
+        with self._lock:
+            for table in tables:
+                self.versions[table] += 1
+
+        for table in tables:
+            for callback in list(self.listeners.get(table, ())):
+                try:
+                    callback(table)
+                except Exception as e:
+                    logger.error(f"Change listener for {table} failed: {e}")
+
+    def install(self, session_factory):
+        """Attach the tracking listeners to a session factory"""
+        event.listen(session_factory, "after_flush", self._after_flush)
+        event.listen(session_factory, "do_orm_execute", self._do_orm_execute)
+        event.listen(session_factory, "after_commit", self._after_commit)
+        event.listen(session_factory, "after_rollback", self._after_rollback)
+
+    def _pending(self, session) -> Set[str]:
+        return session.info.setdefault(_PENDING_KEY, set())
+
+    def _after_flush(self, session, flush_context):
+        pending = self._pending(session)
+        for obj in session.new:
+            pending.add(obj.__table__.name)
+        for obj in session.deleted:
+            pending.add(obj.__table__.name)
+        for obj in session.dirty:
+            if session.is_modified(obj, include_collections=False):
+                pending.add(obj.__table__.name)
+
+    def _do_orm_execute(self, orm_execute_state):
+        # Bulk query.update() / query.delete() never go through a flush
+        if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+            mapper = orm_execute_state.bind_mapper
+            if mapper is not None:
+                self._pending(orm_execute_state.session).add(mapper.local_table.name)
+
+    def _after_commit(self, session):
+        pending = session.info.pop(_PENDING_KEY, None)
+        if pending:
+            self.mark_changed(*sorted(pending))
+
+    def _after_rollback(self, session):
+        session.info.pop(_PENDING_KEY, None)
+
+
+# Global change tracker instance
+change_tracker = ChangeTracker()
@@ -0,0 +1,142 @@
+"""
+Channel number index
+
+Tuner clients tune by channel number. The index maps both the explicit
+``Channel.number`` and the virtual number (1-based position in the
+active lineup ordered by number, name) to a channel id, so a tune
+resolves with two dict/list lookups instead of loading the lineup.
+
+The index is rebuilt only when the channels table changes (see
+``change_tracker``) and is persisted so a restart can reuse it after a
+single cheap fingerprint query.
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, func
+
+from app.config import get_settings
+from app.utils.change_tracker import change_tracker
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelNumberIndex:
+    """number -> channel id, kept in memory and on disk"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.by_number: Dict[str, int] = {}
+        self.by_position: List[int] = []
+        self.version: Optional[int] = None
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+
+    def resolve(self, db, channel_number: str) -> Optional[int]:
+        """Channel id for ``channel_number``, or None.
+
+        Matches ``Channel.number`` first, then falls back to the virtual
+        number (position in the active lineup).
+        """
+        self._ensure_current(db)
+        channel_id = self.by_number.get(channel_number)
+        if channel_id is not None:
+            return channel_id
+        try:
+            idx = int(channel_number) - 1
+        except ValueError:
+            return None
+        if 0 <= idx < len(self.by_position):
+            return self.by_position[idx]
+        return None
+
+    def _ensure_current(self, db):
+        version = change_tracker.version("channels")
+        if self.version == version:
+            return
+        with self._lock:
+            if self.version == version:
+                return
+            if self.version is None and self._load(db):
+                self.version = version
+                return
+            self._rebuild(db)
+            self.version = version
+
+    def _rebuild(self, db):
+        from app.models.channel import Channel
+
+        by_number: Dict[str, int] = {}
+        for channel_id, number in db.query(Channel.id, Channel.number).order_by(Channel.id):
+            if number is not None:
+                # Duplicate numbers: the oldest channel wins
+                by_number.setdefault(str(number), channel_id)
+
+        by_position = [
+            channel_id for (channel_id,) in db.query(Channel.id)
+            .filter(Channel.is_active == True)
+            .order_by(Channel.number, Channel.name)
+        ]
+
+        self.by_number = by_number
+        self.by_position = by_position
+        self.rebuilds += 1
+        logger.info(f"Rebuilt channel number index ({len(by_number)} numbers, {len(by_position)} active)")
+        self._save(self._fingerprint(db))
+
+    def _fingerprint(self, db) -> List:
+        """Cheap summary of the channels table used to validate the persisted index"""
+        from app.models.channel import Channel
+
+        row = db.query(
+            func.count(Channel.id),
+            func.max(Channel.id),
+            func.max(Channel.created_at),
+            func.max(Channel.updated_at),
+            func.sum(case((Channel.is_active == True, 1), else_=0)),
+        ).one()
+        return [str(value) for value in row]
+
+    def _load(self, db) -> bool:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("fingerprint") != self._fingerprint(db):
+            return False
+        self.by_number = data["by_number"]
+        self.by_position = data["by_position"]
+        logger.info(f"Loaded channel number index from {self.path}")
+        return True
+
+    def _save(self, fingerprint: List):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({
+                    "fingerprint": fingerprint,
+                    "by_number": self.by_number,
+                    "by_position": self.by_position,
+                }, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist channel number index: {e}")
+
+    def get_stats(self) -> Dict:
+        return {
+            "numbers": len(self.by_number),
+            "active_channels": len(self.by_position),
+            "rebuilds": self.rebuilds,
+        }
+
+
+settings = get_settings()
+
+# Global channel number index instance
+channel_index = ChannelNumberIndex(settings.channel_index_path)
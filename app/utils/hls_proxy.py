@@ -0,0 +1,448 @@
+"""
+HLS upstream proxy
+
+Many provider URLs are HLS playlists rather than MPEG-TS. Instead of
+passing the playlist through (which leaves clients fetching segments from
+the provider, or failing on relative URIs), playlists are fetched here and
+rewritten so every variant playlist, segment, key and init section is
+requested from our routes under ``/channels/{id}/upstream/``.
+
+Upstream URLs are never put into rewritten playlists: each one gets an
+opaque reference registered in memory, so the routes can only fetch what a
+playlist handed out.
+
+Segments are cached in a size-bounded LRU shared by all viewers (memory,
+optionally spilling to disk) and concurrent requests for the same segment
+share one upstream fetch. Serving a segment prefetches the one after it,
+and playlists are cached for half a target duration, so N viewers of a
+channel cost one upstream playlist poll and one fetch per segment.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import httpx
+
+from app.config import get_settings
+from app.utils.http_clients import http_clients
+
+logger = logging.getLogger(__name__)
+
+MAX_REFS = 20000  # Upstream URLs remembered for rewritten playlists
+MASTER_PLAYLIST_TTL = 30.0  # Seconds; variant lists rarely change
+PLAYLIST_PRUNE_INTERVAL = 60.0  # Seconds between sweeps of expired cached playlists
+DEFAULT_TARGET_DURATION = 6.0
+
+URI_ATTR_RE = re.compile(r'URI="([^"]+)"')
+TARGET_DURATION_RE = re.compile(r"#EXT-X-TARGETDURATION:\s*(\d+(?:\.\d+)?)")
+REF_RE = re.compile(r"^[0-9a-f]{16}(\.[A-Za-z0-9]{1,5})?$")
+
+# Tags whose URI attribute names another playlist rather than a media resource
+PLAYLIST_URI_TAGS = ("#EXT-X-MEDIA", "#EXT-X-I-FRAME-STREAM-INF")
+
+
+class HLSProxyError(Exception):
+    """The upstream playlist or segment could not be fetched"""
+
+
+def is_hls_url(url: str) -> bool:
+    return urlparse(url).path.lower().endswith(".m3u8")
+
+
+@dataclass
+class UpstreamRef:
+    """An upstream URL handed out in a rewritten playlist"""
+    kind: str  # "playlist" or "segment"
+    url: str
+    channel_id: int
+    next: Optional[str] = None  # Following segment in its media playlist
+
+
+@dataclass
+class UpstreamChannel:
+    """A channel being relayed; holds its tuner slot while watched"""
+    channel_id: int
+    opened_at: float = field(default_factory=time.time)
+    last_access: float = field(default_factory=time.time)
+    requests: int = 0
+    on_close: Optional[Callable[[], None]] = None
+
+
+class SegmentCache:
+    """Byte-bounded LRU of segments in memory, spilling evictions to disk.
+
+    Disk reads, writes and removals run in worker threads; the maps are
+    only touched on the event loop.
+    """
+
+    def __init__(self, memory_budget: int, disk_budget: int, disk_path: str):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.disk_path = disk_path
+        self.memory: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+        self.memory_bytes = 0
+        self.spilling: Dict[str, Tuple[bytes, str]] = {}  # Evicted, still being written to disk
+        self.disk: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()  # ref -> (size, media type)
+        self.disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, ref: str) -> bool:
+        return ref in self.memory or ref in self.spilling or ref in self.disk
+
+    async def get(self, ref: str) -> Optional[Tuple[bytes, str]]:
+        entry = self.memory.get(ref) or self.spilling.get(ref)
+        if entry is not None:
+            if ref in self.memory:
+                self.memory.move_to_end(ref)
+            self.hits += 1
+            return entry
+        disk_entry = self.disk.get(ref)
+        if disk_entry is not None:
+            try:
+                data = await asyncio.to_thread(self._read, ref)
+            except OSError:
+                await self._drop_disk([ref])
+            else:
+                if ref in self.disk:
+                    self.disk.move_to_end(ref)
+                self.hits += 1
+                return data, disk_entry[1]
+        self.misses += 1
+        return None
+
+    async def put(self, ref: str, data: bytes, media_type: str):
+        if ref in self.memory:
+            return
+        self.memory[ref] = (data, media_type)
+        self.memory_bytes += len(data)
+        evicted = []
+        while self.memory_bytes > self.memory_budget and len(self.memory) > 1:
+            old_ref, (old_data, old_type) = self.memory.popitem(last=False)
+            self.memory_bytes -= len(old_data)
+            evicted.append((old_ref, old_data, old_type))
+        for old_ref, old_data, old_type in evicted:
+            await self._spill(old_ref, old_data, old_type)
+
+    async def _spill(self, ref: str, data: bytes, media_type: str):
+        if self.disk_budget <= 0 or ref in self.disk or ref in self.spilling:
+            return
+        self.spilling[ref] = (data, media_type)
+        try:
+            await asyncio.to_thread(self._write, ref, data)
+        except OSError as e:
+            logger.warning(f"Could not spill HLS segment to disk: {e}")
+            return
+        finally:
+            del self.spilling[ref]
+        self.disk[ref] = (len(data), media_type)
+        self.disk_bytes += len(data)
+        oldest = []
+        excess = self.disk_bytes - self.disk_budget
+        for old_ref, (size, _) in self.disk.items():
+            if excess <= 0:
+                break
+            oldest.append(old_ref)
+            excess -= size
+        if oldest:
+            await self._drop_disk(oldest)
+
+    async def _drop_disk(self, refs: List[str]):
+        for ref in refs:
+            size, _ = self.disk.pop(ref, (0, ""))
+            self.disk_bytes -= size
+        await asyncio.to_thread(self._remove, refs)
+
+    def _read(self, ref: str) -> bytes:
+        with open(os.path.join(self.disk_path, ref), "rb") as f:
+            return f.read()
+
+    def _write(self, ref: str, data: bytes):
+        os.makedirs(self.disk_path, exist_ok=True)
+        with open(os.path.join(self.disk_path, ref), "wb") as f:
+            f.write(data)
+
+    def _remove(self, refs: List[str]):
+        for ref in refs:
+            try:
+                os.remove(os.path.join(self.disk_path, ref))
+            except OSError:
+                pass
+
+    async def clear(self):
+        self.memory.clear()
+        self.memory_bytes = 0
+        await self._drop_disk(list(self.disk))
+
+    def get_stats(self) -> Dict:
+        return {
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory_bytes,
+            "disk_entries": len(self.disk),
+            "disk_bytes": self.disk_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class HLSUpstreamProxy:
+    """Fetches, rewrites and caches upstream HLS for all viewers"""
+
+    def __init__(self, cache: SegmentCache, idle_timeout: int):
+        self.cache = cache
+        self.idle_timeout = idle_timeout
+        self.refs: "OrderedDict[str, UpstreamRef]" = OrderedDict()
+        self.channels: Dict[int, UpstreamChannel] = {}
+        self.playlists: Dict[str, Tuple[float, str, str]] = {}  # url -> (expires_at, text, final url)
+        self._next_playlist_prune = 0.0
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.playlist_fetches = 0
+        self.segment_fetches = 0
+        self.prefetches = 0
+        self._reaper_task: Optional[asyncio.Task] = None
+
+    # ---- Channels ----
+
+    def is_open(self, channel_id: int) -> bool:
+        return channel_id in self.channels
+
+    def open(self, channel_id: int, on_close: Optional[Callable[[], None]] = None):
+        """Start relaying a channel; ``on_close`` runs when it goes idle"""
+        if channel_id not in self.channels:
+            self.channels[channel_id] = UpstreamChannel(channel_id, on_close=on_close)
+            self._ensure_reaper()
+
+    def close(self, channel_id: int):
+        channel = self.channels.pop(channel_id, None)
+        if channel and channel.on_close:
+            channel.on_close()
+
+    async def stop(self, channel_id: int):
+        self.close(channel_id)
+
+    def is_idle(self, channel_id: int) -> bool:
+        """Open, but not polled for more than two target durations"""
+        channel = self.channels.get(channel_id)
+        return channel is not None and time.time() - channel.last_access > 2 * DEFAULT_TARGET_DURATION
+
+    def _touch(self, channel_id: int):
+        channel = self.channels.get(channel_id)
+        if channel:
+            channel.last_access = time.time()
+            channel.requests += 1
+
+    def _ensure_reaper(self):
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self._reap_loop())
+
+    async def _reap_loop(self):
+        """Close channels nobody has polled; exits when none are left"""
+        while self.channels:
+            await asyncio.sleep(min(10, self.idle_timeout))
+            now = time.time()
+            for channel in list(self.channels.values()):
+                if now - channel.last_access > self.idle_timeout:
+                    logger.info(f"Closing idle HLS upstream for channel {channel.channel_id}")
+                    self.close(channel.channel_id)
+
+    def close_all(self):
+        if self._reaper_task:
+            self._reaper_task.cancel()
+        for channel_id in list(self.channels):
+            self.close(channel_id)
+
+    # ---- References ----
+
+    def _register(self, kind: str, url: str, channel_id: int) -> str:
+        ref = hashlib.sha1(f"{channel_id}:{url}".encode()).hexdigest()[:16]
+        if kind == "playlist":
+            ref += ".m3u8"
+        else:
+            ext = os.path.splitext(urlparse(url).path)[1]
+            ref += ext if ext and len(ext) <= 6 else ".ts"
+        entry = self.refs.get(ref)
+        if entry is None:
+            self.refs[ref] = UpstreamRef(kind, url, channel_id)
+            while len(self.refs) > MAX_REFS:
+                self.refs.popitem(last=False)
+        else:
+            self.refs.move_to_end(ref)
+        return ref
+
+    def lookup(self, channel_id: int, ref: str) -> Optional[UpstreamRef]:
+        if not REF_RE.match(ref):
+            return None
+        entry = self.refs.get(ref)
+        if entry is None or entry.channel_id != channel_id:
+            return None
+        return entry
+
+    # ---- Playlists ----
+
+    async def playlist(self, channel_id: int, url: str, prefix: str = "", query: str = "") -> str:
+        """The playlist at ``url``, rewritten to point at our routes"""
+        self._touch(channel_id)
+        text, final_url = await self._fetch_playlist(url)
+        return self._rewrite(channel_id, text, final_url, prefix, query)
+
+    async def _fetch_playlist(self, url: str) -> Tuple[str, str]:
+        cached = self.playlists.get(url)
+        if cached and cached[0] > time.time():
+            return cached[1], cached[2]
+        return await self._shared_fetch(f"playlist:{url}", lambda: self._download_playlist(url))
+
+    async def _download_playlist(self, url: str) -> Tuple[str, str]:
+        try:
+            response = await http_clients.get("stream").get(url)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise HLSProxyError(f"Playlist fetch failed: {e}")
+        self.playlist_fetches += 1
+        text = response.text
+        final_url = str(response.url)
+        if not text.lstrip().startswith("#EXTM3U"):
+            raise HLSProxyError("Upstream did not return an HLS playlist")
+
+        if "#EXT-X-STREAM-INF" in text:
+            ttl = MASTER_PLAYLIST_TTL
+        else:
+            match = TARGET_DURATION_RE.search(text)
+            ttl = (float(match.group(1)) if match else DEFAULT_TARGET_DURATION) / 2
+        now = time.time()
+        self._prune_playlists(now)
+        self.playlists[url] = (now + ttl, text, final_url)
+        return text, final_url
+
+    def _prune_playlists(self, now: float):
+        """Forget expired playlists (channels nobody watches any more)"""
+        if now < self._next_playlist_prune:
+            return
+        self._next_playlist_prune = now + PLAYLIST_PRUNE_INTERVAL
+        for url in [url for url, (expires_at, _, _) in self.playlists.items() if expires_at <= now]:
+            del self.playlists[url]
+
+    def _rewrite(self, channel_id: int, text: str, base_url: str, prefix: str, query: str) -> str:
+        is_master = "#EXT-X-STREAM-INF" in text
+        suffix = f"?{query}" if query else ""
+        lines = []
+        previous_segment: Optional[UpstreamRef] = None
+
+        def local(kind: str, uri: str) -> str:
+            return self._register(kind, urljoin(base_url, uri.strip()), channel_id)
+
+        for line in text.splitlines():
+            if not line.strip():
+                lines.append(line)
+            elif line.startswith("#"):
+                if 'URI="' in line:
+                    kind = "playlist" if line.startswith(PLAYLIST_URI_TAGS) else "segment"
+                    line = URI_ATTR_RE.sub(lambda m: f'URI="{prefix}{local(kind, m.group(1))}{suffix}"', line)
+                lines.append(line)
+            elif is_master:
+                lines.append(f"{prefix}{local('playlist', line)}{suffix}")
+            else:
+                ref = local("segment", line)
+                # Chain segments so serving one can prefetch the next
+                if previous_segment is not None:
+                    previous_segment.next = ref
+                previous_segment = self.refs[ref]
+                lines.append(f"{prefix}{ref}{suffix}")
+        return "\n".join(lines) + "\n"
+
+    # ---- Segments ----
+
+    async def segment(self, entry: UpstreamRef, ref: str) -> Tuple[bytes, str]:
+        """Segment bytes and media type, from cache or a shared upstream fetch"""
+        self._touch(entry.channel_id)
+        cached = await self.cache.get(ref)
+        if cached is None:
+            cached = await self._shared_fetch(ref, lambda: self._download_segment(entry, ref))
+        if entry.next:
+            self._prefetch(entry.next)
+        return cached
+
+    def _prefetch(self, ref: str):
+        entry = self.refs.get(ref)
+        if entry is None or ref in self.inflight or ref in self.cache:
+            return
+        self.prefetches += 1
+
+        async def run():
+            try:
+                await self._shared_fetch(ref, lambda: self._download_segment(entry, ref))
+            except Exception as e:
+                logger.debug(f"Prefetch of {ref} failed: {e}")
+
+        asyncio.create_task(run())
+
+    async def _download_segment(self, entry: UpstreamRef, ref: str) -> Tuple[bytes, str]:
+        try:
+            response = await http_clients.get("stream").get(entry.url)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise HLSProxyError(f"Segment fetch failed: {e}")
+        self.segment_fetches += 1
+        media_type = response.headers.get("content-type", "video/mp2t")
+        await self.cache.put(ref, response.content, media_type)
+        return response.content, media_type
+
+    async def _shared_fetch(self, key: str, fetch):
+        """Run ``fetch`` once for all concurrent callers asking for ``key``.
+
+        The fetch runs in its own task and every caller waits through a
+        shield, so a viewer disconnecting mid-fetch cancels only its own
+        wait, not the download the other viewers are waiting on.
+        """
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fetch())
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self._fetch_done(key, done))
+        return await asyncio.shield(task)
+
+    def _fetch_done(self, key: str, task: asyncio.Task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        if not task.cancelled():
+            # Nobody may be waiting any more; don't warn about an unretrieved exception
+            task.exception()
+
+    def get_stats(self) -> Dict:
+        now = time.time()
+        return {
+            "channels": [
+                {
+                    "channel_id": c.channel_id,
+                    "uptime_seconds": int(now - c.opened_at),
+                    "idle_seconds": int(now - c.last_access),
+                    "requests": c.requests,
+                }
+                for c in self.channels.values()
+            ],
+            "playlist_fetches": self.playlist_fetches,
+            "segment_fetches": self.segment_fetches,
+            "prefetches": self.prefetches,
+            "references": len(self.refs),
+            "cache": self.cache.get_stats(),
+        }
+
+
+settings = get_settings()
+
+# Global HLS upstream proxy instance
+hls_proxy = HLSUpstreamProxy(
+    cache=SegmentCache(
+        memory_budget=settings.hls_proxy_memory_cache,
+        disk_budget=settings.hls_proxy_disk_cache,
+        disk_path=settings.hls_proxy_cache_path,
+    ),
+    idle_timeout=settings.hls_idle_timeout,
+)
@@ -0,0 +1,278 @@
+"""
+HLS session manager
+
+Runs one ffmpeg HLS segmenter per (channel, profile) into a tmpfs
+directory. Every viewer of that channel and profile reads the same live
+playlist and segment files; a session is stopped once nobody has
+requested its playlist or segments for ``hls_idle_timeout`` seconds.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+
+from app.config import get_settings
+from app.utils.transcode_profiles import PROFILES, input_args
+from app.utils.transcoder import transcoder, TranscodeJob
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST_NAME = "index.m3u8"
+SEGMENT_RE = re.compile(r"^segment_\d+\.ts$")
+
+SessionKey = Tuple[int, str]
+
+
+class HLSSessionError(Exception):
+    """The segmenter could not be started or died before producing output"""
+
+
+@dataclass
+class HLSSession:
+    """A running segmenter and its output directory"""
+    channel_id: int
+    profile: str
+    directory: str
+    job: Optional[TranscodeJob] = None
+    started_at: float = field(default_factory=time.time)
+    last_access: float = field(default_factory=time.time)
+    requests: int = 0
+    on_close: Optional[Callable[[], None]] = None
+
+    @property
+    def playlist_path(self) -> str:
+        return os.path.join(self.directory, PLAYLIST_NAME)
+
+    @property
+    def running(self) -> bool:
+        return self.job is not None and self.job.running
+
+    def touch(self):
+        self.last_access = time.time()
+        self.requests += 1
+        if self.job:
+            # Keeps the supervisor from reaping a segmenter that is being watched
+            self.job.touch()
+
+    def is_ready(self) -> bool:
+        """A playlist listing at least one segment exists"""
+        try:
+            with open(self.playlist_path, "r") as f:
+                return "#EXTINF" in f.read()
+        except FileNotFoundError:
+            return False
+
+    def last_error(self) -> str:
+        return self.job.last_error() if self.job else ""
+
+
+class HLSSessionManager:
+    """Starts, shares and reaps HLS segmenter sessions"""
+
+    def __init__(self, base_path: str, segment_seconds: int, list_size: int,
+                 idle_timeout: int, start_timeout: int):
+        self.base_path = self._resolve_base_path(base_path)
+        self.segment_seconds = segment_seconds
+        self.list_size = list_size
+        self.idle_timeout = idle_timeout
+        self.start_timeout = start_timeout
+        self.sessions: Dict[SessionKey, HLSSession] = {}
+        self._locks: Dict[SessionKey, asyncio.Lock] = {}
+        self._reaper_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _resolve_base_path(base_path: str) -> str:
+        parent = os.path.dirname(os.path.abspath(base_path))
+        if os.path.isdir(parent):
+            return base_path
+        # No /dev/shm (e.g. macOS): fall back to the regular temp directory
+        return os.path.join(tempfile.gettempdir(), os.path.basename(base_path))
+
+    async def get_session(self, channel_id: int, stream_url: str, profile: str,
+                          on_close: Optional[Callable[[], None]] = None) -> HLSSession:
+        """Return a ready session, starting the segmenter if needed.
+
+        ``on_close`` is called once when a session started by this call ends.
+        """
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile: {profile}")
+
+        key = (channel_id, profile)
+        session = self.sessions.get(key)
+        if session and session.running and session.is_ready():
+            session.touch()
+            return session
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            session = self.sessions.get(key)
+            if session is None or not session.running:
+                if session:
+                    await self._stop(session)
+                try:
+                    session = await self._start(channel_id, stream_url, profile)
+                except Exception:
+                    if on_close:
+                        on_close()
+                    raise
+                session.on_close = on_close
+                self.sessions[key] = session
+            await self._wait_until_ready(session)
+            session.touch()
+            return session
+
+    def find_session(self, channel_id: int, profile: str) -> Optional[HLSSession]:
+        """Look up a running session without starting one (segment requests)"""
+        session = self.sessions.get((channel_id, profile))
+        if session and session.running:
+            session.touch()
+            return session
+        return None
+
+    def segment_path(self, session: HLSSession, segment: str) -> Optional[str]:
+        if not SEGMENT_RE.match(segment):
+            return None
+        path = os.path.join(session.directory, segment)
+        return path if os.path.exists(path) else None
+
+    def read_playlist(self, session: HLSSession) -> str:
+        with open(session.playlist_path, "r") as f:
+            return f.read()
+
+    async def _start(self, channel_id: int, stream_url: str, profile: str) -> HLSSession:
+        directory = os.path.join(self.base_path, f"{channel_id}-{profile}")
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+        session = HLSSession(channel_id=channel_id, profile=profile, directory=directory)
+
+        cmd = ['ffmpeg'] + input_args(stream_url) + PROFILES[profile] + [
+            '-f', 'hls',
+            '-hls_time', str(self.segment_seconds),
+            '-hls_list_size', str(self.list_size),
+            # temp_file: the playlist is replaced atomically, never read half-written
+            '-hls_flags', 'delete_segments+temp_file+independent_segments',
+            '-hls_segment_filename', os.path.join(directory, 'segment_%05d.ts'),
+            session.playlist_path,
+        ]
+
+        try:
+            session.job = await transcoder.spawn(
+                ("hls", channel_id, profile), "hls", cmd, capture_stdout=False
+            )
+        except FileNotFoundError:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise HLSSessionError("FFmpeg is not installed or not in PATH")
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+        logger.info(f"Started HLS session for channel {channel_id} ({profile}), pid {session.job.pid}")
+        self._ensure_reaper()
+        return session
+
+    async def _wait_until_ready(self, session: HLSSession):
+        deadline = time.time() + self.start_timeout
+        while not session.is_ready():
+            if not session.running:
+                error = session.last_error()
+                await self._remove(session)
+                raise HLSSessionError(f"Segmenter exited: {error or 'no output'}")
+            if time.time() > deadline:
+                await self._remove(session)
+                raise HLSSessionError("Timed out waiting for the first segment")
+            await asyncio.sleep(0.25)
+
+    async def _stop(self, session: HLSSession):
+        if session.job:
+            await transcoder.stop(session.job)
+        shutil.rmtree(session.directory, ignore_errors=True)
+        if session.on_close:
+            callback, session.on_close = session.on_close, None
+            callback()
+
+    async def stop(self, channel_id: int, profile: str):
+        session = self.sessions.get((channel_id, profile))
+        if session:
+            await self._remove(session)
+
+    def is_idle(self, channel_id: int, profile: str) -> bool:
+        """Running, but no playlist or segment request for a while"""
+        session = self.sessions.get((channel_id, profile))
+        return session is not None and time.time() - session.last_access > 2 * self.segment_seconds * self.list_size
+
+    async def _remove(self, session: HLSSession):
+        key = (session.channel_id, session.profile)
+        if self.sessions.get(key) is session:
+            del self.sessions[key]
+        await self._stop(session)
+
+    def _ensure_reaper(self):
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self._reap_loop())
+
+    async def _reap_loop(self):
+        """Stop idle or dead sessions; exits when none are left"""
+        while self.sessions:
+            await asyncio.sleep(min(10, self.idle_timeout))
+            now = time.time()
+            for session in list(self.sessions.values()):
+                if not session.running:
+                    logger.warning(
+                        f"HLS session for channel {session.channel_id} ({session.profile}) "
+                        f"exited: {session.last_error()}"
+                    )
+                    await self._remove(session)
+                elif now - session.last_access > self.idle_timeout:
+                    logger.info(f"Stopping idle HLS session for channel {session.channel_id} ({session.profile})")
+                    await self._remove(session)
+
+    async def stop_all(self):
+        if self._reaper_task:
+            self._reaper_task.cancel()
+        for session in list(self.sessions.values()):
+            await self._remove(session)
+
+    def get_stats(self) -> list:
+        now = time.time()
+        return [
+            {
+                "channel_id": s.channel_id,
+                "profile": s.profile,
+                "pid": s.job.pid if s.job else None,
+                "running": s.running,
+                "uptime_seconds": int(now - s.started_at),
+                "idle_seconds": int(now - s.last_access),
+                "requests": s.requests,
+            }
+            for s in self.sessions.values()
+        ]
+
+
+def rewrite_playlist(playlist: str, prefix: str = "", query: str = "") -> str:
+    """Point segment URIs at our routes, carrying the auth token along"""
+    lines = []
+    for line in playlist.splitlines():
+        if line and not line.startswith("#"):
+            line = f"{prefix}{os.path.basename(line)}"
+            if query:
+                line = f"{line}?{query}"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+settings = get_settings()
+
+# Global HLS session manager instance
+hls_sessions = HLSSessionManager(
+    base_path=settings.hls_session_path,
+    segment_seconds=settings.hls_segment_seconds,
+    list_size=settings.hls_list_size,
+    idle_timeout=settings.hls_idle_timeout,
+    start_timeout=settings.hls_start_timeout,
+)
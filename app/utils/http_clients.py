@@ -0,0 +1,428 @@
+"""
+Application-scoped upstream HTTP clients
+
+Creating an ``httpx.AsyncClient`` per request pays DNS, TCP and TLS setup
+every time. This registry keeps one long-lived client per purpose
+(stream proxying, playlist downloads, EPG downloads, probes) with its own
+timeouts, keep-alive pool and per-host connection cap, plus a small
+shared DNS cache. Clients are created lazily and closed on app shutdown.
+
+Requests go through ``upstream_proxy`` if set, else through the proxies
+in the usual HTTP_PROXY / HTTPS_PROXY / ALL_PROXY / NO_PROXY variables.
+"""
+
+import asyncio
+import logging
+import socket
+import time
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import httpcore
+import httpx
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs the optional 'h2' package
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+settings = get_settings()
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': '*/*',
+}
+
+
+@dataclass
+class ClientProfile:
+    """Connection settings for one purpose"""
+    timeout: httpx.Timeout
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    max_connections_per_host: int
+    # False: the per-host cap only covers connecting and the response headers,
+    # not reading the body (long-lived streams are capped by tuner slots instead)
+    hold_host_slot: bool = True
+    http2: bool = False
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+PROFILES: Dict[str, ClientProfile] = {
+    # Live stream pulls: fail fast on connect, tolerate short read stalls
+    "stream": ClientProfile(
+        timeout=httpx.Timeout(connect=5.0, read=30.0, write=10.0, pool=10.0),
+        max_connections=500,
+        max_keepalive_connections=50,
+        keepalive_expiry=30.0,
+        max_connections_per_host=settings.upstream_max_connections_per_host,
+        hold_host_slot=False,
+        http2=settings.upstream_http2,
+    ),
+    # Large playlist downloads from slow, dynamically generating servers
+    "playlist": ClientProfile(
+        timeout=httpx.Timeout(connect=30.0, read=300.0, write=30.0, pool=30.0),
+        max_connections=20,
+        max_keepalive_connections=5,
+        keepalive_expiry=60.0,
+        max_connections_per_host=4,
+        http2=settings.upstream_http2,
+    ),
+    "epg": ClientProfile(
+        timeout=httpx.Timeout(connect=30.0, read=120.0, write=30.0, pool=30.0),
+        max_connections=20,
+        max_keepalive_connections=5,
+        keepalive_expiry=60.0,
+        max_connections_per_host=4,
+        http2=settings.upstream_http2,
+    ),
+    # Reachability checks and stream probes
+    "probe": ClientProfile(
+        timeout=httpx.Timeout(connect=5.0, read=10.0, write=5.0, pool=10.0),
+        max_connections=200,
+        max_keepalive_connections=50,
+        keepalive_expiry=15.0,
+        max_connections_per_host=settings.upstream_max_connections_per_host,
+    ),
+}
+
+
+class DNSCache:
+    """TTL cache of resolved addresses shared by all clients"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, host: str, port: int) -> List[str]:
+        key = (host, port)
+        cached = self.entries.get(key)
+        if cached and cached[0] > time.monotonic():
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self.entries[key] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def forget(self, host: str, port: int):
+        self.entries.pop((host, port), None)
+
+
+def _is_ip_address(host: str) -> bool:
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+            return True
+        except (OSError, ValueError):
+            pass
+    return False
+
+
+class CachingNetworkBackend(httpcore.AsyncNetworkBackend):
+    """Resolves hostnames through the DNS cache before connecting.
+
+    TLS still verifies against the original hostname: httpcore passes the
+    request host as SNI/server_hostname separately from the TCP address.
+    """
+
+    def __init__(self, dns_cache: DNSCache):
+        self.dns_cache = dns_cache
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        if _is_ip_address(host):
+            return await self._backend.connect_tcp(host, port, timeout, local_address, socket_options)
+
+        addresses = await self.dns_cache.resolve(host, port)
+        last_error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                last_error = e
+        # Every cached address failed; resolve afresh next time
+        self.dns_cache.forget(host, port)
+        raise last_error or httpcore.ConnectError(f"No addresses for {host}")
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+# httpcore errors and the httpx errors callers catch, most specific first
+HTTPCORE_ERRORS = (
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.NetworkError, httpx.NetworkError),
+    (httpcore.ProxyError, httpx.ProxyError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.ProtocolError, httpx.ProtocolError),
+)
+
+
+@contextmanager
+def _httpx_errors(request: httpx.Request):
+    try:
+        yield
+    except Exception as e:
+        for core_error, httpx_error in HTTPCORE_ERRORS:
+            if isinstance(e, core_error):
+                raise httpx_error(str(e), request=request) from e
+        raise
+
+
+def _core_proxy(url: str) -> httpcore.Proxy:
+    """httpcore proxy for a URL, credentials taken out of it"""
+    proxy_url = httpx.URL(url)
+    auth = (proxy_url.username, proxy_url.password) if proxy_url.username else None
+    return httpcore.Proxy(url=str(proxy_url.copy_with(username=None, password=None)), auth=auth)
+
+
+class _HostLimit:
+    """Per-host semaphore; dropped from the map once nobody uses or waits on it"""
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0  # Holding or waiting
+        self.in_flight = 0
+
+
+class _ResponseStream(httpx.AsyncByteStream):
+    """Response body: maps httpcore errors and frees the host slot when closed"""
+
+    def __init__(self, stream, request: httpx.Request, release):
+        self._stream = stream
+        self._request = request
+        self._release = release
+
+    async def __aiter__(self):
+        with _httpx_errors(self._request):
+            async for chunk in self._stream:
+                yield chunk
+
+    async def aclose(self):
+        try:
+            with _httpx_errors(self._request):
+                await self._stream.aclose()
+        finally:
+            if self._release:
+                release, self._release = self._release, None
+                release()
+
+
+class PooledTransport(httpx.AsyncBaseTransport):
+    """httpx transport over an httpcore pool with cached DNS and a per-host connection cap"""
+
+    def __init__(self, profile: ClientProfile, dns_cache: DNSCache, proxy: Optional[str] = None):
+        http2 = profile.http2 and HTTP2_AVAILABLE
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            proxy=_core_proxy(proxy) if proxy else None,
+            max_connections=profile.max_connections,
+            max_keepalive_connections=profile.max_keepalive_connections,
+            keepalive_expiry=profile.keepalive_expiry,
+            http1=True,
+            http2=http2,
+            network_backend=CachingNetworkBackend(dns_cache),
+        )
+        self.http2 = http2
+        self.proxy = proxy
+        self.max_per_host = profile.max_connections_per_host
+        self.hold_host_slot = profile.hold_host_slot
+        self.pool_timeout = profile.timeout.pool
+        self.hosts: Dict[str, _HostLimit] = {}
+        self.requests = 0
+
+    async def _acquire_host(self, request: httpx.Request) -> _HostLimit:
+        host = request.url.host
+        limit = self.hosts.get(host)
+        if limit is None:
+            limit = self.hosts[host] = _HostLimit(self.max_per_host)
+        limit.users += 1
+        try:
+            await asyncio.wait_for(limit.semaphore.acquire(), timeout=self.pool_timeout)
+        except BaseException as e:
+            self._forget_host(host, limit)
+            if isinstance(e, asyncio.TimeoutError):
+                raise httpx.PoolTimeout(
+                    f"Too many concurrent connections to {host} (limit {self.max_per_host})",
+                    request=request,
+                )
+            raise
+        limit.in_flight += 1
+        return limit
+
+    def _release_host(self, host: str, limit: _HostLimit):
+        limit.in_flight -= 1
+        limit.semaphore.release()
+        self._forget_host(host, limit)
+
+    def _forget_host(self, host: str, limit: _HostLimit):
+        limit.users -= 1
+        if not limit.users and self.hosts.get(host) is limit:
+            del self.hosts[host]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        limit = await self._acquire_host(request)
+        self.requests += 1
+
+        def release():
+            self._release_host(host, limit)
+
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        try:
+            with _httpx_errors(request):
+                response = await self._pool.handle_async_request(core_request)
+        except BaseException:
+            release()
+            raise
+        if not self.hold_host_slot:
+            release()
+            release = None
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=_ResponseStream(response.stream, request, release),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._pool.aclose()
+
+    def get_stats(self) -> Dict:
+        connections = self._pool.connections
+        return {
+            "http2": self.http2,
+            "proxy": bool(self.proxy),
+            "requests": self.requests,
+            "connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "in_flight_by_host": {host: limit.in_flight for host, limit in self.hosts.items() if limit.in_flight},
+        }
+
+
+def proxy_routes(proxy: str) -> Dict[str, Optional[str]]:
+    """Mount pattern -> proxy URL (None = direct).
+
+    ``proxy`` applies to everything; without it the standard proxy
+    environment variables are used.
+    """
+    if proxy:
+        return {"all://": proxy}
+    routes: Dict[str, Optional[str]] = {}
+    env = urllib.request.getproxies()
+    for scheme in ("all", "http", "https"):
+        if env.get(scheme):
+            url = env[scheme] if "://" in env[scheme] else f"http://{env[scheme]}"
+            routes[f"{scheme}://"] = url
+    for host in (h.strip() for h in env.get("no", "").split(",")):
+        if host == "*":
+            return {}
+        if host:
+            host = host.lstrip("*.")
+            routes[f"all://{host}"] = None
+            routes[f"all://*.{host}"] = None
+    return routes if any(routes.values()) else {}
+
+
+class HTTPClientRegistry:
+    """Lazily creates and owns one AsyncClient per purpose"""
+
+    def __init__(self, dns_cache_ttl: int, proxy_routes: Dict[str, Optional[str]]):
+        self.dns_cache = DNSCache(dns_cache_ttl)
+        self.proxy_routes = proxy_routes
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        # purpose -> direct transport first, then one per proxy
+        self.transports: Dict[str, List[PooledTransport]] = {}
+
+    def get(self, purpose: str) -> httpx.AsyncClient:
+        """Shared client for ``purpose`` (one of PROFILES). Do not close it."""
+        client = self.clients.get(purpose)
+        if client is None or client.is_closed:
+            profile = PROFILES[purpose]
+            transport = PooledTransport(profile, self.dns_cache)
+            # A custom transport turns off httpx's own proxy handling, so mount ours
+            proxied: Dict[str, PooledTransport] = {}
+            mounts: Dict[str, httpx.AsyncBaseTransport] = {}
+            for pattern, proxy in self.proxy_routes.items():
+                if proxy is None:
+                    mounts[pattern] = transport
+                else:
+                    if proxy not in proxied:
+                        proxied[proxy] = PooledTransport(profile, self.dns_cache, proxy=proxy)
+                    mounts[pattern] = proxied[proxy]
+            client = httpx.AsyncClient(
+                transport=transport,
+                mounts=mounts,
+                timeout=profile.timeout,
+                headers={**DEFAULT_HEADERS, **profile.headers},
+                follow_redirects=True,
+            )
+            self.clients[purpose] = client
+            self.transports[purpose] = [transport, *proxied.values()]
+            logger.info(f"Created pooled HTTP client '{purpose}' (http2={transport.http2}, proxies={len(proxied)})")
+        return client
+
+    async def close(self):
+        for purpose, client in list(self.clients.items()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"Error closing HTTP client '{purpose}': {e}")
+        self.clients.clear()
+        self.transports.clear()
+
+    def get_stats(self) -> Dict:
+        return {
+            "http2_available": HTTP2_AVAILABLE,
+            "dns_cache": {
+                "entries": len(self.dns_cache.entries),
+                "hits": self.dns_cache.hits,
+                "misses": self.dns_cache.misses,
+            },
+            "clients": {
+                purpose: [transport.get_stats() for transport in transports]
+                for purpose, transports in self.transports.items()
+            },
+        }
+
+
+# Global HTTP client registry
+http_clients = HTTPClientRegistry(settings.upstream_dns_cache_ttl, proxy_routes(settings.upstream_proxy))
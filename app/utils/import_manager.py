@@ -8,6 +8,7 @@ from datetime import datetime
 import logging
 import aiofiles
 import httpx
+from app.utils.http_clients import http_clients
 from pathlib import Path
 import multiprocessing
 
@@ -207,19 +208,10 @@ class ImportManager:
         
         logger.info(f"Starting download from: {job.url}")
         
-        # Configure client with streaming support
-        timeout = httpx.Timeout(
-            connect=30.0,
-            read=300.0,  # 5 minute read timeout for large files
-            write=30.0,
-            pool=30.0
-        )
-        
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept': '*/*',
             'Accept-Encoding': 'identity',  # Don't use compression for M3U files to avoid issues
-            'Connection': 'keep-alive',
             'Cache-Control': 'no-cache'
         }
         
@@ -227,108 +219,111 @@ class ImportManager:
         if start_byte > 0:
             headers['Range'] = f'bytes={start_byte}-'
         
-        async with httpx.AsyncClient(timeout=timeout, headers=headers, follow_redirects=True) as client:
-            try:
-                # Get total size first
-                if job.total_size == 0:
-                    try:
-                        logger.info("Checking file size with HEAD request...")
-                        head_response = await client.head(job.url)
-                        job.total_size = int(head_response.headers.get('content-length', 0))
-                        logger.info(f"File size: {job.total_size/1024/1024:.1f} MB")
-                    except Exception as e:
-                        logger.warning(f"HEAD request failed: {e}")
+        # Shared keep-alive client; long read timeout for large files
+        client = http_clients.get("playlist")
+        head_headers = {k: v for k, v in headers.items() if k != 'Range'}
+        
+        try:
+            # Get total size first
+            if job.total_size == 0:
+                try:
+                    logger.info("Checking file size with HEAD request...")
+                    head_response = await client.head(job.url, headers=head_headers)
+                    job.total_size = int(head_response.headers.get('content-length', 0))
+                    logger.info(f"File size: {job.total_size/1024/1024:.1f} MB")
+                except Exception as e:
+                    logger.warning(f"HEAD request failed: {e}")
+            
+            # Update status
+            await self._update_job(job, "downloading", 5, "Starting download...")
+            
+            # Stream download
+            logger.info("Starting GET request to download file...")
+            async with client.stream('GET', job.url, headers=headers) as response:
+                response.raise_for_status()
                 
-                # Update status
-                await self._update_job(job, "downloading", 5, "Starting download...")
+                # Check if server supports resume
+                if start_byte > 0 and response.status_code != 206:
+                    logger.warning("Server doesn't support resume, starting from beginning")
+                    start_byte = 0
+                    temp_file.unlink()
                 
-                # Stream download
-                logger.info("Starting GET request to download file...")
-                async with client.stream('GET', job.url) as response:
-                    response.raise_for_status()
-                    
-                    # Check if server supports resume
-                    if start_byte > 0 and response.status_code != 206:
-                        logger.warning("Server doesn't support resume, starting from beginning")
-                        start_byte = 0
-                        temp_file.unlink()
+                # Get content length
+                content_length = int(response.headers.get('content-length', 0))
+                if content_length > 0 and job.total_size == 0:
+                    job.total_size = content_length + start_byte
+                
+                # Open file for append or write
+                mode = 'ab' if start_byte > 0 else 'wb'
+                async with aiofiles.open(temp_file, mode) as f:
+                    downloaded = start_byte
+                    chunk_size = 1024 * 1024  # 1MB chunks
+                    last_update = time.time()
                     
-                    # Get content length
-                    content_length = int(response.headers.get('content-length', 0))
-                    if content_length > 0 and job.total_size == 0:
-                        job.total_size = content_length + start_byte
+                    # Log initial download start
+                    logger.info(f"Starting to download chunks (chunk size: {chunk_size/1024:.0f} KB)")
+                    chunk_count = 0
                     
-                    # Open file for append or write
-                    mode = 'ab' if start_byte > 0 else 'wb'
-                    async with aiofiles.open(temp_file, mode) as f:
-                        downloaded = start_byte
-                        chunk_size = 1024 * 1024  # 1MB chunks
-                        last_update = time.time()
+                    async for chunk in response.aiter_bytes(chunk_size):
+                        if not chunk:
+                            break
                         
-                        # Log initial download start
-                        logger.info(f"Starting to download chunks (chunk size: {chunk_size/1024:.0f} KB)")
-                        chunk_count = 0
+                        chunk_count += 1
+                        await f.write(chunk)
+                        downloaded += len(chunk)
+                        job.downloaded_size = downloaded
                         
-                        async for chunk in response.aiter_bytes(chunk_size):
-                            if not chunk:
-                                break
-                            
-                            chunk_count += 1
-                            await f.write(chunk)
-                            downloaded += len(chunk)
-                            job.downloaded_size = downloaded
+                        # Log first few chunks for debugging
+                        if chunk_count <= 5:
+                            logger.info(f"Downloaded chunk {chunk_count}: {len(chunk)} bytes (total: {downloaded/1024/1024:.1f} MB)")
+                        
+                        # Update progress every second
+                        current_time = time.time()
+                        if current_time - last_update > 1:
+                            elapsed = current_time - last_update
+                            progress = (downloaded / job.total_size * 40) if job.total_size > 0 else min(20 + (downloaded / 1024 / 1024), 40)
+                            speed = len(chunk) / elapsed / 1024 / 1024  # MB/s
                             
-                            # Log first few chunks for debugging
-                            if chunk_count <= 5:
-                                logger.info(f"Downloaded chunk {chunk_count}: {len(chunk)} bytes (total: {downloaded/1024/1024:.1f} MB)")
+                            # Log progress every 10 seconds for debugging
+                            if chunk_count % 10 == 0:
+                                logger.info(f"Download progress: {downloaded/1024/1024:.1f} MB at {speed:.1f} MB/s")
                             
-                            # Update progress every second
-                            current_time = time.time()
-                            if current_time - last_update > 1:
-                                elapsed = current_time - last_update
-                                progress = (downloaded / job.total_size * 40) if job.total_size > 0 else min(20 + (downloaded / 1024 / 1024), 40)
-                                speed = len(chunk) / elapsed / 1024 / 1024  # MB/s
-                                
-                                # Log progress every 10 seconds for debugging
-                                if chunk_count % 10 == 0:
-                                    logger.info(f"Download progress: {downloaded/1024/1024:.1f} MB at {speed:.1f} MB/s")
-                                
-                                size_text = f"{job.total_size/1024/1024:.1f} MB" if job.total_size > 0 else "unknown size"
-                                await self._update_job(
-                                    job, "downloading", progress,
-                                    f"Downloading... {downloaded/1024/1024:.1f}/{size_text} ({speed:.2f} MB/s)",
-                                    {"downloaded": downloaded, "total": job.total_size, "speed": speed}
-                                )
-                                last_update = current_time
-                
-                # Log download completion
-                final_size = temp_file.stat().st_size
-                logger.info(f"Download completed! Final size: {final_size/1024/1024:.1f} MB ({chunk_count} chunks)")
-                
-                # Verify download
-                if final_size == 0:
-                    raise Exception("Downloaded file is empty")
-                
-                # Quick validation
-                with open(temp_file, 'r', encoding='utf-8', errors='ignore') as f:
-                    first_line = f.readline().strip()
-                    if not first_line.startswith('#EXTM3U'):
-                        logger.warning(f"File may not be M3U format. First line: {first_line[:100]}")
-                    else:
-                        logger.info("File validated as M3U format")
-                
-                await self._update_job(job, "downloading", 45, f"Download completed ({final_size/1024/1024:.1f} MB)")
-                return temp_file
-                
-            except httpx.ConnectError:
-                raise Exception("Unable to connect to server")
-            except httpx.TimeoutException:
-                raise Exception("Download timed out - you can retry to resume")
-            except Exception as e:
-                # Save progress for resume
-                if temp_file.exists() and temp_file.stat().st_size > 0:
-                    logger.info(f"Download interrupted at {temp_file.stat().st_size} bytes, can resume")
-                raise
+                            size_text = f"{job.total_size/1024/1024:.1f} MB" if job.total_size > 0 else "unknown size"
+                            await self._update_job(
+                                job, "downloading", progress,
+                                f"Downloading... {downloaded/1024/1024:.1f}/{size_text} ({speed:.2f} MB/s)",
+                                {"downloaded": downloaded, "total": job.total_size, "speed": speed}
+                            )
+                            last_update = current_time
+            
+            # Log download completion
+            final_size = temp_file.stat().st_size
+            logger.info(f"Download completed! Final size: {final_size/1024/1024:.1f} MB ({chunk_count} chunks)")
+            
+            # Verify download
+            if final_size == 0:
+                raise Exception("Downloaded file is empty")
+            
+            # Quick validation
+            with open(temp_file, 'r', encoding='utf-8', errors='ignore') as f:
+                first_line = f.readline().strip()
+                if not first_line.startswith('#EXTM3U'):
+                    logger.warning(f"File may not be M3U format. First line: {first_line[:100]}")
+                else:
+                    logger.info("File validated as M3U format")
+            
+            await self._update_job(job, "downloading", 45, f"Download completed ({final_size/1024/1024:.1f} MB)")
+            return temp_file
+            
+        except httpx.ConnectError:
+            raise Exception("Unable to connect to server")
+        except httpx.TimeoutException:
+            raise Exception("Download timed out - you can retry to resume")
+        except Exception as e:
+            # Save progress for resume
+            if temp_file.exists() and temp_file.stat().st_size > 0:
+                logger.info(f"Download interrupted at {temp_file.stat().st_size} bytes, can resume")
+            raise
     
     async def _import_channels(self, job: ImportJob, channels_data: list):
         """Import channels to database"""
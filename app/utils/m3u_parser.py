@@ -1,5 +1,5 @@
 import re
-import httpx
+from app.utils.http_clients import http_clients
 from typing import List, Dict, Optional, Callable
 from urllib.parse import unquote
 import tempfile
@@ -36,72 +36,65 @@ class M3UParser:
         temp_file = Path(tempfile.mktemp(suffix='.m3u'))
         
         try:
-            # Configure client with longer timeout for dynamic URLs
-            timeout = httpx.Timeout(
-                connect=30.0,
-                read=300.0,
-                write=30.0,
-                pool=30.0
-            )
-            
             # Custom headers to appear as a legitimate client
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
                 'Accept-Language': 'en-US,en;q=0.5',
                 'Accept-Encoding': 'gzip, deflate',
-                'Connection': 'keep-alive',
                 'Upgrade-Insecure-Requests': '1'
             }
             
-            async with httpx.AsyncClient(timeout=timeout, headers=headers, follow_redirects=True) as client:
-                # First, try a HEAD request to check if server supports it
-                try:
-                    head_response = await client.head(url, follow_redirects=True)
-                    total_size = int(head_response.headers.get('content-length', 0))
-                except:
-                    total_size = 0
-                
-                if self.progress_callback:
-                    await self.progress_callback(
-                        status="connecting",
-                        progress=0,
-                        message="Connecting to server...",
-                        details={"url": url}
-                    )
-                
-                # For dynamic URLs that generate content, we might need to wait
-                if self.progress_callback:
-                    await self.progress_callback(
-                        status="downloading",
-                        progress=5,
-                        message="Requesting playlist from server...",
-                        details={"step": "request"}
-                    )
-                
-                # Try direct download first (for dynamic generation URLs)
-                response = await client.get(url, follow_redirects=True)
-                
-                if response.status_code != 200:
-                    raise Exception(f"Server returned status {response.status_code}")
-                
-                content_type = response.headers.get('content-type', '')
-                logger.info(f"Content-Type: {content_type}")
-                logger.info(f"Response size: {len(response.content)} bytes")
-                
-                # Write content to file
-                async with aiofiles.open(temp_file, 'wb') as f:
-                    await f.write(response.content)
-                
-                downloaded = len(response.content)
-                
-                if self.progress_callback:
-                    await self.progress_callback(
-                        status="downloading",
-                        progress=50,
-                        message=f"Downloaded playlist ({downloaded/1024/1024:.1f} MB)",
-                        details={"downloaded": downloaded}
-                    )
+            # Shared keep-alive client with long read timeouts for dynamic URLs
+            client = http_clients.get("playlist")
+            
+            # First, try a HEAD request to check if server supports it
+            try:
+                head_response = await client.head(url, headers=headers)
+                total_size = int(head_response.headers.get('content-length', 0))
+            except:
+                total_size = 0
+            
+            if self.progress_callback:
+                await self.progress_callback(
+                    status="connecting",
+                    progress=0,
+                    message="Connecting to server...",
+                    details={"url": url}
+                )
+            
+            # For dynamic URLs that generate content, we might need to wait
+            if self.progress_callback:
+                await self.progress_callback(
+                    status="downloading",
+                    progress=5,
+                    message="Requesting playlist from server...",
+                    details={"step": "request"}
+                )
+            
+            # Try direct download first (for dynamic generation URLs)
+            response = await client.get(url, headers=headers)
+            
+            if response.status_code != 200:
+                raise Exception(f"Server returned status {response.status_code}")
+            
+            content_type = response.headers.get('content-type', '')
+            logger.info(f"Content-Type: {content_type}")
+            logger.info(f"Response size: {len(response.content)} bytes")
+            
+            # Write content to file
+            async with aiofiles.open(temp_file, 'wb') as f:
+                await f.write(response.content)
+            
+            downloaded = len(response.content)
+            
+            if self.progress_callback:
+                await self.progress_callback(
+                    status="downloading",
+                    progress=50,
+                    message=f"Downloaded playlist ({downloaded/1024/1024:.1f} MB)",
+                    details={"downloaded": downloaded}
+                )
             
             # Verify the file is valid M3U
             if temp_file.stat().st_size == 0:
@@ -0,0 +1,267 @@
+"""
+MPEG-TS packet helpers
+
+Just enough transport stream parsing for the proxy and recorder: packet
+alignment, finding the video PID from the PAT/PMT, random-access
+(keyframe) detection from the adaptation field, continuity counter
+checks and reading the PTS off a PES header. No payload demuxing is done
+here.
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+PAT_PID = 0x0000
+NULL_PID = 0x1FFF
+
+# PMT stream_type values that carry video: MPEG-1/2, MPEG-4 part 2, H.264,
+# H.264 SVC/MVC, HEVC, AVS, Dirac, VC-1
+VIDEO_STREAM_TYPES = {0x01, 0x02, 0x10, 0x1B, 0x1F, 0x20, 0x24, 0x42, 0xD1, 0xEA}
+
+# How many consecutive sync bytes are required before trusting an offset
+_SYNC_CONFIRMATIONS = 3
+
+
+def find_sync(data: bytes, start: int = 0) -> int:
+    """Return the offset of the first confirmed packet boundary, or -1"""
+    needed = TS_PACKET_SIZE * (_SYNC_CONFIRMATIONS - 1)
+    offset = data.find(bytes([TS_SYNC_BYTE]), start)
+    while offset != -1 and offset + needed < len(data):
+        if all(data[offset + i * TS_PACKET_SIZE] == TS_SYNC_BYTE for i in range(1, _SYNC_CONFIRMATIONS)):
+            return offset
+        offset = data.find(bytes([TS_SYNC_BYTE]), offset + 1)
+    return -1
+
+
+def packet_pid(packet: bytes) -> int:
+    return ((packet[1] & 0x1F) << 8) | packet[2]
+
+
+def is_random_access(packet: bytes) -> bool:
+    """True if the packet's adaptation field sets random_access_indicator.
+
+    Encoders set this on the packet that starts a keyframe (IDR/I-frame),
+    which is where a decoder joining mid-stream can begin.
+    """
+    adaptation_field_control = (packet[3] >> 4) & 0x3
+    if adaptation_field_control not in (2, 3):
+        return False
+    if packet[4] == 0:
+        return False
+    return bool(packet[5] & 0x40)
+
+
+def _payload_start(packet: bytes) -> Optional[int]:
+    """Offset of the payload in a packet, or None if it carries none"""
+    adaptation_field_control = (packet[3] >> 4) & 0x3
+    if adaptation_field_control == 1:
+        return 4
+    if adaptation_field_control == 3:
+        return 5 + packet[4]
+    return None
+
+
+def _psi_section(packet: bytes) -> Optional[bytes]:
+    """The PSI section starting in this packet, cut to its section_length.
+
+    Sections continued in later packets come back truncated; PAT and PMT
+    almost always fit in one packet.
+    """
+    if not packet[1] & 0x40:  # payload_unit_start_indicator
+        return None
+    start = _payload_start(packet)
+    if start is None or start >= len(packet):
+        return None
+    start += 1 + packet[start]  # pointer_field
+    section = packet[start:]
+    if len(section) < 3:
+        return None
+    return section[:3 + (((section[1] & 0x0F) << 8) | section[2])]
+
+
+class ProgramMap:
+    """Tracks which PID carries the video, from the PAT and PMT.
+
+    Only the video PID's random access indicator marks a keyframe: audio
+    encoders set it on every frame, so honouring it there would put join
+    points and index entries where a decoder can't start. Until a PMT
+    listing video has been seen, no packet counts as a keyframe.
+    """
+
+    def __init__(self):
+        self.pmt_pids: Set[int] = set()
+        self.video_pid: Optional[int] = None
+        self._video_pmt: Optional[int] = None  # PMT PID that announced video_pid
+
+    def wants(self, pid: int) -> bool:
+        """True for PIDs carrying tables ``update`` reads"""
+        return pid == PAT_PID or pid in self.pmt_pids
+
+    def update(self, packet: bytes):
+        """Read the PAT or a PMT out of a whole packet"""
+        pid = packet_pid(packet)
+        section = _psi_section(packet)
+        if section is None:
+            return
+        if pid == PAT_PID and section[0] == 0x00:
+            # Program loop: program_number(16) + PID(13), CRC excluded
+            pmt_pids = set()
+            for i in range(8, len(section) - 4 - 3, 4):
+                if section[i] or section[i + 1]:  # Program 0 is the network PID
+                    pmt_pids.add(((section[i + 2] & 0x1F) << 8) | section[i + 3])
+            self.pmt_pids = pmt_pids
+        elif pid in self.pmt_pids and section[0] == 0x02 and len(section) >= 12:
+            i = 12 + (((section[10] & 0x0F) << 8) | section[11])
+            while i + 5 <= len(section) - 4:
+                stream_type = section[i]
+                es_pid = ((section[i + 1] & 0x1F) << 8) | section[i + 2]
+                if stream_type in VIDEO_STREAM_TYPES:
+                    # The first program with video wins; a new version of its PMT may move it
+                    if self._video_pmt in (None, pid):
+                        self.video_pid, self._video_pmt = es_pid, pid
+                    return
+                i += 5 + (((section[i + 3] & 0x0F) << 8) | section[i + 4])
+            if self._video_pmt == pid:
+                self.video_pid = self._video_pmt = None
+
+    def is_keyframe(self, packet: bytes) -> bool:
+        """True if the packet starts a video keyframe"""
+        return self.video_pid is not None and packet_pid(packet) == self.video_pid and is_random_access(packet)
+
+
+def pes_pts(packet: bytes) -> Optional[int]:
+    """PTS (90 kHz ticks) of the PES header starting in this packet, if any"""
+    if not packet[1] & 0x40:  # payload_unit_start_indicator
+        return None
+    start = _payload_start(packet)
+    if start is None:
+        return None
+    pes = packet[start:start + 14]
+    if len(pes) < 14 or pes[0:3] != b"\x00\x00\x01" or not pes[7] & 0x80:
+        return None
+    return (
+        ((pes[9] >> 1) & 0x07) << 30
+        | pes[10] << 22
+        | (pes[11] >> 1) << 15
+        | pes[12] << 7
+        | pes[13] >> 1
+    )
+
+
+def random_access_offsets(data: bytes, programs: ProgramMap) -> List[int]:
+    """Offsets of video keyframe packets in packet-aligned data.
+
+    ``programs`` is updated from the PAT/PMT packets on the way, so pass
+    the same map for every chunk of one stream.
+    """
+    offsets = []
+    for offset in range(0, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        if data[offset] != TS_SYNC_BYTE:
+            continue
+        pid = packet_pid(data[offset:offset + 3])
+        if pid == programs.video_pid:
+            if is_random_access(data[offset:offset + 6]):
+                offsets.append(offset)
+        elif programs.wants(pid):
+            programs.update(data[offset:offset + TS_PACKET_SIZE])
+    return offsets
+
+
+class PacketAligner:
+    """Re-chunks an arbitrary byte stream into whole TS packets.
+
+    ``feed`` returns packet-aligned bytes (possibly empty). Until sync is
+    found the stream is treated as unknown; ``is_ts`` becomes False if no
+    sync shows up within ``probe_limit`` bytes, after which data is passed
+    through untouched.
+    """
+
+    def __init__(self, probe_limit: int = 64 * 1024):
+        self.probe_limit = probe_limit
+        self.is_ts: Optional[bool] = None
+        self._pending = b""
+
+    def feed(self, data: bytes) -> bytes:
+        if self.is_ts is False:
+            return data
+
+        buffer = self._pending + data
+        if self.is_ts is None:
+            offset = find_sync(buffer)
+            if offset == -1:
+                if len(buffer) >= self.probe_limit:
+                    self.is_ts = False
+                    self._pending = b""
+                    return buffer
+                self._pending = buffer
+                return b""
+            self.is_ts = True
+            buffer = buffer[offset:]
+        elif buffer and buffer[0] != TS_SYNC_BYTE:
+            # Lost sync mid-stream: drop bytes up to the next boundary
+            offset = find_sync(buffer)
+            if offset == -1:
+                self._pending = buffer[-TS_PACKET_SIZE * _SYNC_CONFIRMATIONS:]
+                return b""
+            buffer = buffer[offset:]
+
+        usable = len(buffer) - (len(buffer) % TS_PACKET_SIZE)
+        self._pending = buffer[usable:]
+        return buffer[:usable]
+
+    def flush(self) -> bytes:
+        remaining, self._pending = self._pending, b""
+        return remaining
+
+
+class ContinuityChecker:
+    """Counts continuity_counter discontinuities per PID.
+
+    Gaps usually mean packets were lost upstream or on the network.
+    """
+
+    def __init__(self):
+        self.last_counter: Dict[int, int] = {}
+        self.errors = 0
+        self.packets = 0
+
+    def check(self, data: bytes) -> int:
+        """Check packet-aligned data and return the number of new errors"""
+        new_errors = 0
+        for offset in range(0, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+            packet = data[offset:offset + 4]
+            if packet[0] != TS_SYNC_BYTE:
+                continue
+            self.packets += 1
+            pid = packet_pid(packet)
+            if pid == NULL_PID:
+                continue
+            adaptation_field_control = (packet[3] >> 4) & 0x3
+            counter = packet[3] & 0x0F
+            last = self.last_counter.get(pid)
+            # Counter only increments for packets carrying payload; a repeat is allowed once
+            if last is not None and adaptation_field_control in (1, 3):
+                if counter != (last + 1) & 0x0F and counter != last:
+                    new_errors += 1
+            self.last_counter[pid] = counter
+        self.errors += new_errors
+        return new_errors
+
+
+def split_at_random_access(data: bytes, programs: ProgramMap) -> List[Tuple[bytes, bool]]:
+    """Split packet-aligned data so every video keyframe starts its own piece.
+
+    Returns ``(piece, starts_with_keyframe)`` tuples in stream order.
+    """
+    offsets = random_access_offsets(data, programs)
+    if not offsets:
+        return [(data, False)] if data else []
+
+    pieces = []
+    if offsets[0] > 0:
+        pieces.append((data[:offsets[0]], False))
+    for i, start in enumerate(offsets):
+        end = offsets[i + 1] if i + 1 < len(offsets) else len(data)
+        pieces.append((data[start:end], True))
+    return pieces
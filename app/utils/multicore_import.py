@@ -25,6 +25,7 @@ from sqlalchemy.orm import sessionmaker
 
 from app.models import Channel, Playlist
 from app.config import get_settings
+from app.utils.change_tracker import change_tracker
 
 logger = logging.getLogger(__name__)
 
@@ -404,6 +405,8 @@ async def optimize_import_with_multicore(
             m3u_content,
             progress_callback
         )
+        # Worker processes write through their own engines, invisible to session events
+        change_tracker.mark_changed("channels")
         return result
     finally:
         manager.cleanup()
\ No newline at end of file
@@ -0,0 +1,419 @@
+"""
+Recording post-processing
+
+Finished recordings go through a configurable list of stages
+(``postprocess_stages``), each writing a sidecar file next to the
+recording:
+
+    index      keyframe index (byte offset and time of every keyframe), .index.json
+    checksum   SHA-256 of the file, .sha256
+    thumbnail  JPEG from the middle of the recording (ffmpeg), .jpg
+    remux      MP4 copy of the streams (ffmpeg), .mp4
+
+Stages run in a process pool of ``postprocess_workers`` processes at
+``postprocess_nice`` CPU priority and idle I/O priority, so scanning or
+remuxing a multi-gigabyte file never competes with live captures or
+blocks the event loop. A recording shared by several users (hardlinked
+capture) is processed once; the sidecars are linked to every copy.
+
+Job state (stages done, per-stage timings and errors) is persisted to
+``postprocess_state_path`` after every stage and unfinished jobs are
+resumed on startup. Failed stages are not retried.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import psutil
+
+from app.config import get_settings
+from app.utils.mpegts import PAT_PID, TS_PACKET_SIZE, TS_SYNC_BYTE, ProgramMap, packet_pid, pes_pts
+
+logger = logging.getLogger(__name__)
+
+SIDECARS = {
+    "index": ".index.json",
+    "checksum": ".sha256",
+    "thumbnail": ".jpg",
+    "remux": ".mp4",
+}
+READ_SIZE = TS_PACKET_SIZE * 8192  # ~1.5 MB
+FFMPEG_TIMEOUT = 3600
+FINISHED_KEPT = 200  # Finished jobs kept in the state file for inspection
+PTS_WRAP = 1 << 33
+PAT_LOOKBACK = TS_PACKET_SIZE * 16  # How far before a keyframe a PAT still counts as its entry point
+
+
+def sidecar_path(path: str, stage: str) -> str:
+    return os.path.splitext(path)[0] + SIDECARS[stage]
+
+
+def remove_sidecars(path: str):
+    """Delete the post-processing outputs of a recording"""
+    for stage in SIDECARS:
+        try:
+            os.remove(sidecar_path(path, stage))
+        except OSError:
+            pass
+
+
+def load_index(path: str) -> Optional[Dict]:
+    """The keyframe index of a recording, if the index stage has run"""
+    try:
+        with open(sidecar_path(path, "index")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ---- Stages (run in worker processes) ----
+
+def _lower_priority(nice: int):
+    """Process pool initializer"""
+    try:
+        os.nice(nice)
+        psutil.Process().ionice(psutil.IOPRIO_CLASS_IDLE)
+    except (OSError, AttributeError, ValueError):
+        pass  # ionice is Linux-only
+
+
+def _write_atomic(path: str, write: Callable):
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def stage_index(path: str, duration: float) -> Dict:
+    """Entry points and times of keyframes.
+
+    An entry point is the PAT right before a keyframe when the muxer wrote
+    one there (so a segment starting at it carries its own PAT/PMT), else
+    the keyframe packet itself. Times come from the keyframe's PTS; files
+    without PTS on keyframe packets fall back to an estimate from the
+    average byte rate.
+    """
+    size = os.path.getsize(path)
+    keyframes = []
+    first_pts = None
+    programs = ProgramMap()
+    last_pat = None
+    with open(path, "rb") as f:
+        base = 0
+        while True:
+            data = f.read(READ_SIZE)
+            if not data:
+                break
+            for offset in range(0, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+                packet = data[offset:offset + TS_PACKET_SIZE]
+                if packet[0] != TS_SYNC_BYTE:
+                    continue
+                pid = packet_pid(packet)
+                if programs.wants(pid):
+                    programs.update(packet)
+                    if pid == PAT_PID:
+                        last_pat = base + offset
+                    continue
+                # Only the video PID's random access points are keyframes
+                if not programs.is_keyframe(packet):
+                    continue
+                pts = pes_pts(packet)
+                if pts is not None:
+                    if first_pts is None:
+                        first_pts = pts
+                    seconds = ((pts - first_pts) % PTS_WRAP) / 90000
+                else:
+                    seconds = None
+                near = last_pat is not None and base + offset - last_pat <= PAT_LOOKBACK
+                entry = last_pat if near else base + offset
+                last_pat = None
+                keyframes.append([entry, seconds])
+            base += len(data)
+
+    estimated = any(k[1] is None for k in keyframes)
+    if estimated:
+        byte_rate = size / duration if duration > 0 else 0
+        for k in keyframes:
+            k[1] = k[0] / byte_rate if byte_rate else 0.0
+    if keyframes and not estimated:
+        # Extrapolate the tail from the last keyframe's byte rate
+        last_offset, last_seconds = keyframes[-1][0], keyframes[-1][1]
+        duration = last_seconds * size / last_offset if last_offset else duration
+
+    index = {
+        "size": size,
+        "duration": round(duration, 3),
+        "estimated": estimated,
+        "keyframes": [[k[0], round(k[1], 3)] for k in keyframes],
+    }
+
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+    _write_atomic(sidecar_path(path, "index"), write)
+    return {"keyframes": len(keyframes), "estimated": estimated}
+
+
+def stage_checksum(path: str, duration: float) -> Dict:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(READ_SIZE)
+            if not data:
+                break
+            digest.update(data)
+    value = digest.hexdigest()
+
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            # Digest only: the sidecar is shared by copies with different names
+            f.write(f"{value}\n")
+    _write_atomic(sidecar_path(path, "checksum"), write)
+    return {"sha256": value}
+
+
+def _ffmpeg(args: List[str], output: str):
+    tmp_path = f"{output}.tmp"
+    result = subprocess.run(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y'] + args + [tmp_path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        timeout=FFMPEG_TIMEOUT,
+    )
+    if result.returncode != 0:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise RuntimeError(f"ffmpeg exited with code {result.returncode}: {result.stderr.decode(errors='replace')[-500:]}")
+    os.replace(tmp_path, output)
+
+
+def stage_thumbnail(path: str, duration: float) -> Dict:
+    output = sidecar_path(path, "thumbnail")
+    _ffmpeg(['-ss', str(int(duration / 2)), '-i', path, '-frames:v', '1', '-vf', 'scale=480:-2', '-f', 'image2'], output)
+    return {}
+
+
+def stage_remux(path: str, duration: float) -> Dict:
+    output = sidecar_path(path, "remux")
+    _ffmpeg(['-i', path, '-map', '0', '-c', 'copy', '-bsf:a', 'aac_adtstoasc',
+             '-movflags', '+faststart', '-f', 'mp4'], output)
+    return {"size": os.path.getsize(output)}
+
+
+STAGES: Dict[str, Callable[[str, float], Dict]] = {
+    "index": stage_index,
+    "checksum": stage_checksum,
+    "thumbnail": stage_thumbnail,
+    "remux": stage_remux,
+}
+
+
+# ---- Queue ----
+
+@dataclass
+class PostProcessJob:
+    """Post-processing of one recorded file (and its hardlinked copies)"""
+    job_id: str
+    paths: List[str]
+    duration: float
+    stages: List[str]
+    timings: Dict[str, float] = field(default_factory=dict)  # Stage -> seconds, for stages done
+    results: Dict[str, Any] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+    queued_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def pending_stages(self) -> List[str]:
+        return [s for s in self.stages if s not in self.timings and s not in self.errors]
+
+    def source(self) -> Optional[str]:
+        """A copy of the recording that still exists"""
+        return next((p for p in self.paths if os.path.exists(p)), None)
+
+
+class PostProcessor:
+    """Stage queue backed by a low-priority process pool"""
+
+    def __init__(self, stages: List[str], workers: int, nice: int, state_path: str):
+        unknown = [s for s in stages if s not in STAGES]
+        if unknown:
+            logger.warning(f"Ignoring unknown post-processing stages: {', '.join(unknown)}")
+        self.stages = [s for s in stages if s in STAGES]
+        self.workers = max(1, workers)
+        self.nice = nice
+        self.state_path = state_path
+        self.jobs: "OrderedDict[str, PostProcessJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.stages)
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_lower_priority,
+                initargs=(self.nice,),
+            )
+        return self._executor
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._ensure_executor()
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    def submit(self, paths: List[str], duration: float):
+        """Queue a finished recording; ``paths`` are all links to the same file"""
+        if not self.enabled or not paths:
+            return
+        job = PostProcessJob(job_id=paths[0], paths=list(paths), duration=duration, stages=list(self.stages))
+        self.jobs[job.job_id] = job
+        self._ensure_workers()
+        self._queue.put_nowait(job)
+        self._save()
+
+    async def ensure_index(self, path: str, duration: float) -> Dict:
+        """The keyframe index of ``path``, building it in the pool if it is missing or stale"""
+        index = load_index(path)
+        if index is None or index["size"] != os.path.getsize(path):
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._ensure_executor(), stage_index, path, duration)
+            index = load_index(path)
+        return index
+
+    def resume(self):
+        """Re-queue jobs left unfinished by the last run"""
+        try:
+            with open(self.state_path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        resumed = 0
+        for data in saved.get("jobs", []):
+            job = PostProcessJob(**data)
+            self.jobs[job.job_id] = job
+            if job.finished_at is None:
+                self._ensure_workers()
+                self._queue.put_nowait(job)
+                resumed += 1
+        if resumed:
+            logger.info(f"Resuming post-processing of {resumed} recordings")
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"Post-processing {job.job_id} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: PostProcessJob):
+        loop = asyncio.get_running_loop()
+        for stage in job.pending_stages():
+            source = job.source()
+            if source is None:
+                job.errors[stage] = "Recording was deleted"
+                continue
+            started = time.time()
+            try:
+                job.results[stage] = await loop.run_in_executor(
+                    self._executor, STAGES[stage], source, job.duration
+                )
+                job.timings[stage] = round(time.time() - started, 3)
+                await asyncio.to_thread(self._share_sidecar, job, source, stage)
+            except Exception as e:
+                job.errors[stage] = str(e)
+                logger.warning(f"Post-processing stage {stage} failed for {source}: {e}")
+            await asyncio.to_thread(self._save)
+
+        job.finished_at = time.time()
+        self._trim()
+        await asyncio.to_thread(self._save)
+        logger.info(f"Post-processed {job.job_id}: {job.timings}")
+
+    def _share_sidecar(self, job: PostProcessJob, source: str, stage: str):
+        """Give every other copy of the recording the same sidecar"""
+        produced = sidecar_path(source, stage)
+        if not os.path.exists(produced):
+            return
+        for path in job.paths:
+            if path == source or not os.path.exists(path):
+                continue
+            target = sidecar_path(path, stage)
+            try:
+                if os.path.exists(target):
+                    os.remove(target)
+                os.link(produced, target)
+            except OSError:
+                shutil.copyfile(produced, target)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+        for job_id in finished[:-FINISHED_KEPT]:
+            del self.jobs[job_id]
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"jobs": [asdict(job) for job in list(self.jobs.values())]}, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Could not persist post-processing state: {e}")
+
+    def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._executor is not None:
+            # Unfinished stages stay pending in the state file and are redone on restart
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def get_stats(self) -> Dict:
+        jobs = list(self.jobs.values())
+        timings: Dict[str, List[float]] = {}
+        for job in jobs:
+            for stage, seconds in job.timings.items():
+                timings.setdefault(stage, []).append(seconds)
+        return {
+            "stages": self.stages,
+            "workers": self.workers,
+            "pending": sum(1 for j in jobs if j.finished_at is None),
+            "finished": sum(1 for j in jobs if j.finished_at is not None),
+            "failed_stages": sum(len(j.errors) for j in jobs),
+            "average_seconds": {
+                stage: round(sum(values) / len(values), 3) for stage, values in timings.items()
+            },
+            "recent": [asdict(j) for j in jobs[-20:]],
+        }
+
+
+settings = get_settings()
+
+# Global post-processor instance
+postprocessor = PostProcessor(
+    stages=[s.strip() for s in settings.postprocess_stages.split(",") if s.strip()],
+    workers=settings.postprocess_workers,
+    nice=settings.postprocess_nice,
+    state_path=settings.postprocess_state_path,
+)
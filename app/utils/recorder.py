@@ -1,91 +1,245 @@
 import os
 import asyncio
+import logging
+import shutil
+import signal
 import subprocess
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
 from app.models.recording import Recording, RecordingStatus
 from app.config import get_settings
+from app.utils.tuner_slots import tuner_slots, SlotUnavailable, PRIORITY_RECORDING
+from app.utils.stream_sources import stream_sources
+from app.utils.hls_proxy import is_hls_url
+from app.utils.ts_recorder import TSRecording, NotTransportStream
+from app.utils.postprocess import postprocessor
+
+logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+CAPTURE_DIR = ".captures"
+
+@dataclass
+class Capture:
+    """One physical recording of a channel and time window.
+
+    Every Recording row for the same window (several users scheduling the
+    same programme) joins the capture and gets a hardlink to its file, so
+    the stream is pulled and stored once. Deleting a recording only drops
+    that user's link; the data goes when the last link does.
+    """
+    key: Tuple[int, datetime, datetime]
+    path: str
+    members: Dict[int, str] = field(default_factory=dict)  # recording id -> user's file path
+    copy_on_finish: Set[int] = field(default_factory=set)  # Members whose hardlink failed
+    process: Any = None
+    started: bool = False
+    ended: bool = False  # Stopped on purpose after overrunning its end time; keep what was recorded
+
 class Recorder:
     def __init__(self):
-        self.active_recordings = {}
-        
+        self.captures: Dict[Tuple[int, datetime, datetime], Capture] = {}
+    
     async def record(self, recording_id: int):
         db = SessionLocal()
+        recording = None
+        capture = None
+        slot = ("recording", recording_id)
         try:
             recording = db.query(Recording).filter(Recording.id == recording_id).first()
             if not recording:
                 return
             
-            # Create recording directory
-            user_dir = os.path.join(settings.recording_path, str(recording.user_id))
-            os.makedirs(user_dir, exist_ok=True)
+            key = (recording.channel_id, recording.start_time, recording.end_time)
+            if key in self.captures:
+                # Same programme is already being captured for another user: share it
+                self._attach(self.captures[key], recording)
+                db.commit()
+                logger.info(f"Recording {recording_id} joined the capture of channel {recording.channel_id}")
+                return
             
-            # Generate filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            safe_title = "".join(c for c in recording.title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-            filename = f"{safe_title}_{timestamp}.ts"
-            file_path = os.path.join(user_dir, filename)
+            capture = self._open_capture(key)
+            self.captures[key] = capture
+            self._attach(capture, recording)
+            db.commit()
+            
+            # Wait for a provider connection (preempting live viewers if needed),
+            # but not past the end of the programme
+            try:
+                await tuner_slots.acquire(
+                    slot,
+                    recording.channel.playlist_id,
+                    priority=PRIORITY_RECORDING,
+                    timeout=max((recording.end_time - datetime.utcnow()).total_seconds(), 0)
+                )
+            except SlotUnavailable as e:
+                self._finish(db, capture, RecordingStatus.FAILED, str(e))
+                return
+            
+            if not capture.members:
+                # Everyone cancelled while we waited for the slot
+                return
             
             # Update recording status
-            recording.file_path = file_path
-            recording.status = RecordingStatus.RECORDING
-            db.commit()
+            capture.started = True
+            self._finish(db, capture, RecordingStatus.RECORDING)
             
-            # Start ffmpeg recording
-            process = await self._start_ffmpeg(
-                recording.channel.stream_url,
-                file_path,
-                recording.end_time
-            )
+            # Record MPEG-TS sources in-process; ffmpeg only for sources that need remuxing
+            process = None
+            if settings.recording_engine == "native" and not is_hls_url(recording.channel.stream_url):
+                try:
+                    process = await self._start_native(
+                        stream_sources.urls_for(db, recording.channel),
+                        recording.channel.playlist_id,
+                        capture.path,
+                        recording.end_time
+                    )
+                except NotTransportStream as e:
+                    logger.info(f"Recording {recording_id}: {e}, falling back to ffmpeg")
+            if process is None:
+                process = await self._start_ffmpeg(
+                    recording.channel.stream_url,
+                    capture.path,
+                    recording.end_time
+                )
             
             # Store process reference
-            self.active_recordings[recording_id] = process
+            capture.process = process
             
             # Wait for recording to complete
             await process.wait()
             
-            # Check if recording was successful
-            if process.returncode == 0 and os.path.exists(file_path):
-                file_size = os.path.getsize(file_path)
-                recording.status = RecordingStatus.COMPLETED
-                recording.file_size = file_size
+            # Check if recording was successful (a capture ended at its end time exits non-zero)
+            succeeded = process.returncode == 0 or (capture.ended and os.path.exists(capture.path)
+                                                    and os.path.getsize(capture.path) > 0)
+            if succeeded and os.path.exists(capture.path):
+                message = None
+                if isinstance(process, TSRecording) and (process.continuity_errors or process.reconnects):
+                    message = (
+                        f"Recorded with {process.continuity_errors} continuity errors "
+                        f"and {process.reconnects} upstream reconnects"
+                    )
+                elif capture.ended:
+                    message = "Stopped after running past the programme's end time"
+                # Members whose hardlink failed get a full copy, off the event loop
+                for member_id in list(capture.copy_on_finish):
+                    if member_id in capture.members:
+                        await asyncio.to_thread(shutil.copyfile, capture.path, capture.members[member_id])
+                self._finish(db, capture, RecordingStatus.COMPLETED, message)
+                # Index, checksum etc. run off the event loop, once for all members
+                postprocessor.submit(
+                    list(capture.members.values()),
+                    (recording.end_time - recording.start_time).total_seconds()
+                )
+            elif isinstance(process, TSRecording):
+                self._finish(db, capture, RecordingStatus.FAILED, process.error or f"Recording stopped ({process.returncode})")
             else:
-                recording.status = RecordingStatus.FAILED
-                recording.error_message = f"FFmpeg exited with code {process.returncode}"
-                
-                # Clean up failed recording
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    recording.file_path = None
-            
-            db.commit()
-            
+                self._finish(db, capture, RecordingStatus.FAILED, f"FFmpeg exited with code {process.returncode}")
+        
         except Exception as e:
-            if recording:
+            if capture:
+                db.rollback()
+                self._finish(db, capture, RecordingStatus.FAILED, str(e))
+            elif recording:
                 recording.status = RecordingStatus.FAILED
                 recording.error_message = str(e)
                 db.commit()
         finally:
-            # Remove from active recordings
-            if recording_id in self.active_recordings:
-                del self.active_recordings[recording_id]
+            if capture:
+                self.captures.pop(capture.key, None)
+                # Members hold their own links; the capture's name is no longer needed
+                if os.path.exists(capture.path):
+                    os.remove(capture.path)
+            tuner_slots.release(slot)
             db.close()
     
-    async def _start_ffmpeg(self, stream_url: str, output_path: str, end_time: datetime):
-        # Calculate duration
+    def _open_capture(self, key: Tuple[int, datetime, datetime]) -> Capture:
+        channel_id, start_time, end_time = key
+        capture_dir = os.path.join(settings.recording_path, CAPTURE_DIR)
+        os.makedirs(capture_dir, exist_ok=True)
+        path = os.path.join(
+            capture_dir,
+            f"{channel_id}_{start_time:%Y%m%d%H%M%S}_{end_time:%Y%m%d%H%M%S}.ts"
+        )
+        # Create the file up front so members can link to it before the first byte;
+        # both engines truncate it in place, keeping the links intact
+        open(path, "wb").close()
+        return Capture(key=key, path=path)
+    
+    def _attach(self, capture: Capture, recording: Recording):
+        # Create recording directory
+        user_dir = os.path.join(settings.recording_path, str(recording.user_id))
+        os.makedirs(user_dir, exist_ok=True)
+        
+        # Generate filename
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        safe_title = "".join(c for c in recording.title if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        filename = f"{safe_title}_{timestamp}.ts"
+        file_path = os.path.join(user_dir, filename)
+        
+        try:
+            os.link(capture.path, file_path)
+        except OSError as e:
+            # e.g. user directories on another filesystem
+            logger.warning(f"Cannot hardlink {file_path} ({e}); it will be copied when the capture ends")
+            capture.copy_on_finish.add(recording.id)
+        
+        capture.members[recording.id] = file_path
+        recording.file_path = file_path
+        if capture.started:
+            recording.status = RecordingStatus.RECORDING
+    
+    def _finish(self, db: Session, capture: Capture, status: RecordingStatus, message: Optional[str] = None):
+        """Apply a capture's state to every recording still attached to it"""
+        if not capture.members:
+            return
+        db.expire_all()
+        recordings = db.query(Recording).filter(Recording.id.in_(list(capture.members))).all()
+        file_size = os.path.getsize(capture.path) if status == RecordingStatus.COMPLETED else None
+        for recording in recordings:
+            file_path = capture.members[recording.id]
+            if status == RecordingStatus.COMPLETED:
+                recording.file_size = file_size
+            elif status == RecordingStatus.FAILED:
+                # Clean up failed recording
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                recording.file_path = None
+            recording.status = status
+            recording.error_message = message
+        db.commit()
+    
+    def _duration(self, end_time: datetime) -> float:
         duration = (end_time - datetime.utcnow()).total_seconds()
         if duration <= 0:
             duration = 60  # Default 1 minute if end time has passed
+        return duration
+    
+    async def _start_native(self, stream_urls: list, pool: Optional[int], output_path: str,
+                            end_time: datetime) -> TSRecording:
+        process = TSRecording(
+            stream_urls,
+            pool,
+            output_path,
+            self._duration(end_time),
+            settings.recording_write_buffer
+        )
+        await process.start()
+        return process
+    
+    async def _start_ffmpeg(self, stream_url: str, output_path: str, end_time: datetime):
+        duration = self._duration(end_time)
         
         # FFmpeg command
         cmd = [
             'ffmpeg',
             '-hide_banner',
             '-loglevel', 'error',
+            '-y',  # The capture file already exists (members link to it)
             '-i', stream_url,
             '-t', str(int(duration)),
             '-c', 'copy',
@@ -103,21 +257,52 @@ class Recorder:
         
         return process
     
+    def _capture_of(self, recording_id: int) -> Optional[Capture]:
+        for capture in self.captures.values():
+            if recording_id in capture.members:
+                return capture
+        return None
+    
+    def live_path(self, recording_id: int) -> Optional[str]:
+        """The file an in-progress recording is being written to, if it is running"""
+        capture = self._capture_of(recording_id)
+        if capture is None or not capture.started:
+            return None
+        return capture.path
+    
+    def end_capture(self, recording_id: int) -> bool:
+        """Stop a capture that ran past its end time, keeping what it recorded"""
+        capture = self._capture_of(recording_id)
+        if capture is None or capture.process is None or capture.process.returncode is not None:
+            return False
+        capture.ended = True
+        if isinstance(capture.process, TSRecording):
+            capture.process.terminate()
+        else:
+            # SIGINT lets ffmpeg flush and close the output like "q" would
+            capture.process.send_signal(signal.SIGINT)
+        return True
+    
     async def stop_recording(self, recording_id: int):
-        if recording_id in self.active_recordings:
-            process = self.active_recordings[recording_id]
-            process.terminate()
-            await process.wait()
-            
-            # Update status
-            db = SessionLocal()
-            try:
-                recording = db.query(Recording).filter(Recording.id == recording_id).first()
-                if recording and recording.status == RecordingStatus.RECORDING:
-                    recording.status = RecordingStatus.CANCELLED
-                    db.commit()
-            finally:
-                db.close()
+        capture = self._capture_of(recording_id)
+        if capture is None:
+            return
+        
+        # Other users still want this programme: only this recording leaves the capture
+        del capture.members[recording_id]
+        if not capture.members and capture.process is not None:
+            capture.process.terminate()
+            await capture.process.wait()
+        
+        # Update status
+        db = SessionLocal()
+        try:
+            recording = db.query(Recording).filter(Recording.id == recording_id).first()
+            if recording and recording.status in (RecordingStatus.SCHEDULED, RecordingStatus.RECORDING):
+                recording.status = RecordingStatus.CANCELLED
+                db.commit()
+        finally:
+            db.close()
 
 # Singleton recorder instance
-recorder = Recorder()
\ No newline at end of file
+recorder = Recorder()
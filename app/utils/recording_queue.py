@@ -0,0 +1,216 @@
+"""
+Recording job queue
+
+Every recording start goes through one executor instead of each scheduler
+job or API request running the recorder on its own: at most
+``max_concurrent_recordings`` run at once and the rest wait in priority
+order. Series/recurring recordings go before one-offs and admins' before
+other users'; equal priorities start in the order they were queued.
+
+A recording of a programme that is already being captured for another
+user joins that capture straight away: it costs no upstream connection,
+so it neither waits in the queue nor counts against the limit.
+
+Starts are spread so a wave of programmes beginning on the hour does not
+hit the providers at the same instant: scheduled jobs fire up to
+``recording_start_jitter`` seconds early at random, and the executor
+leaves at least ``recording_start_spacing`` seconds between launches.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.config import get_settings
+from app.models.recording import Recording
+from app.models.user import UserRole
+from app.utils.recorder import recorder
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_SERIES = 2
+PRIORITY_ADMIN = 1
+
+
+def recording_priority(recording: Recording) -> int:
+    priority = 0
+    if recording.schedule_id:
+        priority += PRIORITY_SERIES
+    if recording.user and recording.user.role == UserRole.ADMIN:
+        priority += PRIORITY_ADMIN
+    return priority
+
+
+@dataclass(order=True)
+class RecordingJob:
+    sort_key: tuple
+    recording_id: int = field(compare=False)
+    user_id: int = field(compare=False)
+    title: str = field(compare=False)
+    priority: int = field(compare=False)
+    capture_key: Tuple = field(compare=False, default=())  # (channel, start, end) as in recorder.captures
+    queued_at: float = field(compare=False, default_factory=time.time)
+    started_at: Optional[float] = field(compare=False, default=None)
+
+    def to_dict(self, now: float) -> Dict:
+        return {
+            "recording_id": self.recording_id,
+            "user_id": self.user_id,
+            "title": self.title,
+            "priority": self.priority,
+            "waited_seconds": round((self.started_at or now) - self.queued_at, 1),
+            "running_seconds": int(now - self.started_at) if self.started_at else None,
+        }
+
+
+class RecordingQueue:
+    """Bounded, priority-ordered executor for ``recorder.record``"""
+
+    def __init__(self, max_running: int, spacing: float):
+        self.max_running = max_running
+        self.spacing = spacing
+        self.queued: List[RecordingJob] = []  # Heap
+        self.running: Dict[int, RecordingJob] = {}
+        self.joining: Set[int] = set()  # Recordings attaching to a capture that is already running
+        self.started = 0
+        self.joined = 0
+        self.total_wait = 0.0
+        self._seq = itertools.count()
+        self._last_launch = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _ensure_dispatcher(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    def is_queued(self, recording_id: int) -> bool:
+        return (
+            recording_id in self.running
+            or recording_id in self.joining
+            or any(j.recording_id == recording_id for j in self.queued)
+        )
+
+    def submit(self, recording: Recording) -> bool:
+        """Queue ``recording`` to start; False if it is already queued or running"""
+        if self.is_queued(recording.id):
+            return False
+        capture_key = (recording.channel_id, recording.start_time, recording.end_time)
+        if capture_key in recorder.captures:
+            self._join(recording.id)
+            return True
+        priority = recording_priority(recording)
+        job = RecordingJob(
+            sort_key=(-priority, next(self._seq)),
+            recording_id=recording.id,
+            user_id=recording.user_id,
+            title=recording.title,
+            priority=priority,
+            capture_key=capture_key,
+        )
+        heapq.heappush(self.queued, job)
+        self._ensure_dispatcher()
+        self._wakeup.set()
+        return True
+
+    def discard(self, recording_id: int) -> bool:
+        """Take a job that has not started yet off the queue"""
+        for i, job in enumerate(self.queued):
+            if job.recording_id == recording_id:
+                self.queued.pop(i)
+                heapq.heapify(self.queued)
+                return True
+        return False
+
+    def _has_capacity(self) -> bool:
+        return self.max_running <= 0 or len(self.running) < self.max_running
+
+    async def _dispatch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.queued or not self._has_capacity():
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._last_launch + self.spacing - loop.time()
+            if delay > 0:
+                # Re-check afterwards: a higher priority job may have arrived meanwhile
+                await asyncio.sleep(delay)
+                continue
+
+            job = heapq.heappop(self.queued)
+            job.started_at = time.time()
+            self.running[job.recording_id] = job
+            self.started += 1
+            self.total_wait += job.started_at - job.queued_at
+            self._last_launch = loop.time()
+            asyncio.create_task(self._run(job))
+
+            # Other users' copies of the same programme join this capture instead of waiting
+            joins = [j for j in self.queued if j.capture_key == job.capture_key]
+            if joins:
+                self.queued = [j for j in self.queued if j.capture_key != job.capture_key]
+                heapq.heapify(self.queued)
+                for j in joins:
+                    self._join(j.recording_id)
+
+    def _join(self, recording_id: int):
+        self.joining.add(recording_id)
+        self.joined += 1
+        asyncio.create_task(self._run_join(recording_id))
+
+    async def _run_join(self, recording_id: int):
+        # Tasks start in creation order, so the capture is registered before this runs
+        try:
+            await recorder.record(recording_id)
+        except Exception as e:
+            logger.error(f"Recording job {recording_id} failed: {e}")
+        finally:
+            self.joining.discard(recording_id)
+
+    async def _run(self, job: RecordingJob):
+        try:
+            await recorder.record(job.recording_id)
+        except Exception as e:
+            logger.error(f"Recording job {job.recording_id} failed: {e}")
+        finally:
+            self.running.pop(job.recording_id, None)
+            self._wakeup.set()
+
+    def get_stats(self, user_id: Optional[int] = None) -> Dict:
+        """Queue state; ``user_id`` limits the job lists to that user's recordings"""
+        now = time.time()
+        queued = sorted(self.queued)
+        return {
+            "max_running": self.max_running or None,
+            "running_count": len(self.running),
+            "queued_count": len(queued),
+            "started": self.started,
+            "joined": self.joined,
+            "average_wait_seconds": round(self.total_wait / self.started, 1) if self.started else None,
+            "running": [
+                j.to_dict(now) for j in self.running.values()
+                if user_id is None or j.user_id == user_id
+            ],
+            "queued": [
+                {**j.to_dict(now), "position": position}
+                for position, j in enumerate(queued, 1)
+                if user_id is None or j.user_id == user_id
+            ],
+        }
+
+
+settings = get_settings()
+
+# Global recording queue instance
+recording_queue = RecordingQueue(
+    max_running=settings.max_concurrent_recordings,
+    spacing=settings.recording_start_spacing,
+)
@@ -0,0 +1,177 @@
+"""
+Recording start/stop scheduler
+
+Keeps every upcoming recording as a start and a stop event in one
+min-heap and sleeps until the earliest is due, instead of polling the
+database each minute and handing APScheduler a job per recording. The
+heap is loaded from the database on startup, so recordings survive a
+restart (one whose start passed while the server was down starts at
+once if its programme has not ended), and it is updated in place
+whenever a recording is created or deleted, so even a recording that
+starts seconds from now is not missed.
+
+Changing a recording just schedules it again: each recording's events
+carry a version and superseded ones are skipped when they come up.
+
+Start events hand the recording to ``recording_queue``, up to
+``recording_start_jitter`` seconds early at random. Stop events fire
+``STOP_GRACE_SECONDS`` after the programme ends and clean up recordings
+that overran: still waiting in the queue (marked failed) or a capture
+that has not stopped by itself (ended).
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models.recording import Recording, RecordingStatus
+from app.utils.recorder import recorder
+from app.utils.recording_queue import recording_queue
+
+logger = logging.getLogger(__name__)
+
+START = "start"
+STOP = "stop"
+STOP_GRACE_SECONDS = 30
+
+
+def _timestamp(value: datetime) -> float:
+    """Epoch seconds; naive datetimes are UTC like everywhere else in the database"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class RecordingScheduler:
+    """Fires recording start/stop events from a due-time heap"""
+
+    def __init__(self, jitter: float):
+        self.jitter = jitter
+        self.events: List[Tuple[float, int, str, int]] = []  # Heap of (due, version, kind, recording id)
+        self.versions: Dict[int, int] = {}  # recording id -> version of its live events
+        self.started = 0
+        self.stopped = 0
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+        self._seq = itertools.count(1)
+        self._wakeup = asyncio.Event()
+
+    def schedule(self, recording_id: int, start_time: datetime, end_time: datetime):
+        """(Re)schedule a recording's start and stop; replaces any earlier events"""
+        version = next(self._seq)
+        self.versions[recording_id] = version
+        # Overdue starts (e.g. missed while the server was down) are due now
+        start = max(_timestamp(start_time) - random.uniform(0, self.jitter), time.time())
+        heapq.heappush(self.events, (start, version, START, recording_id))
+        heapq.heappush(self.events, (_timestamp(end_time) + STOP_GRACE_SECONDS, version, STOP, recording_id))
+        self._compact()
+        self._wakeup.set()
+
+    def cancel(self, recording_id: int):
+        """Drop a recording's pending events (they are skipped when they come up)"""
+        if self.versions.pop(recording_id, None) is not None:
+            self._compact()
+
+    def _compact(self):
+        # Superseded events only cost memory; rebuild once they outnumber the live ones
+        if len(self.events) > 4 * len(self.versions) + 64:
+            self.events = [e for e in self.events if self.versions.get(e[3]) == e[1]]
+            heapq.heapify(self.events)
+
+    def load(self):
+        """Schedule every recording that has not ended yet"""
+        db = SessionLocal()
+        try:
+            recordings = db.query(Recording.id, Recording.start_time, Recording.end_time).filter(
+                Recording.status == RecordingStatus.SCHEDULED,
+                Recording.end_time > datetime.utcnow()
+            ).all()
+        finally:
+            db.close()
+        for recording in recordings:
+            self.schedule(recording.id, recording.start_time, recording.end_time)
+        logger.info(f"Recording scheduler loaded {len(recordings)} upcoming recordings")
+
+    async def run_forever(self):
+        self.load()
+        while True:
+            self._fire_due()
+            self._wakeup.clear()
+            timeout = max(self.events[0][0] - time.time(), 0) if self.events else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _fire_due(self):
+        while self.events and self.events[0][0] <= time.time():
+            due, version, kind, recording_id = heapq.heappop(self.events)
+            if self.versions.get(recording_id) != version:
+                continue  # Rescheduled or cancelled
+            try:
+                if kind == START:
+                    lateness = max(time.time() - due, 0)
+                    self.total_lateness += lateness
+                    self.max_lateness = max(self.max_lateness, lateness)
+                    self.started += 1
+                    self._start(recording_id)
+                else:
+                    self.versions.pop(recording_id, None)
+                    self.stopped += 1
+                    self._stop(recording_id)
+            except Exception as e:
+                logger.error(f"Recording {recording_id} {kind} event failed: {e}")
+
+    def _start(self, recording_id: int):
+        db = SessionLocal()
+        try:
+            recording = db.query(Recording).filter(Recording.id == recording_id).first()
+            if recording and recording.status == RecordingStatus.SCHEDULED:
+                recording_queue.submit(recording)
+        finally:
+            db.close()
+
+    def _stop(self, recording_id: int):
+        if recording_queue.discard(recording_id):
+            db = SessionLocal()
+            try:
+                recording = db.query(Recording).filter(Recording.id == recording_id).first()
+                if recording and recording.status == RecordingStatus.SCHEDULED:
+                    recording.status = RecordingStatus.FAILED
+                    recording.error_message = "No recording slot became free before the programme ended"
+                    db.commit()
+            finally:
+                db.close()
+            logger.warning(f"Recording {recording_id} never left the queue; marked failed")
+        elif recorder.end_capture(recording_id):
+            logger.warning(f"Recording {recording_id} ran past its end time; stopping it")
+
+    def get_stats(self) -> Dict:
+        live = [e for e in self.events if self.versions.get(e[3]) == e[1]]
+        next_event = min(live) if live else None
+        return {
+            "pending_recordings": len(self.versions),
+            "pending_events": len(live),
+            "next_event": {
+                "recording_id": next_event[3],
+                "kind": next_event[2],
+                "in_seconds": round(next_event[0] - time.time(), 1),
+            } if next_event else None,
+            "started": self.started,
+            "stopped": self.stopped,
+            "average_start_lateness_ms": round(self.total_lateness / self.started * 1000, 1) if self.started else None,
+            "max_start_lateness_ms": round(self.max_lateness * 1000, 1),
+        }
+
+
+settings = get_settings()
+
+# Global recording scheduler instance
+recording_scheduler = RecordingScheduler(jitter=settings.recording_start_jitter)
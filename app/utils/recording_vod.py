@@ -0,0 +1,140 @@
+"""
+Serving recordings: seekable file responses and HLS VOD playlists
+
+``RecordingFileResponse`` is Starlette's ``FileResponse`` (which already
+answers Range and If-Range requests) with zero-copy sends: when the ASGI
+server offers the ``http.response.zerocopysend`` extension the body is
+handed over as a file descriptor for ``sendfile``; otherwise it falls
+back to reading in 1 MiB chunks rather than 64 KiB.
+
+``vod_playlist`` turns the keyframe index written by post-processing
+into an HLS VOD playlist of byte ranges of the recording itself, so a
+player can seek anywhere in a multi-hour recording by fetching the
+range for that segment. Nothing is remuxed or transcoded.
+
+``follow_recording`` streams a recording that is still being written,
+from any offset, and keeps following the file as it grows until the
+capture ends, so start-over viewing costs no extra upstream connection.
+"""
+
+import asyncio
+import math
+from typing import AsyncIterator, Callable, Dict, List, Tuple
+
+from app.utils.mpegts import TS_PACKET_SIZE, ProgramMap, random_access_offsets
+
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+VOD_TARGET_SECONDS = 6.0
+FOLLOW_CHUNK = 1024 * 1024
+FOLLOW_POLL_SECONDS = 0.5  # How often a caught-up reader checks the file for growth
+
+
+class RecordingFileResponse(FileResponse):
+    """FileResponse with sendfile when the server supports it"""
+
+    chunk_size = 1024 * 1024
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self._zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+    async def _send_file(self, send: Send, start: int, end: int):
+        with open(self.path, "rb") as file:
+            await send({
+                "type": ZEROCOPY_EXTENSION,
+                "file": file,
+                "offset": start,
+                "count": end - start,
+                "more_body": False,
+            })
+
+    async def _handle_simple(self, send: Send, send_header_only: bool) -> None:
+        if not self._zerocopy or send_header_only:
+            return await super()._handle_simple(send, send_header_only)
+        size = int(self.headers["content-length"])
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await self._send_file(send, 0, size)
+
+    async def _handle_single_range(self, send: Send, start: int, end: int, file_size: int,
+                                   send_header_only: bool) -> None:
+        if not self._zerocopy or send_header_only:
+            return await super()._handle_single_range(send, start, end, file_size, send_header_only)
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        await self._send_file(send, start, end)
+
+
+def vod_segments(index: Dict, target: float = VOD_TARGET_SECONDS) -> List[Tuple[int, int, float]]:
+    """``(offset, length, seconds)`` segments cut at keyframes, about ``target`` seconds each"""
+    size = index["size"]
+    duration = index["duration"]
+    boundaries = [(0, 0.0)]
+    for offset, seconds in index["keyframes"]:
+        if offset > boundaries[-1][0] and seconds - boundaries[-1][1] >= target:
+            boundaries.append((offset, seconds))
+
+    segments = []
+    for i, (offset, seconds) in enumerate(boundaries):
+        if i + 1 < len(boundaries):
+            end, end_seconds = boundaries[i + 1]
+        else:
+            end, end_seconds = size, max(duration, seconds)
+        if end > offset:
+            segments.append((offset, end - offset, end_seconds - seconds))
+    return segments
+
+
+def vod_playlist(index: Dict, media_uri: str, target: float = VOD_TARGET_SECONDS) -> str:
+    segments = vod_segments(index, target)
+    longest = max((seconds for _, _, seconds in segments), default=target)
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:4",  # EXT-X-BYTERANGE
+        f"#EXT-X-TARGETDURATION:{max(1, math.ceil(longest))}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+    ]
+    for offset, length, seconds in segments:
+        lines.append(f"#EXTINF:{seconds:.3f},")
+        lines.append(f"#EXT-X-BYTERANGE:{length}@{offset}")
+        lines.append(media_uri)
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+async def follow_recording(path: str, offset: int, is_active: Callable[[], bool]) -> AsyncIterator[bytes]:
+    """Yield ``path`` from ``offset`` on, waiting for more while ``is_active()``.
+
+    Output starts at the first keyframe at or after ``offset`` so players
+    can decode from the first byte.
+    """
+    offset -= offset % TS_PACKET_SIZE
+    file = await asyncio.to_thread(open, path, "rb")
+    try:
+        file.seek(offset)
+        synced = False
+        programs = ProgramMap()
+        while True:
+            data = await asyncio.to_thread(file.read, FOLLOW_CHUNK)
+            if not data:
+                if is_active():
+                    await asyncio.sleep(FOLLOW_POLL_SECONDS)
+                    continue
+                # The writer is done; one more read catches its final flush
+                data = await asyncio.to_thread(file.read, FOLLOW_CHUNK)
+                if not data:
+                    return
+            if not synced:
+                keyframes = random_access_offsets(data[:len(data) - len(data) % TS_PACKET_SIZE], programs)
+                if not keyframes:
+                    continue
+                data = data[keyframes[0]:]
+                synced = True
+            yield data
+    finally:
+        await asyncio.to_thread(file.close)
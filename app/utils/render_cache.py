@@ -0,0 +1,242 @@
+"""
+Render cache for exported artefacts
+
+Media servers (Plex, Jellyfin, Emby, ...) poll the XMLTV guide and M3U
+lineup on a schedule. Instead of regenerating identical output for every
+poll, artefacts are rendered once to disk (plain and gzip-compressed),
+versioned against the tables they are built from, and served as files
+with ETag / Last-Modified so unchanged polls are answered with 304.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+from app.config import get_settings
+from app.utils.change_tracker import change_tracker
+
+logger = logging.getLogger(__name__)
+
+Renderer = Callable[[], Iterable[bytes]]
+
+
+@dataclass
+class RenderedArtefact:
+    """A materialised artefact on disk"""
+    name: str
+    path: str
+    gzip_path: str
+    etag: str
+    gzip_etag: str
+    size: int
+    gzip_size: int
+    version: int
+    rendered_at: float
+    render_seconds: float
+
+
+class RenderCache:
+    """Renders artefacts to disk and keeps them fresh"""
+
+    def __init__(self, cache_dir: str, max_age: int, debounce: int):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.debounce = debounce
+        self.artefacts: Dict[str, RenderedArtefact] = {}
+        # name -> (renderer, tables) for background refreshes
+        self.sources: Dict[str, Tuple[Renderer, Tuple[str, ...]]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._watched = set()
+
+    async def get(self, name: str, renderer: Renderer, tables: Tuple[str, ...]) -> RenderedArtefact:
+        """Return a fresh artefact, rendering it if needed.
+
+        Concurrent callers for the same artefact wait on a single render.
+        """
+        self._loop = asyncio.get_running_loop()
+        self.sources[name] = (renderer, tables)
+        self._watch(tables)
+
+        artefact = self.artefacts.get(name)
+        if self._is_fresh(artefact, tables):
+            return artefact
+
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            # Another request may have rendered it while we waited
+            artefact = self.artefacts.get(name)
+            if self._is_fresh(artefact, tables):
+                return artefact
+
+            version = change_tracker.version(*tables)
+            loop = asyncio.get_running_loop()
+            artefact = await loop.run_in_executor(None, self._render, name, renderer, version)
+            self.artefacts[name] = artefact
+            logger.info(
+                f"Rendered {name} ({artefact.size / 1024 / 1024:.1f} MB, "
+                f"{artefact.gzip_size / 1024 / 1024:.1f} MB gzip) in {artefact.render_seconds:.2f}s"
+            )
+            return artefact
+
+    def invalidate(self, name: Optional[str] = None):
+        """Drop one or all artefacts so the next request re-renders"""
+        if name:
+            self.artefacts.pop(name, None)
+        else:
+            self.artefacts.clear()
+
+    def get_stats(self) -> Dict:
+        """Cache state for the system API"""
+        now = time.time()
+        return {
+            name: {
+                "size": a.size,
+                "gzip_size": a.gzip_size,
+                "etag": a.etag,
+                "age_seconds": int(now - a.rendered_at),
+                "render_seconds": round(a.render_seconds, 3),
+            }
+            for name, a in self.artefacts.items()
+        }
+
+    def _is_fresh(self, artefact: Optional[RenderedArtefact], tables: Tuple[str, ...]) -> bool:
+        if artefact is None or not os.path.exists(artefact.path):
+            return False
+        if artefact.version != change_tracker.version(*tables):
+            return False
+        return time.time() - artefact.rendered_at < self.max_age
+
+    def _render(self, name: str, renderer: Renderer, version: int) -> RenderedArtefact:
+        """Write plain and gzip variants in one pass (runs in a worker thread)"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, name)
+        gzip_path = path + ".gz"
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        tmp_gzip_path = f"{gzip_path}.{os.getpid()}.tmp"
+
+        started = time.time()
+        digest = hashlib.sha1()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as plain, open(tmp_gzip_path, "wb") as raw_gz:
+                # mtime=0 keeps the gzip bytes stable for identical content
+                with gzip.GzipFile(filename="", mode="wb", fileobj=raw_gz, compresslevel=6, mtime=0) as gz:
+                    for chunk in renderer():
+                        plain.write(chunk)
+                        gz.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+
+            # Atomic swap: readers still streaming the old file keep their inode
+            os.replace(tmp_path, path)
+            os.replace(tmp_gzip_path, gzip_path)
+        finally:
+            for leftover in (tmp_path, tmp_gzip_path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+
+        content_hash = digest.hexdigest()
+        return RenderedArtefact(
+            name=name,
+            path=path,
+            gzip_path=gzip_path,
+            etag=f'"{content_hash}"',
+            gzip_etag=f'"{content_hash}-gz"',
+            size=size,
+            gzip_size=os.path.getsize(gzip_path),
+            version=version,
+            rendered_at=time.time(),
+            render_seconds=time.time() - started,
+        )
+
+    def _watch(self, tables: Tuple[str, ...]):
+        for table in tables:
+            if table not in self._watched:
+                self._watched.add(table)
+                change_tracker.subscribe(table, self._on_change)
+
+    def _on_change(self, table: str):
+        # May be called from a worker thread; hop onto the event loop
+        if self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._schedule_refresh)
+
+    def _schedule_refresh(self):
+        # A pending refresh already covers this change; requests re-check freshness anyway
+        if self._refresh_task and not self._refresh_task.done():
+            return
+        self._refresh_task = asyncio.create_task(self._refresh_after_debounce())
+
+    async def _refresh_after_debounce(self):
+        """Re-render stale artefacts once a burst of changes has settled"""
+        await asyncio.sleep(self.debounce)
+        for name, (renderer, tables) in list(self.sources.items()):
+            if not self._is_fresh(self.artefacts.get(name), tables):
+                try:
+                    await self.get(name, renderer, tables)
+                except Exception as e:
+                    logger.error(f"Background render of {name} failed: {e}")
+
+
+def artefact_response(
+    request: Request,
+    artefact: RenderedArtefact,
+    media_type: str,
+    filename: str
+) -> Response:
+    """Serve an artefact with conditional-request support.
+
+    Picks the gzip variant when the client accepts it, answers matching
+    If-None-Match / If-Modified-Since with 304 and otherwise hands the file
+    to FileResponse, which uses the server's zero-copy path when available.
+    """
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+    etag = artefact.gzip_etag if use_gzip else artefact.etag
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(artefact.rendered_at, usegmt=True),
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+        "Content-Disposition": f"inline; filename={filename}",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in candidates or etag in candidates:
+            return Response(status_code=304, headers=headers)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+                if int(artefact.rendered_at) <= since:
+                    return Response(status_code=304, headers=headers)
+            except (TypeError, ValueError):
+                pass
+
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return FileResponse(artefact.gzip_path, media_type=media_type, headers=headers)
+    return FileResponse(artefact.path, media_type=media_type, headers=headers)
+
+
+settings = get_settings()
+
+# Global render cache instance
+render_cache = RenderCache(
+    settings.render_cache_path,
+    settings.render_cache_max_age,
+    settings.render_cache_debounce,
+)
@@ -4,128 +4,24 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 from app.database import SessionLocal
-from app.models.recording import Recording, RecordingSchedule, RecordingStatus, RecordingType
-from app.models.epg import EPGProgram
+from app.models.recording import Recording, RecordingSchedule, RecordingStatus
 from app.models.playlist import Playlist
-from app.utils.recorder import recorder
+from app.utils.series_matcher import series_matcher
+from app.utils.postprocess import remove_sidecars
+from app.config import get_settings
 import pytz
 import logging
 
 logger = logging.getLogger(__name__)
 
-scheduler = AsyncIOScheduler()
+settings = get_settings()
 
-async def check_scheduled_recordings():
-    """Check for recordings that need to start"""
-    db = SessionLocal()
-    try:
-        now = datetime.utcnow()
-        upcoming_time = now + timedelta(minutes=5)
-        
-        # Find recordings scheduled to start soon
-        recordings = db.query(Recording).filter(
-            and_(
-                Recording.status == RecordingStatus.SCHEDULED,
-                Recording.start_time >= now,
-                Recording.start_time <= upcoming_time
-            )
-        ).all()
-        
-        for recording in recordings:
-            # Schedule the recording
-            scheduler.add_job(
-                start_recording,
-                'date',
-                run_date=recording.start_time,
-                args=[recording.id],
-                id=f"recording_{recording.id}",
-                replace_existing=True
-            )
-    finally:
-        db.close()
+scheduler = AsyncIOScheduler()
 
 async def check_series_recordings():
     """Check for series recordings that need new episodes scheduled"""
-    db = SessionLocal()
-    try:
-        now = datetime.utcnow()
-        future_time = now + timedelta(days=7)  # Look ahead 7 days
-        
-        # Get active series schedules
-        schedules = db.query(RecordingSchedule).filter(
-            and_(
-                RecordingSchedule.is_active == True,
-                RecordingSchedule.recording_type.in_([RecordingType.SERIES, RecordingType.RECURRING])
-            )
-        ).all()
-        
-        for schedule in schedules:
-            # Find matching programs
-            if schedule.series_id:
-                # Match by series ID
-                programs = db.query(EPGProgram).filter(
-                    and_(
-                        EPGProgram.series_id == schedule.series_id,
-                        EPGProgram.start_time >= now,
-                        EPGProgram.start_time <= future_time
-                    )
-                ).all()
-            elif schedule.title_pattern:
-                # Match by title pattern
-                programs = db.query(EPGProgram).filter(
-                    and_(
-                        EPGProgram.title.ilike(f"%{schedule.title_pattern}%"),
-                        EPGProgram.start_time >= now,
-                        EPGProgram.start_time <= future_time
-                    )
-                ).all()
-                
-                if schedule.channel_id:
-                    programs = [p for p in programs if p.channel_id == schedule.channel_id]
-            else:
-                continue
-            
-            # Create recordings for matching programs
-            for program in programs:
-                # Check if recording already exists
-                existing = db.query(Recording).filter(
-                    and_(
-                        Recording.user_id == schedule.user_id,
-                        Recording.program_id == program.id
-                    )
-                ).first()
-                
-                if not existing:
-                    # Check user's recording limit
-                    active_count = db.query(Recording).filter(
-                        and_(
-                            Recording.user_id == schedule.user_id,
-                            Recording.status.in_([RecordingStatus.SCHEDULED, RecordingStatus.RECORDING])
-                        )
-                    ).count()
-                    
-                    if schedule.max_recordings and active_count >= schedule.max_recordings:
-                        continue
-                    
-                    # Create recording
-                    recording = Recording(
-                        user_id=schedule.user_id,
-                        channel_id=program.channel_id,
-                        program_id=program.id,
-                        title=program.title,
-                        status=RecordingStatus.SCHEDULED,
-                        start_time=program.start_time,
-                        end_time=program.end_time
-                    )
-                    db.add(recording)
-            
-            db.commit()
-    finally:
-        db.close()
-
-async def start_recording(recording_id: int):
-    """Start a scheduled recording"""
-    await recorder.record(recording_id)
+    # The scan runs in a worker thread so the event loop keeps serving streams
+    await series_matcher.scan()
 
 async def cleanup_old_recordings():
     """Clean up old recordings based on retention settings"""
@@ -156,6 +52,7 @@ async def cleanup_old_recordings():
                         os.remove(recording.file_path)
                     except:
                         pass
+                    remove_sidecars(recording.file_path)
                 
                 # Delete record
                 db.delete(recording)
@@ -176,18 +73,12 @@ async def update_epg_sources():
 
 def start_scheduler():
     """Start the scheduler with all jobs"""
-    # Check scheduled recordings every minute
-    scheduler.add_job(
-        check_scheduled_recordings,
-        IntervalTrigger(minutes=1),
-        id='check_scheduled_recordings',
-        replace_existing=True
-    )
+    # Recording starts/stops are driven by recording_scheduler (see background_tasks)
     
-    # Check series recordings every 30 minutes
+    # Full series scan as a consistency check; EPG imports match new programmes as they arrive
     scheduler.add_job(
         check_series_recordings,
-        IntervalTrigger(minutes=30),
+        IntervalTrigger(minutes=settings.series_full_scan_minutes),
         id='check_series_recordings',
         replace_existing=True
     )
@@ -0,0 +1,394 @@
+"""
+Set-based series rule matcher
+
+Turns active series/recurring ``RecordingSchedule`` rules into scheduled
+``Recording`` rows for upcoming programmes. All rules are evaluated
+together in a handful of queries instead of a few queries per programme:
+
+1. rules with a ``series_id`` joined to programmes on ``series_id``
+2. rules with a ``title_pattern`` joined on ``title ILIKE '%pattern%'``,
+   restricted to the rule's channel when it has one
+
+both anti-joined against the user's existing recordings, then one
+grouped count of active recordings per user. ``max_recordings`` caps are
+applied in memory (in rule and start-time order, counting recordings
+created in the same run) and the new rows are inserted in one bulk
+statement.
+
+EPG imports push the programmes they add to ``match_programs``, which
+matches only those against a ``RuleIndex`` compiled from the active
+rules (a ``series_id`` map and a word index over title patterns), so new
+episodes are scheduled as soon as they appear in the guide. The full
+scan is left as a periodic consistency check.
+
+Matching only touches the database, so it can run in a worker thread
+(``scan``); the recordings it creates are handed to
+``recording_scheduler`` afterwards, on the event loop.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from collections import namedtuple
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Pattern, Set, Tuple
+
+from sqlalchemy import and_, exists, func, insert, literal, or_
+from sqlalchemy.orm import Session
+
+from app.models.epg import EPGProgram
+from app.database import SessionLocal
+from app.models.recording import Recording, RecordingSchedule, RecordingStatus, RecordingType
+from app.utils.recording_scheduler import recording_scheduler
+
+logger = logging.getLogger(__name__)
+
+LOOKAHEAD = timedelta(days=7)
+DELTA_CHUNK = 500  # Programme ids per IN (...) when matching an import delta
+
+WORD = re.compile(r"[^\W_]+")  # "_" is a LIKE wildcard, never part of a word
+
+# Same columns as the rows of SeriesMatcher._rule_query
+Candidate = namedtuple(
+    "Candidate",
+    "schedule_id user_id max_recordings program_id channel_id title start_time end_time",
+)
+
+
+def like_regex(pattern: str) -> Pattern:
+    """``ILIKE '%pattern%'`` as a regular expression"""
+    parts = []
+    for char in pattern:
+        if char == "%":
+            parts.append(".*")
+        elif char == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return re.compile("".join(parts), re.IGNORECASE | re.DOTALL)
+
+
+@dataclass
+class SeriesRule:
+    id: int
+    user_id: int
+    channel_id: Optional[int]
+    max_recordings: Optional[int]
+    series_id: Optional[str]
+    title: Optional[Pattern]
+
+
+class RuleIndex:
+    """Active series rules compiled for matching programmes in memory.
+
+    Rules with a ``series_id`` are looked up by it directly. Title
+    patterns are filed under their longest word: when a pattern matches
+    a title, each of its words lies inside one word of the title, so a
+    programme only has to look up the substrings of its own title words
+    and check the few rules found there against the full pattern.
+    """
+
+    def __init__(self, rules: Iterable[SeriesRule]):
+        self.by_series: Dict[str, List[SeriesRule]] = {}
+        self.by_word: Dict[str, List[SeriesRule]] = {}
+        self.unindexed: List[SeriesRule] = []  # Patterns without a word, e.g. "%"
+        self.longest_word = 0
+        self.size = 0
+        for rule in rules:
+            self.size += 1
+            if rule.series_id:
+                self.by_series.setdefault(rule.series_id, []).append(rule)
+                continue
+            words = WORD.findall(rule.title.pattern.lower())
+            if not words:
+                self.unindexed.append(rule)
+                continue
+            word = max(words, key=len)
+            self.by_word.setdefault(word, []).append(rule)
+            self.longest_word = max(self.longest_word, len(word))
+
+    def _title_keys(self, title: str) -> Set[str]:
+        keys = set()
+        for word in WORD.findall(title.lower()):
+            for start in range(len(word)):
+                for end in range(start + 1, min(len(word), start + self.longest_word) + 1):
+                    keys.add(word[start:end])
+        return keys
+
+    def match(self, series_id: Optional[str], title: str, channel_id: int) -> List[SeriesRule]:
+        matches = list(self.by_series.get(series_id, ())) if series_id else []
+        if not self.by_word and not self.unindexed:
+            return matches
+        candidates = list(self.unindexed)
+        for key in self._title_keys(title):
+            candidates.extend(self.by_word.get(key, ()))
+        for rule in candidates:
+            if rule.channel_id and rule.channel_id != channel_id:
+                continue
+            if rule.title.search(title):
+                matches.append(rule)
+        return matches
+
+
+@dataclass
+class SeriesMatchReport:
+    mode: str = "full"  # "full" scan, "rules" for just-created rules, or "delta" of imported programmes
+    programs: Optional[int] = None  # Imported programmes examined (delta only)
+    rules: int = 0
+    matches: int = 0  # Rule/programme pairs without an existing recording
+    created: int = 0
+    capped: int = 0  # Skipped because the user hit the rule's max_recordings
+    seconds: float = 0.0
+    finished_at: Optional[float] = None
+    # (id, start_time, end_time) of the created recordings, for ``SeriesMatcher.hand_off``
+    recordings: List[Tuple[int, datetime, datetime]] = field(default_factory=list, repr=False)
+
+    @property
+    def rules_per_second(self) -> float:
+        return round(self.rules / self.seconds, 1) if self.seconds else 0.0
+
+
+class SeriesMatcher:
+    """Evaluates all series rules in a few set-based queries"""
+
+    def __init__(self):
+        self.last_report: Optional[SeriesMatchReport] = None
+        self.last_delta: Optional[SeriesMatchReport] = None
+        self.runs = 0
+        self.deltas = 0
+
+    def _active_rules(self, db: Session):
+        return db.query(RecordingSchedule).filter(
+            RecordingSchedule.is_active == True,
+            RecordingSchedule.recording_type.in_([RecordingType.SERIES, RecordingType.RECURRING]),
+            or_(RecordingSchedule.series_id != "", RecordingSchedule.title_pattern != ""),
+        )
+
+    def load_index(self, db: Session) -> RuleIndex:
+        rows = self._active_rules(db).with_entities(
+            RecordingSchedule.id,
+            RecordingSchedule.user_id,
+            RecordingSchedule.channel_id,
+            RecordingSchedule.max_recordings,
+            RecordingSchedule.series_id,
+            RecordingSchedule.title_pattern,
+        ).all()
+        return RuleIndex(
+            SeriesRule(
+                id=row.id,
+                user_id=row.user_id,
+                channel_id=row.channel_id,
+                max_recordings=row.max_recordings,
+                series_id=row.series_id or None,
+                title=like_regex(row.title_pattern) if not row.series_id else None,
+            )
+            for row in rows
+        )
+
+    def _rule_query(self, db: Session, now: datetime, until: datetime, schedule_ids: Optional[List[int]]):
+        query = db.query(
+            RecordingSchedule.id.label("schedule_id"),
+            RecordingSchedule.user_id,
+            RecordingSchedule.max_recordings,
+            EPGProgram.id.label("program_id"),
+            EPGProgram.channel_id,
+            EPGProgram.title,
+            EPGProgram.start_time,
+            EPGProgram.end_time,
+        ).filter(
+            RecordingSchedule.is_active == True,
+            RecordingSchedule.recording_type.in_([RecordingType.SERIES, RecordingType.RECURRING]),
+            EPGProgram.start_time >= now,
+            EPGProgram.start_time <= until,
+            ~exists().where(and_(
+                Recording.user_id == RecordingSchedule.user_id,
+                Recording.program_id == EPGProgram.id,
+            )),
+        )
+        if schedule_ids is not None:
+            query = query.filter(RecordingSchedule.id.in_(schedule_ids))
+        return query
+
+    def _candidates(self, db: Session, now: datetime, until: datetime,
+                    schedule_ids: Optional[List[int]] = None) -> List:
+        by_series = self._rule_query(db, now, until, schedule_ids).join(
+            EPGProgram, EPGProgram.series_id == RecordingSchedule.series_id
+        ).filter(RecordingSchedule.series_id.isnot(None), RecordingSchedule.series_id != "")
+
+        by_title = self._rule_query(db, now, until, schedule_ids).join(
+            EPGProgram,
+            EPGProgram.title.ilike(literal("%") + RecordingSchedule.title_pattern + literal("%"))
+        ).filter(
+            or_(RecordingSchedule.series_id.is_(None), RecordingSchedule.series_id == ""),
+            RecordingSchedule.title_pattern.isnot(None),
+            RecordingSchedule.title_pattern != "",
+            or_(
+                RecordingSchedule.channel_id.is_(None),
+                RecordingSchedule.channel_id == EPGProgram.channel_id,
+            ),
+        )
+
+        return by_series.all() + by_title.all()
+
+    def _active_counts(self, db: Session, user_ids: Set[int]) -> Dict[int, int]:
+        if not user_ids:
+            return {}
+        return dict(
+            db.query(Recording.user_id, func.count(Recording.id))
+            .filter(
+                Recording.user_id.in_(user_ids),
+                Recording.status.in_([RecordingStatus.SCHEDULED, RecordingStatus.RECORDING]),
+            )
+            .group_by(Recording.user_id)
+            .all()
+        )
+
+    def run(self, db: Session, now: Optional[datetime] = None,
+            schedule_ids: Optional[List[int]] = None) -> SeriesMatchReport:
+        """Full scan: every active rule (or just ``schedule_ids``) against the whole lookahead window"""
+        started = time.time()
+        now = now or datetime.utcnow()
+        report = SeriesMatchReport(mode="full" if schedule_ids is None else "rules")
+        rules = self._active_rules(db)
+        if schedule_ids is not None:
+            rules = rules.filter(RecordingSchedule.id.in_(schedule_ids))
+        report.rules = rules.count()
+        candidates = self._candidates(db, now, now + LOOKAHEAD, schedule_ids)
+        self._schedule(db, candidates, report, started)
+        if schedule_ids is None:
+            self.last_report = report
+            self.runs += 1
+        return report
+
+    async def scan(self, schedule_ids: Optional[List[int]] = None) -> SeriesMatchReport:
+        """``run`` in a worker thread with its own session, then ``hand_off``"""
+        def run_with_session() -> SeriesMatchReport:
+            db = SessionLocal()
+            try:
+                return self.run(db, schedule_ids=schedule_ids)
+            finally:
+                db.close()
+
+        report = await asyncio.to_thread(run_with_session)
+        self.hand_off(report)
+        return report
+
+    def hand_off(self, report: SeriesMatchReport):
+        """Give the recordings a run created to the start/stop scheduler (event loop only)"""
+        for recording_id, start_time, end_time in report.recordings:
+            recording_scheduler.schedule(recording_id, start_time, end_time)
+
+    def match_programs(self, db: Session, program_ids: List[int],
+                       now: Optional[datetime] = None) -> SeriesMatchReport:
+        """Schedule recordings for just these (newly imported) programmes"""
+        started = time.time()
+        now = now or datetime.utcnow()
+        until = now + LOOKAHEAD
+        report = SeriesMatchReport(mode="delta", programs=0)
+        index = self.load_index(db)
+        report.rules = index.size
+
+        candidates = []
+        for i in range(0, len(program_ids) if index.size else 0, DELTA_CHUNK):
+            chunk = program_ids[i:i + DELTA_CHUNK]
+            programs = db.query(
+                EPGProgram.id,
+                EPGProgram.channel_id,
+                EPGProgram.title,
+                EPGProgram.series_id,
+                EPGProgram.start_time,
+                EPGProgram.end_time,
+            ).filter(
+                EPGProgram.id.in_(chunk),
+                EPGProgram.start_time >= now,
+                EPGProgram.start_time <= until,
+            ).all()
+            existing = set(
+                db.query(Recording.user_id, Recording.program_id)
+                .filter(Recording.program_id.in_(chunk))
+                .all()
+            )
+            report.programs += len(programs)
+            for program in programs:
+                for rule in index.match(program.series_id, program.title, program.channel_id):
+                    if (rule.user_id, program.id) in existing:
+                        continue
+                    candidates.append(Candidate(
+                        rule.id, rule.user_id, rule.max_recordings, program.id,
+                        program.channel_id, program.title, program.start_time, program.end_time,
+                    ))
+
+        self._schedule(db, candidates, report, started)
+        self.last_delta = report
+        self.deltas += 1
+        return report
+
+    def _schedule(self, db: Session, candidates: List, report: SeriesMatchReport, started: float):
+        """Insert recordings for ``candidates`` within the users' caps and fill in ``report``.
+
+        The new recordings are not handed to ``recording_scheduler`` here;
+        callers do that with ``hand_off`` on the event loop.
+        """
+        candidates.sort(key=lambda c: (c.schedule_id, c.start_time, c.program_id))
+        report.matches = len(candidates)
+        active = self._active_counts(db, {c.user_id for c in candidates})
+
+        rows = []
+        seen: Set[Tuple[int, int]] = set()
+        for c in candidates:
+            key = (c.user_id, c.program_id)
+            if key in seen:
+                continue  # Another rule of the same user already took this programme
+            if c.max_recordings and active.get(c.user_id, 0) >= c.max_recordings:
+                report.capped += 1
+                continue
+            seen.add(key)
+            active[c.user_id] = active.get(c.user_id, 0) + 1
+            rows.append({
+                "user_id": c.user_id,
+                "channel_id": c.channel_id,
+                "program_id": c.program_id,
+                "schedule_id": c.schedule_id,
+                "title": c.title,
+                "status": RecordingStatus.SCHEDULED,
+                "start_time": c.start_time,
+                "end_time": c.end_time,
+            })
+
+        if rows:
+            created = db.execute(
+                insert(Recording).returning(Recording.id, Recording.start_time, Recording.end_time),
+                rows
+            ).all()
+            report.recordings = [tuple(recording) for recording in created]
+        db.commit()
+
+        report.created = len(rows)
+        report.seconds = round(time.time() - started, 3)
+        report.finished_at = time.time()
+        examined = f"{report.programs} new programmes, " if report.mode == "delta" else ""
+        logger.info(
+            f"Series matcher ({report.mode}): {examined}{report.rules} rules, {report.matches} matches, "
+            f"{report.created} recordings created, {report.capped} capped "
+            f"({report.rules_per_second} rules/s)"
+        )
+
+    def get_stats(self) -> Dict:
+        def summary(report: Optional[SeriesMatchReport]) -> Optional[Dict]:
+            if report is None:
+                return None
+            stats = {k: v for k, v in asdict(report).items() if k != "recordings"}
+            return {**stats, "rules_per_second": report.rules_per_second}
+
+        return {
+            "runs": self.runs,
+            "deltas": self.deltas,
+            "last_run": summary(self.last_report),
+            "last_delta": summary(self.last_delta),
+        }
+
+
+# Global series matcher instance
+series_matcher = SeriesMatcher()
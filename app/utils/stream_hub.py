@@ -0,0 +1,419 @@
+"""
+Shared upstream fan-out for live streams
+
+One upstream reader per channel feeds an in-memory ring buffer; every
+viewer reads from the buffer with its own cursor. Late joiners start at
+the most recent MPEG-TS keyframe, viewers that fall out of the buffer
+are skipped ahead (and eventually dropped), and the upstream is closed a
+short while after the last viewer leaves.
+
+Popular channels (the top ``stream_warm_top_n`` by recent tunes) and
+pinned channels (``stream_warm_channels``) instead stay warm without
+viewers, buffering only the current GOP, so the next tune starts at a
+keyframe immediately. Warm channels are evicted after
+``stream_warm_idle_timeout`` seconds without a viewer or when their
+buffers exceed ``stream_warm_memory_budget``.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Deque, Dict, Hashable, List, Optional, Set
+
+from app.config import get_settings
+from app.utils.mpegts import PacketAligner, ProgramMap, split_at_random_access
+
+logger = logging.getLogger(__name__)
+
+# Tune counts halve every hour when ranking popular channels
+POPULARITY_HALF_LIFE = 3600
+WARM_REAP_INTERVAL = 15
+
+UpstreamFactory = Callable[[], AsyncIterator[bytes]]
+
+
+@dataclass
+class BufferedChunk:
+    seq: int
+    data: bytes
+    keyframe: bool
+
+
+@dataclass
+class ViewerStats:
+    """Per-viewer counters"""
+    joined_at: float = field(default_factory=time.time)
+    bytes_sent: int = 0
+    skips: int = 0
+
+
+class ChannelBroadcast:
+    """A single upstream connection shared by all viewers of one channel"""
+
+    def __init__(self, key: Hashable, open_upstream: UpstreamFactory,
+                 buffer_size: int, max_skips: int, linger: float):
+        self.key = key
+        self.open_upstream = open_upstream
+        self.buffer_size = buffer_size
+        self.max_skips = max_skips
+        self.linger = linger
+
+        self.chunks: Deque[BufferedChunk] = deque()
+        self.buffered_bytes = 0
+        self.next_seq = 0
+        self.last_keyframe_seq: Optional[int] = None
+        self.upstream_bytes = 0
+        self.started_at = time.time()
+        self.viewers: Dict[int, ViewerStats] = {}
+
+        self.finished = False
+        self.error: Optional[Exception] = None
+        self.aligner = PacketAligner()
+        self.programs = ProgramMap()
+        # Kept open without viewers by the hub's warm policy
+        self.warm = False
+        self.idle_since: Optional[float] = None
+
+        self._cond = asyncio.Condition()
+        self._viewer_ids = 0
+        self._pump_task: Optional[asyncio.Task] = None
+        self._linger_task: Optional[asyncio.Task] = None
+        self.on_close: Optional[Callable[["ChannelBroadcast"], None]] = None
+        self.on_idle: Optional[Callable[["ChannelBroadcast"], None]] = None
+
+    @property
+    def shareable(self) -> bool:
+        """Only transport streams can be joined mid-stream safely"""
+        return not self.finished and self.aligner.is_ts is not False
+
+    def start(self):
+        self._pump_task = asyncio.create_task(self._pump())
+
+    async def _pump(self):
+        """Read upstream into the ring buffer"""
+        upstream = self.open_upstream()
+        try:
+            async for data in upstream:
+                self.upstream_bytes += len(data)
+                aligned = self.aligner.feed(data)
+                if aligned:
+                    await self._append(aligned)
+            tail = self.aligner.flush()
+            if tail:
+                await self._append(tail)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Upstream for channel {self.key} failed: {e}")
+            self.error = e
+        finally:
+            # Close the upstream now (HTTP response, ffmpeg process) rather than at GC time
+            try:
+                await upstream.aclose()
+            except Exception:
+                pass
+            self.finished = True
+            async with self._cond:
+                self._cond.notify_all()
+            self._close()
+
+    async def _append(self, data: bytes):
+        if self.aligner.is_ts:
+            pieces = split_at_random_access(data, self.programs)
+        else:
+            pieces = [(data, False)]
+
+        async with self._cond:
+            for piece, keyframe in pieces:
+                self.chunks.append(BufferedChunk(self.next_seq, piece, keyframe))
+                if keyframe:
+                    self.last_keyframe_seq = self.next_seq
+                self.next_seq += 1
+                self.buffered_bytes += len(piece)
+
+            # Trim the ring, but always keep the newest chunk
+            while self.buffered_bytes > self.buffer_size and len(self.chunks) > 1:
+                self.buffered_bytes -= len(self.chunks.popleft().data)
+            if not self.viewers and self.last_keyframe_seq is not None:
+                # Nobody is reading: only the current GOP is needed for the next join
+                while len(self.chunks) > 1 and self.chunks[0].seq < self.last_keyframe_seq:
+                    self.buffered_bytes -= len(self.chunks.popleft().data)
+            self._cond.notify_all()
+
+    def _join_position(self) -> int:
+        """Where a new (or skipped-ahead) viewer starts reading"""
+        oldest = self.chunks[0].seq if self.chunks else self.next_seq
+        if self.last_keyframe_seq is not None and self.last_keyframe_seq >= oldest:
+            return self.last_keyframe_seq
+        if not self.aligner.is_ts:
+            # Unknown format: the very start of the stream is the only safe entry point
+            return oldest
+        return self.next_seq
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        """Yield stream data for one viewer"""
+        self._viewer_ids += 1
+        viewer_id = self._viewer_ids
+        stats = ViewerStats()
+        self.viewers[viewer_id] = stats
+        self.idle_since = None
+        if self._linger_task:
+            self._linger_task.cancel()
+            self._linger_task = None
+
+        cursor = self._join_position()
+        try:
+            while True:
+                async with self._cond:
+                    await self._cond.wait_for(lambda: cursor < self.next_seq or self.finished)
+                    if cursor >= self.next_seq and self.finished:
+                        break
+
+                    oldest = self.chunks[0].seq
+                    if cursor < oldest:
+                        # Fell out of the ring buffer: jump to the newest keyframe
+                        stats.skips += 1
+                        if stats.skips > self.max_skips:
+                            logger.warning(f"Dropping slow viewer {viewer_id} on channel {self.key}")
+                            break
+                        logger.info(f"Viewer {viewer_id} on channel {self.key} skipped ahead")
+                        cursor = max(self._join_position(), oldest)
+                        continue
+
+                    start = cursor - oldest
+                    batch = [self.chunks[i].data for i in range(start, len(self.chunks))]
+                    cursor = self.next_seq
+
+                # Write outside the lock so one slow socket never blocks the others
+                for data in batch:
+                    stats.bytes_sent += len(data)
+                    yield data
+
+            if self.error and stats.bytes_sent == 0:
+                raise self.error
+        finally:
+            self.viewers.pop(viewer_id, None)
+            if not self.viewers and not self.finished:
+                self.idle_since = time.time()
+                if self.on_idle:
+                    self.on_idle(self)
+                else:
+                    self.start_linger()
+
+    def start_linger(self):
+        if self._linger_task is None or self._linger_task.done():
+            self._linger_task = asyncio.create_task(self._linger_then_stop())
+
+    async def _linger_then_stop(self):
+        """Keep the upstream briefly so quick channel flips back are instant"""
+        try:
+            await asyncio.sleep(self.linger)
+        except asyncio.CancelledError:
+            return
+        if not self.viewers:
+            await self.stop()
+
+    async def stop(self):
+        if self._pump_task and not self._pump_task.done():
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._close()
+
+    def _close(self):
+        if self.on_close:
+            callback, self.on_close = self.on_close, None
+            callback(self)
+
+    def get_stats(self) -> Dict:
+        return {
+            "channel": self.key,
+            "viewers": len(self.viewers),
+            "started_at": self.started_at,
+            "upstream_bytes": self.upstream_bytes,
+            "buffered_bytes": self.buffered_bytes,
+            "is_ts": self.aligner.is_ts,
+            "finished": self.finished,
+            "warm": self.warm,
+            "idle_seconds": int(time.time() - self.idle_since) if self.idle_since else None,
+            "viewer_bytes_sent": [v.bytes_sent for v in self.viewers.values()],
+            "viewer_skips": [v.skips for v in self.viewers.values()],
+        }
+
+
+class StreamHub:
+    """Registry of active channel broadcasts"""
+
+    def __init__(self, buffer_size: int, max_skips: int, linger: float,
+                 warm_channels: Set[Hashable], warm_top_n: int,
+                 warm_idle_timeout: int, warm_memory_budget: int):
+        self.buffer_size = buffer_size
+        self.max_skips = max_skips
+        self.linger = linger
+        self.warm_channels = warm_channels
+        self.warm_top_n = warm_top_n
+        self.warm_idle_timeout = warm_idle_timeout
+        self.warm_memory_budget = warm_memory_budget
+        self.broadcasts: Dict[Hashable, ChannelBroadcast] = {}
+        # key -> (decayed tune count, last update)
+        self.popularity: Dict[Hashable, tuple] = {}
+        # Pinned channels started by prewarm(), restarted if their upstream ends
+        self.pinned_upstreams: Dict[Hashable, UpstreamFactory] = {}
+        self.evictions = 0
+        self._warm_task: Optional[asyncio.Task] = None
+
+    def subscribe(self, key: Hashable, open_upstream: UpstreamFactory,
+                  on_close: Optional[Callable[[ChannelBroadcast], None]] = None) -> AsyncIterator[bytes]:
+        """Join (or start) the broadcast for ``key`` and return the viewer's stream.
+
+        ``on_close`` is called once when a broadcast started by this call ends.
+        """
+        self._record_tune(key)
+        broadcast = self.broadcasts.get(key)
+        if broadcast is None or not broadcast.shareable:
+            broadcast = self._start(key, open_upstream, on_close)
+            # The viewer only registers once its response body starts; if the client
+            # is gone before that, the linger closes the upstream (a join cancels it)
+            broadcast.idle_since = time.time()
+            broadcast.start_linger()
+        return broadcast.subscribe()
+
+    def prewarm(self, key: Hashable, open_upstream: UpstreamFactory):
+        """Open a pinned channel's upstream before anyone tunes to it"""
+        self.pinned_upstreams[key] = open_upstream
+        if not self.is_active(key):
+            broadcast = self._start(key, open_upstream)
+            broadcast.warm = True
+            broadcast.idle_since = time.time()
+            self._ensure_warm_reaper()
+
+    def _start(self, key: Hashable, open_upstream: UpstreamFactory,
+               on_close: Optional[Callable[[ChannelBroadcast], None]] = None) -> ChannelBroadcast:
+        broadcast = ChannelBroadcast(key, open_upstream, self.buffer_size, self.max_skips, self.linger)
+
+        def closed(b: ChannelBroadcast):
+            self._remove(b)
+            if on_close:
+                on_close(b)
+
+        broadcast.on_close = closed
+        broadcast.on_idle = self._on_idle
+        self.broadcasts[key] = broadcast
+        broadcast.start()
+        logger.info(f"Started shared upstream for channel {key}")
+        return broadcast
+
+    # ---- Warm channels ----
+
+    def _record_tune(self, key: Hashable):
+        now = time.time()
+        count, updated = self.popularity.get(key, (0.0, now))
+        self.popularity[key] = (count * 0.5 ** ((now - updated) / POPULARITY_HALF_LIFE) + 1, now)
+
+    def popular_channels(self) -> List[Hashable]:
+        """Channel keys ranked by recent tunes (transcode keys are never kept warm)"""
+        now = time.time()
+        scores = {
+            key: count * 0.5 ** ((now - updated) / POPULARITY_HALF_LIFE)
+            for key, (count, updated) in self.popularity.items()
+            if not isinstance(key, tuple)
+        }
+        return sorted(scores, key=scores.get, reverse=True)
+
+    def should_keep_warm(self, key: Hashable) -> bool:
+        if key in self.warm_channels:
+            return True
+        return self.warm_top_n > 0 and key in self.popular_channels()[:self.warm_top_n]
+
+    def _on_idle(self, broadcast: ChannelBroadcast):
+        if broadcast.shareable and self.should_keep_warm(broadcast.key):
+            broadcast.warm = True
+            self._ensure_warm_reaper()
+        else:
+            broadcast.warm = False
+            broadcast.start_linger()
+
+    def _ensure_warm_reaper(self):
+        if self._warm_task is None or self._warm_task.done():
+            self._warm_task = asyncio.create_task(self._warm_reap_loop())
+
+    async def _warm_reap_loop(self):
+        """Evict idle warm channels and restart pinned ones; exits when none are left"""
+        while any(b.warm for b in self.broadcasts.values()) or self.pinned_upstreams:
+            await asyncio.sleep(WARM_REAP_INTERVAL)
+            await self._evict_warm()
+            for key, open_upstream in self.pinned_upstreams.items():
+                if not self.is_active(key):
+                    logger.info(f"Restarting pinned warm channel {key}")
+                    self.prewarm(key, open_upstream)
+
+    async def _evict_warm(self):
+        now = time.time()
+        idle = [b for b in self.broadcasts.values() if b.warm and not b.viewers and b.idle_since]
+
+        for broadcast in list(idle):
+            pinned = broadcast.key in self.warm_channels
+            if not pinned and (now - broadcast.idle_since > self.warm_idle_timeout
+                               or not self.should_keep_warm(broadcast.key)):
+                logger.info(f"Evicting idle warm channel {broadcast.key}")
+                idle.remove(broadcast)
+                self.evictions += 1
+                await broadcast.stop()
+
+        # Over budget: drop the channels that have been unwatched longest first (pinned ones stay)
+        total = sum(b.buffered_bytes for b in idle)
+        candidates = sorted((b for b in idle if b.key not in self.warm_channels), key=lambda b: b.idle_since)
+        while candidates and total > self.warm_memory_budget:
+            broadcast = candidates.pop(0)
+            total -= broadcast.buffered_bytes
+            logger.info(f"Evicting warm channel {broadcast.key} (memory budget)")
+            self.evictions += 1
+            await broadcast.stop()
+
+    def is_active(self, key: Hashable) -> bool:
+        """True if a new viewer of ``key`` would join an existing upstream"""
+        broadcast = self.broadcasts.get(key)
+        return broadcast is not None and broadcast.shareable
+
+    def is_idle(self, key: Hashable) -> bool:
+        """True if ``key`` is open but nobody is watching (e.g. kept warm)"""
+        broadcast = self.broadcasts.get(key)
+        return broadcast is not None and not broadcast.viewers
+
+    async def stop(self, key: Hashable):
+        broadcast = self.broadcasts.get(key)
+        if broadcast:
+            await broadcast.stop()
+
+    def _remove(self, broadcast: ChannelBroadcast):
+        if self.broadcasts.get(broadcast.key) is broadcast:
+            del self.broadcasts[broadcast.key]
+            logger.info(f"Closed shared upstream for channel {broadcast.key}")
+
+    async def stop_all(self):
+        self.pinned_upstreams.clear()
+        if self._warm_task:
+            self._warm_task.cancel()
+        for broadcast in list(self.broadcasts.values()):
+            await broadcast.stop()
+
+    def get_stats(self) -> list:
+        return [b.get_stats() for b in self.broadcasts.values()]
+
+
+settings = get_settings()
+
+# Global stream hub instance
+stream_hub = StreamHub(
+    buffer_size=settings.stream_buffer_size,
+    max_skips=settings.stream_max_skips,
+    linger=settings.stream_linger_seconds,
+    warm_channels={int(c) for c in settings.stream_warm_channels.split(",") if c.strip()},
+    warm_top_n=settings.stream_warm_top_n,
+    warm_idle_timeout=settings.stream_warm_idle_timeout,
+    warm_memory_budget=settings.stream_warm_memory_budget,
+)
@@ -0,0 +1,414 @@
+"""
+Stream health prober
+
+Checks channel stream URLs in the background and records the result in
+``channel_probes``: status, HTTP status, time to first byte and (when
+ffprobe is available and enabled) the codecs.
+
+A probe is a ranged GET that reads only the first chunk, since many IPTV
+servers don't answer HEAD. Probes run on a pool of ``stream_probe_concurrency``
+workers, with at most ``stream_probe_per_host`` in flight against any one
+host and the queue interleaved by host, so a large lineup on one provider
+does not block the workers or flood that provider.
+
+Re-probes are scheduled adaptively: online channels every
+``stream_probe_interval`` (with jitter so checks spread out), failing ones
+after ``stream_probe_retry`` seconds, doubling per consecutive failure.
+After ``stream_probe_deactivate_after`` failures in a row a channel is
+deactivated (which is what the offline cleanup acts on), and it is
+reactivated once it answers again. Channels deactivated by hand are left
+alone.
+
+Periodic probing of the whole lineup is opt-in (``stream_probe_enabled``);
+playlists imported with ``test_streams`` and admin requests are always
+probed.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import shutil
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+from urllib.parse import urlparse
+
+import httpx
+from sqlalchemy import or_
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.utils.http_clients import http_clients
+from app.utils.tuner_slots import tuner_slots, SlotUnavailable, PRIORITY_PROBE
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 2000  # Channels loaded and saved per round
+PROBE_BYTES = 4096
+FFPROBE_CONCURRENCY = 4  # ffprobe decodes, so keep it well below the HTTP concurrency
+FFPROBE_TIMEOUT = 20
+DEFER_SECONDS = 300  # Retry delay for channels skipped because their provider is busy
+JITTER = 0.1
+
+
+@dataclass
+class ProbeTarget:
+    channel_id: int
+    url: str
+    playlist_id: Optional[int]
+    codec: Optional[str] = None
+
+
+@dataclass
+class ProbeResult:
+    channel_id: int
+    status: Optional[str]  # None: not probed (provider busy)
+    http_status: Optional[int] = None
+    latency_ms: Optional[int] = None
+    codec: Optional[str] = None
+    error: Optional[str] = None
+
+
+class StreamProber:
+    """Bounded-concurrency channel prober with adaptive re-probe schedule"""
+
+    def __init__(self, enabled: bool, concurrency: int, per_host: int, interval: int,
+                 retry: int, deactivate_after: int, use_ffprobe: bool):
+        self.enabled = enabled
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.interval = interval
+        self.retry = retry
+        self.deactivate_after = deactivate_after
+        self.use_ffprobe = use_ffprobe and shutil.which("ffprobe") is not None
+        self.requested_channels: Set[int] = set()
+        self.requested_playlists: Set[int] = set()
+        self.running = False
+        self.probed = 0
+        self.online = 0
+        self.offline = 0
+        self.deactivated = 0
+        self.reactivated = 0
+        self.last_run: Optional[Dict] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        self._ffprobe_limit: Optional[asyncio.Semaphore] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    # ---- Requests ----
+
+    def request(self, channel_ids: Iterable[int] = (), playlist_id: Optional[int] = None):
+        """Probe these channels (or a whole playlist) on the next round, enabled or not"""
+        self.requested_channels.update(channel_ids)
+        if playlist_id is not None:
+            self.requested_playlists.add(playlist_id)
+        if self._wake:
+            self._wake.set()
+
+    async def run_forever(self, poll_seconds: int = 60):
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await self.run_due()
+            except Exception as e:
+                logger.error(f"Stream probe round failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    # ---- Rounds ----
+
+    async def run_due(self) -> Dict:
+        """Probe everything due (or requested); returns counts for this run"""
+        if self.running:
+            return {"skipped": "already running"}
+        self.running = True
+        started = time.time()
+        counts = {"probed": 0, "online": 0, "offline": 0, "deferred": 0}
+        try:
+            channels = set(self.requested_channels)
+            playlists = set(self.requested_playlists)
+            self.requested_channels.clear()
+            self.requested_playlists.clear()
+
+            since = datetime.utcnow()
+            while True:
+                targets = await asyncio.to_thread(self._load_due, channels, playlists, since)
+                if not targets:
+                    break
+                results = await self._probe_all(targets)
+                await asyncio.to_thread(self._save, results)
+                probed = sum(1 for r in results if r.status)
+                counts["probed"] += probed
+                for result in results:
+                    counts[result.status or "deferred"] += 1
+                # A batch where every provider was busy would just be loaded again
+                if len(targets) < BATCH_SIZE or not probed:
+                    break
+        finally:
+            self.running = False
+
+        if counts["probed"] or counts["deferred"]:
+            counts["seconds"] = round(time.time() - started, 1)
+            self.last_run = {**counts, "finished_at": time.time()}
+            logger.info(f"Stream probe round: {counts}")
+        return counts
+
+    def _load_due(self, channels: Set[int], playlists: Set[int], since: datetime) -> List[ProbeTarget]:
+        from app.models.channel import Channel, ChannelProbe
+
+        db = SessionLocal()
+        try:
+            query = db.query(
+                Channel.id, Channel.stream_url, Channel.playlist_id, ChannelProbe.codec
+            ).outerjoin(ChannelProbe, ChannelProbe.channel_id == Channel.id).filter(
+                # Skip channels an admin switched off; keep ones we switched off ourselves
+                or_(Channel.is_active == True, ChannelProbe.deactivated == True)
+            )
+            if channels or playlists:
+                conditions = []
+                if channels:
+                    conditions.append(Channel.id.in_(channels))
+                if playlists:
+                    conditions.append(Channel.playlist_id.in_(playlists))
+                # Requested channels are probed once per round even if not yet due
+                query = query.filter(or_(*conditions)).filter(or_(
+                    ChannelProbe.checked_at == None,
+                    ChannelProbe.checked_at < since
+                ))
+            elif self.enabled:
+                query = query.filter(or_(
+                    ChannelProbe.next_check_at == None,
+                    ChannelProbe.next_check_at <= datetime.utcnow()
+                )).order_by(ChannelProbe.next_check_at)
+            else:
+                return []
+
+            return [
+                ProbeTarget(channel_id, url, playlist_id, codec)
+                for channel_id, url, playlist_id, codec in query.limit(BATCH_SIZE)
+            ]
+        finally:
+            db.close()
+
+    async def _probe_all(self, targets: List[ProbeTarget]) -> List[ProbeResult]:
+        queue: asyncio.Queue = asyncio.Queue()
+        for target in _interleave_by_host(targets):
+            queue.put_nowait(target)
+        results: List[ProbeResult] = []
+
+        async def worker():
+            while True:
+                try:
+                    target = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                results.append(await self.probe(target))
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(targets)))))
+        return results
+
+    # ---- Single probe ----
+
+    async def probe(self, target: ProbeTarget) -> ProbeResult:
+        host = urlparse(target.url).hostname or ""
+        async with self._host_limits[host]:
+            result = await self._with_slot(target, lambda: self._http_probe(target))
+        if result is None:
+            # No free provider connection: a viewer or recording may need it
+            return ProbeResult(target.channel_id, None)
+        self.probed += 1
+
+        if result.status == "online":
+            self.online += 1
+            result.codec = target.codec
+            if self.use_ffprobe and not target.codec:
+                result.codec = await self._with_slot(target, lambda: self._ffprobe(target.url))
+        else:
+            self.offline += 1
+        return result
+
+    async def _with_slot(self, target: ProbeTarget, run: Callable[[], Awaitable]):
+        """Run ``run()`` holding a tuner slot, or return None if none is free"""
+        slot = ("probe", target.channel_id)
+        try:
+            await tuner_slots.acquire(slot, target.playlist_id, priority=PRIORITY_PROBE, timeout=0)
+        except SlotUnavailable:
+            return None
+        try:
+            return await run()
+        finally:
+            tuner_slots.release(slot)
+
+    async def _http_probe(self, target: ProbeTarget) -> ProbeResult:
+        started = time.monotonic()
+        try:
+            async with http_clients.get("probe").stream(
+                "GET", target.url, headers={"Range": f"bytes=0-{PROBE_BYTES - 1}"}
+            ) as response:
+                if response.status_code >= 400:
+                    return ProbeResult(target.channel_id, "offline", http_status=response.status_code,
+                                       error=f"HTTP {response.status_code}")
+                async for chunk in response.aiter_bytes():
+                    if chunk:
+                        break
+                else:
+                    return ProbeResult(target.channel_id, "offline", http_status=response.status_code,
+                                       error="Empty response")
+                return ProbeResult(
+                    target.channel_id, "online",
+                    http_status=response.status_code,
+                    latency_ms=int((time.monotonic() - started) * 1000),
+                )
+        except httpx.HTTPError as e:
+            return ProbeResult(target.channel_id, "offline", error=f"{type(e).__name__}: {e}"[:500])
+
+    async def _ffprobe(self, url: str) -> Optional[str]:
+        if self._ffprobe_limit is None:
+            self._ffprobe_limit = asyncio.Semaphore(FFPROBE_CONCURRENCY)
+        async with self._ffprobe_limit:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    'ffprobe', '-v', 'error',
+                    '-rw_timeout', str(10 * 1000000),
+                    '-show_entries', 'stream=codec_type,codec_name,width,height',
+                    '-of', 'json', url,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+            except OSError:
+                return None
+            try:
+                stdout, _ = await asyncio.wait_for(process.communicate(), FFPROBE_TIMEOUT)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                return None
+        try:
+            streams = json.loads(stdout or b"{}").get("streams", [])
+        except ValueError:
+            return None
+        parts = []
+        for stream in streams:
+            if stream.get("codec_type") == "video" and stream.get("width"):
+                parts.append(f"{stream.get('codec_name')} {stream['width']}x{stream.get('height')}")
+            elif stream.get("codec_type") in ("video", "audio"):
+                parts.append(stream.get("codec_name") or "unknown")
+        return ", ".join(parts) or None
+
+    # ---- Persistence ----
+
+    def _next_check(self, now: datetime, result: ProbeResult, failures: int) -> datetime:
+        if result.status is None:
+            seconds = DEFER_SECONDS
+        elif result.status == "online":
+            seconds = self.interval
+        else:
+            seconds = min(self.retry * 2 ** max(failures - 1, 0), self.interval)
+        return now + timedelta(seconds=seconds * random.uniform(1 - JITTER, 1 + JITTER))
+
+    def _save(self, results: List[ProbeResult]):
+        from app.models.channel import Channel, ChannelProbe
+
+        now = datetime.utcnow()
+        by_id = {r.channel_id: r for r in results}
+        deactivate: List[int] = []
+        reactivate: List[int] = []
+
+        db = SessionLocal()
+        try:
+            ids = list(by_id)
+            existing: Dict[int, ChannelProbe] = {}
+            for start in range(0, len(ids), 500):
+                for row in db.query(ChannelProbe).filter(ChannelProbe.channel_id.in_(ids[start:start + 500])):
+                    existing[row.channel_id] = row
+
+            for channel_id, result in by_id.items():
+                row = existing.get(channel_id)
+                if row is None:
+                    row = ChannelProbe(channel_id=channel_id, consecutive_failures=0, deactivated=False)
+                    db.add(row)
+
+                if result.status is None:
+                    row.next_check_at = self._next_check(now, result, row.consecutive_failures or 0)
+                    continue
+
+                row.status = result.status
+                row.http_status = result.http_status
+                row.latency_ms = result.latency_ms
+                row.error = result.error
+                row.checked_at = now
+                if result.status == "online":
+                    row.codec = result.codec
+                    row.consecutive_failures = 0
+                    if row.deactivated:
+                        row.deactivated = False
+                        reactivate.append(channel_id)
+                else:
+                    row.consecutive_failures = (row.consecutive_failures or 0) + 1
+                    if (self.deactivate_after > 0 and not row.deactivated
+                            and row.consecutive_failures >= self.deactivate_after):
+                        row.deactivated = True
+                        deactivate.append(channel_id)
+                row.next_check_at = self._next_check(now, result, row.consecutive_failures)
+
+            for changed, active in ((deactivate, False), (reactivate, True)):
+                for start in range(0, len(changed), 500):
+                    db.query(Channel).filter(Channel.id.in_(changed[start:start + 500])).update(
+                        {Channel.is_active: active}, synchronize_session=False
+                    )
+            db.commit()
+        finally:
+            db.close()
+
+        self.deactivated += len(deactivate)
+        self.reactivated += len(reactivate)
+        if deactivate or reactivate:
+            logger.info(f"Stream prober deactivated {len(deactivate)} and reactivated {len(reactivate)} channels")
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "ffprobe": self.use_ffprobe,
+            "probed": self.probed,
+            "online": self.online,
+            "offline": self.offline,
+            "deactivated": self.deactivated,
+            "reactivated": self.reactivated,
+            "pending_requests": len(self.requested_channels) + len(self.requested_playlists),
+            "last_run": self.last_run,
+        }
+
+
+def _interleave_by_host(targets: List[ProbeTarget]) -> List[ProbeTarget]:
+    """Round-robin across hosts so workers don't all queue on one provider"""
+    by_host: "OrderedDict[str, List[ProbeTarget]]" = OrderedDict()
+    for target in targets:
+        by_host.setdefault(urlparse(target.url).hostname or "", []).append(target)
+    queues = [list(reversed(items)) for items in by_host.values()]
+    ordered = []
+    while queues:
+        for queue in list(queues):
+            ordered.append(queue.pop())
+            if not queue:
+                queues.remove(queue)
+    return ordered
+
+
+settings = get_settings()
+
+# Global stream prober instance
+stream_prober = StreamProber(
+    enabled=settings.stream_probe_enabled,
+    concurrency=settings.stream_probe_concurrency,
+    per_host=settings.stream_probe_per_host,
+    interval=settings.stream_probe_interval,
+    retry=settings.stream_probe_retry,
+    deactivate_after=settings.stream_probe_deactivate_after,
+    use_ffprobe=settings.stream_probe_ffprobe,
+)
@@ -0,0 +1,127 @@
+"""
+Redirect passthrough
+
+Clients that can reach the provider themselves don't need every byte
+relayed through the proxy. For channels and users selected by policy
+(``stream_redirect_channels`` / ``stream_redirect_users``) the stream
+endpoint answers with a 302 to the upstream URL instead.
+
+Provider URLs usually bounce through one or more redirects (load
+balancers, tokenised CDN edges); the final URL is resolved once and cached
+for ``stream_redirect_cache_ttl`` seconds so clients land on it directly.
+
+Players that can't send credentials get a signed link instead of an
+access token: an HMAC over channel, user and expiry that is valid for
+``stream_redirect_ttl`` seconds, so upstream URLs are only handed out to
+authorised users and the link cannot be reused later.
+
+Redirected clients connect to the provider directly, so their connections
+are not counted in ``tuner_slots``.
+"""
+
+import hashlib
+import hmac
+import logging
+import time
+from typing import Dict, Optional, Set, Tuple
+
+import httpx
+
+from app.config import get_settings
+from app.utils.http_clients import http_clients
+
+logger = logging.getLogger(__name__)
+
+
+class StreamRedirects:
+    """Redirect policy, resolved-URL cache and link signing"""
+
+    def __init__(self, channels: str, users: str, link_ttl: int, cache_ttl: int, secret: str):
+        self.all_channels = channels.strip() == "*"
+        self.channels: Set[int] = set() if self.all_channels else {
+            int(c) for c in channels.split(",") if c.strip()
+        }
+        self.users: Set[str] = {u.strip() for u in users.split(",") if u.strip()}
+        self.link_ttl = link_ttl
+        self.cache_ttl = cache_ttl
+        self._secret = secret.encode()
+        self.resolved: Dict[str, Tuple[float, str]] = {}  # url -> (expires_at, final url)
+        self.redirects = 0
+        self.hits = 0
+        self.misses = 0
+
+    # ---- Policy ----
+
+    def applies(self, channel_id: int, user) -> bool:
+        """True if this channel (or this user) is served by redirect"""
+        if self.all_channels or channel_id in self.channels:
+            return True
+        return user is not None and user.username in self.users
+
+    # ---- Resolution ----
+
+    async def resolve(self, url: str) -> str:
+        """Final URL after the provider's redirect chain (cached)"""
+        now = time.time()
+        entry = self.resolved.get(url)
+        if entry and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+
+        final = url
+        try:
+            # Headers only: the body is the stream itself
+            async with http_clients.get("probe").stream("GET", url) as response:
+                final = str(response.url)
+        except httpx.HTTPError as e:
+            # Let the client try the original URL itself
+            logger.warning(f"Could not resolve redirects for {url}: {e}")
+            return url
+
+        self.resolved[url] = (now + self.cache_ttl, final)
+        # Drop expired entries now and then rather than on every call
+        if len(self.resolved) > 1024:
+            self.resolved = {k: v for k, v in self.resolved.items() if v[0] > now}
+        return final
+
+    # ---- Signed links ----
+
+    def _signature(self, channel_id: int, user_id: Optional[int], expires: int) -> str:
+        message = f"{channel_id}:{user_id or 0}:{expires}".encode()
+        return hmac.new(self._secret, message, hashlib.sha256).hexdigest()[:32]
+
+    def sign(self, channel_id: int, user_id: Optional[int]) -> Dict:
+        """Query parameters for a short-lived redirect link"""
+        expires = int(time.time()) + self.link_ttl
+        return {
+            "user": user_id or 0,
+            "expires": expires,
+            "signature": self._signature(channel_id, user_id, expires),
+        }
+
+    def verify(self, channel_id: int, user_id: int, expires: int, signature: str) -> bool:
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self._signature(channel_id, user_id, expires), signature)
+
+    def get_stats(self) -> Dict:
+        return {
+            "all_channels": self.all_channels,
+            "channels": sorted(self.channels),
+            "users": sorted(self.users),
+            "redirects": self.redirects,
+            "resolve_cache": {"entries": len(self.resolved), "hits": self.hits, "misses": self.misses},
+        }
+
+
+settings = get_settings()
+
+# Global redirect passthrough instance
+stream_redirects = StreamRedirects(
+    channels=settings.stream_redirect_channels,
+    users=settings.stream_redirect_users,
+    link_ttl=settings.stream_redirect_ttl,
+    cache_ttl=settings.stream_redirect_cache_ttl,
+    secret=settings.secret_key,
+)
@@ -0,0 +1,170 @@
+"""
+Registry of active proxied streams
+
+Every stream served by the proxy is wrapped in a session that records who
+is watching what, from where, how many bytes have been sent and at what
+bitrate. The registry backs the admin streams endpoint, which is used to
+size hardware and to find (and stop) bandwidth hogs.
+"""
+
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+# Bitrate is averaged over windows of this many seconds
+BITRATE_WINDOW = 2.0
+
+
+@dataclass
+class StreamSession:
+    """One client connection to a proxied stream"""
+    id: str
+    channel_id: int
+    channel_name: str
+    mode: str
+    username: Optional[str]
+    client: str
+    user_agent: str
+    started_at: float = field(default_factory=time.time)
+    first_byte_at: Optional[float] = None
+    bytes_sent: int = 0
+    bitrate: float = 0.0  # bits/sec over the last window
+    stop_requested: bool = False
+    _window_start: float = field(default_factory=time.monotonic)
+    _window_bytes: int = 0
+
+    def record(self, nbytes: int):
+        if self.first_byte_at is None:
+            self.first_byte_at = time.time()
+        self.bytes_sent += nbytes
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= BITRATE_WINDOW:
+            self.bitrate = (self.bytes_sent - self._window_bytes) * 8 / elapsed
+            self._window_start = now
+            self._window_bytes = self.bytes_sent
+
+    @property
+    def ttfb(self) -> Optional[float]:
+        """Seconds from request to the first byte the upstream delivered"""
+        return self.first_byte_at - self.started_at if self.first_byte_at else None
+
+    def to_dict(self) -> Dict:
+        now = time.time()
+        duration = now - self.started_at
+        return {
+            "id": self.id,
+            "channel_id": self.channel_id,
+            "channel_name": self.channel_name,
+            "mode": self.mode,
+            "username": self.username,
+            "client": self.client,
+            "user_agent": self.user_agent,
+            "started_at": self.started_at,
+            "duration_seconds": int(duration),
+            "bytes_sent": self.bytes_sent,
+            "bitrate_kbps": round(self.bitrate / 1000, 1),
+            "average_kbps": round(self.bytes_sent * 8 / duration / 1000, 1) if duration > 0 else 0.0,
+            "ttfb": round(self.ttfb, 3) if self.ttfb is not None else None,
+        }
+
+
+class StreamSessionRegistry:
+    """Tracks active stream sessions"""
+
+    def __init__(self):
+        self.sessions: Dict[str, StreamSession] = {}
+        self.total_sessions = 0
+        self.total_bytes = 0
+
+    def open(self, request: Request, channel, user, mode: str) -> StreamSession:
+        """Describe a new session; it is registered once ``track`` starts streaming it"""
+        client = f"{request.client.host}:{request.client.port}" if request.client else "unknown"
+        session = StreamSession(
+            id=uuid.uuid4().hex[:12],
+            channel_id=channel.id,
+            channel_name=channel.name,
+            mode=mode,
+            username=user.username if user else None,
+            client=client,
+            user_agent=request.headers.get("user-agent", ""),
+        )
+        return session
+
+    async def track(self, session: StreamSession, stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Pass ``stream`` through, counting bytes; ends when the session is stopped.
+
+        The session is registered on the first step rather than in ``open``:
+        a client that disconnects before the body starts closes a generator
+        that never ran, so its ``finally`` could not unregister it.
+        """
+        self.sessions[session.id] = session
+        self.total_sessions += 1
+        logger.info(
+            f"Stream session {session.id} opened: channel {session.channel_id} ({session.mode}) "
+            f"for {session.username or 'anonymous'} at {session.client}"
+        )
+        try:
+            async for chunk in stream:
+                if session.stop_requested:
+                    break
+                session.record(len(chunk))
+                yield chunk
+        finally:
+            self.close(session)
+            # Release the upstream side (shared broadcast cursor, ffmpeg) right away
+            await stream.aclose()
+
+    def close(self, session: StreamSession):
+        if self.sessions.pop(session.id, None) is not None:
+            self.total_bytes += session.bytes_sent
+            logger.info(
+                f"Stream session {session.id} closed after {int(time.time() - session.started_at)}s, "
+                f"{session.bytes_sent / 1024 / 1024:.1f} MB"
+            )
+
+    def stop(self, session_id: str) -> bool:
+        """Ask a session to end at its next chunk"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return False
+        session.stop_requested = True
+        return True
+
+    def get_stats(self) -> Dict:
+        sessions = sorted(self.sessions.values(), key=lambda s: s.bitrate, reverse=True)
+        return {
+            "active": len(sessions),
+            "total_bitrate_kbps": round(sum(s.bitrate for s in sessions) / 1000, 1),
+            "total_sessions": self.total_sessions,
+            "total_bytes": self.total_bytes + sum(s.bytes_sent for s in sessions),
+            "sessions": [s.to_dict() for s in sessions],
+        }
+
+
+class SessionStreamingResponse(StreamingResponse):
+    """StreamingResponse that closes its body as soon as the client goes away.
+
+    Starlette cancels the send loop on disconnect but leaves the body
+    iterator suspended until it is garbage collected; closing it here tears
+    down the session and its upstream immediately.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose:
+                await aclose()
+
+
+# Global stream session registry instance
+stream_sessions = StreamSessionRegistry()
@@ -0,0 +1,369 @@
+"""
+Alternative upstream URLs with health-scored failover
+
+The same channel is often imported from several provider playlists. Active
+channels sharing an ``epg_channel_id`` and the same name (ignoring
+provider prefixes like "UK:") are treated as alternatives of each other,
+so SD/HD and regional variants that share a guide entry are not swapped
+for one another. ``stream_alternatives`` adds explicit groups. Every
+channel carries an ordered list of URLs: its own first, then the
+alternatives.
+
+Each URL keeps a rolling health record (time to first byte, sustained
+throughput, recent failures). When a stream starts, the healthiest URL is
+tried first and, if it hasn't produced a byte within ``stream_race_delay``
+seconds, the next one is raced against it; the first to deliver wins. If
+the winning upstream dies mid-stream the next best URL takes over.
+
+The caller holds the tuner slot of the channel's own playlist. An
+alternative from another playlist needs a free slot in that playlist's
+pool before it is connected; without one it is skipped.
+"""
+
+import asyncio
+import itertools
+import logging
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Dict, Hashable, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import func
+
+from app.config import get_settings
+from app.utils.change_tracker import change_tracker
+from app.utils.http_clients import http_clients
+from app.utils.tuner_slots import tuner_slots, SlotUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Health scoring
+EWMA_ALPHA = 0.3
+DEFAULT_TTFB = 1.0  # Seconds assumed for URLs never tried
+FAILURE_WINDOW = 600  # Seconds a failure counts against a URL
+FAILURE_PENALTY = 5.0  # Seconds of TTFB one recent failure is worth
+THROUGHPUT_BONUS = 0.5  # Max score bonus for a fast URL
+THROUGHPUT_REFERENCE = 1024 * 1024  # Bytes/sec that earns the full bonus
+
+# Provider decoration in front of a channel name: "UK: ", "UK | ", "|UK| ", "[UK] "
+NAME_PREFIX_RE = re.compile(r"^\s*(?:[|\[(]\s*[a-z]{2,3}\s*[|\])]|[a-z]{2,3}\s*[:|])\s*", re.IGNORECASE)
+NAME_WORD_RE = re.compile(r"[a-z0-9+]+")
+
+
+def variant_name(name: Optional[str]) -> str:
+    """Channel name without provider prefix, case or punctuation.
+
+    Quality and region words are kept, so "UK: BBC One HD" and
+    "BBC One HD" match but "BBC One" and "BBC One HD" don't.
+    """
+    return " ".join(NAME_WORD_RE.findall(NAME_PREFIX_RE.sub("", name or "").lower()))
+
+
+def parse_alternatives(value: str) -> List[List[int]]:
+    """Parse "12+40+77,13+41" into groups of channel ids"""
+    groups = []
+    for group in value.split(","):
+        ids = [int(c) for c in group.split("+") if c.strip()]
+        if len(ids) > 1:
+            groups.append(ids)
+    return groups
+
+
+def _ewma(current: Optional[float], sample: float) -> float:
+    return sample if current is None else EWMA_ALPHA * sample + (1 - EWMA_ALPHA) * current
+
+
+@dataclass
+class StreamHealth:
+    """Rolling health of one upstream URL"""
+    ttfb: Optional[float] = None
+    throughput: Optional[float] = None
+    failures: Deque[float] = field(default_factory=lambda: deque(maxlen=20))
+    successes: int = 0
+    last_used: Optional[float] = None
+
+    def recent_failures(self, now: float) -> int:
+        return sum(1 for t in self.failures if now - t < FAILURE_WINDOW)
+
+    def score(self, now: float) -> float:
+        """Lower is better"""
+        score = self.ttfb if self.ttfb is not None else DEFAULT_TTFB
+        score += self.recent_failures(now) * FAILURE_PENALTY
+        if self.throughput:
+            score -= min(self.throughput / THROUGHPUT_REFERENCE, 1.0) * THROUGHPUT_BONUS
+        return score
+
+
+class StreamSources:
+    """Alternative URLs per channel and their health"""
+
+    def __init__(self, race_delay: float, race_width: int, max_failovers: int,
+                 explicit_groups: List[List[int]]):
+        self.race_delay = race_delay
+        self.race_width = race_width
+        self.max_failovers = max_failovers
+        self.explicit_groups = explicit_groups
+        self.health: Dict[str, StreamHealth] = {}
+        self.failovers = 0
+        self.skipped_no_slot = 0
+
+        # group key -> [(channel id, url)] for channels with alternatives
+        self.groups: Dict[Hashable, List[Tuple[int, str]]] = {}
+        self.channel_groups: Dict[int, List[Hashable]] = {}
+        # Playlist (tuner pool) of every grouped URL
+        self.url_pools: Dict[str, Optional[int]] = {}
+        self.version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._holder_ids = itertools.count(1)
+
+    # ---- URL sets ----
+
+    def urls_for(self, db, channel) -> List[str]:
+        """The channel's URL followed by its alternatives, ranked by health"""
+        self._ensure_current(db)
+        urls = [channel.stream_url]
+        for key in self.channel_groups.get(channel.id, ()):
+            for other_id, url in self.groups[key]:
+                if other_id != channel.id and url not in urls:
+                    urls.append(url)
+        return self.rank(urls)
+
+    def _ensure_current(self, db):
+        version = change_tracker.version("channels")
+        if self.version == version:
+            return
+        with self._lock:
+            if self.version != version:
+                self._rebuild(db)
+                self.version = version
+
+    def _rebuild(self, db):
+        from app.models.channel import Channel
+
+        columns = (Channel.id, Channel.epg_channel_id, Channel.name, Channel.stream_url, Channel.playlist_id)
+        duplicated = (
+            db.query(Channel.epg_channel_id)
+            .filter(Channel.is_active == True, Channel.epg_channel_id.isnot(None), Channel.epg_channel_id != "")
+            .group_by(Channel.epg_channel_id)
+            .having(func.count(Channel.id) > 1)
+        )
+        rows = (
+            db.query(*columns)
+            .filter(Channel.is_active == True, Channel.epg_channel_id.in_(duplicated))
+            .order_by(Channel.epg_channel_id, Channel.playlist_id, Channel.id)
+        )
+
+        members: Dict[Hashable, list] = {}
+        for row in rows:
+            members.setdefault((row.epg_channel_id, variant_name(row.name)), []).append(row)
+
+        explicit_ids = {channel_id for group in self.explicit_groups for channel_id in group}
+        if explicit_ids:
+            by_id = {
+                row.id: row
+                for row in db.query(*columns).filter(Channel.is_active == True, Channel.id.in_(explicit_ids))
+            }
+            for i, group in enumerate(self.explicit_groups):
+                members[("explicit", i)] = [by_id[channel_id] for channel_id in group if channel_id in by_id]
+
+        groups: Dict[Hashable, List[Tuple[int, str]]] = {}
+        channel_groups: Dict[int, List[Hashable]] = {}
+        url_pools: Dict[str, Optional[int]] = {}
+        for key, group in members.items():
+            if len(group) < 2:
+                continue
+            groups[key] = [(row.id, row.stream_url) for row in group]
+            for row in group:
+                channel_groups.setdefault(row.id, []).append(key)
+                url_pools.setdefault(row.stream_url, row.playlist_id)
+
+        self.groups = groups
+        self.channel_groups = channel_groups
+        self.url_pools = url_pools
+        logger.info(f"Indexed alternative stream URLs: {len(channel_groups)} channels in {len(groups)} groups")
+
+    # ---- Health ----
+
+    def _health(self, url: str) -> StreamHealth:
+        health = self.health.get(url)
+        if health is None:
+            health = self.health[url] = StreamHealth()
+        return health
+
+    def rank(self, urls: List[str]) -> List[str]:
+        now = time.time()
+        # sorted() is stable: untried URLs keep their playlist order
+        return sorted(urls, key=lambda url: self.health[url].score(now) if url in self.health else DEFAULT_TTFB)
+
+    def record_ttfb(self, url: str, seconds: float):
+        health = self._health(url)
+        health.ttfb = _ewma(health.ttfb, seconds)
+        health.successes += 1
+        health.last_used = time.time()
+
+    def record_throughput(self, url: str, nbytes: int, seconds: float):
+        # Ignore very short sessions; they say little about sustained rate
+        if seconds >= 5:
+            health = self._health(url)
+            health.throughput = _ewma(health.throughput, nbytes / seconds)
+
+    def record_failure(self, url: str):
+        self._health(url).failures.append(time.time())
+
+    # ---- Streaming ----
+
+    async def _attempt(self, url: str, pool: Optional[int]):
+        """Open ``url`` and wait for its first chunk.
+
+        An alternative outside the caller's tuner pool takes a slot in its
+        own playlist's pool first (fails fast with SlotUnavailable).
+        """
+        holder = None
+        url_pool = self.url_pools.get(url, pool)
+        if url_pool != pool:
+            holder = ("alternative", url, next(self._holder_ids))
+            await tuner_slots.acquire(holder, url_pool, timeout=0)
+        try:
+            started = time.monotonic()
+            client = http_clients.get("stream")
+            context = client.stream('GET', url)
+            response = await context.__aenter__()
+            try:
+                response.raise_for_status()
+                chunks = response.aiter_bytes(chunk_size=65536)
+                try:
+                    first = await chunks.__anext__()
+                except StopAsyncIteration:
+                    raise httpx.ReadError("Upstream closed before sending data")
+            except BaseException:
+                await context.__aexit__(None, None, None)
+                raise
+        except BaseException:
+            if holder:
+                tuner_slots.release(holder)
+            raise
+        self.record_ttfb(url, time.monotonic() - started)
+        return holder, context, chunks, first
+
+    async def _close(self, holder, context):
+        try:
+            await context.__aexit__(None, None, None)
+        finally:
+            if holder:
+                tuner_slots.release(holder)
+
+    async def _connect_fastest(self, urls: List[str], pool: Optional[int]):
+        """Race URLs, staggered by ``race_delay``; return the first to deliver a byte"""
+        queue = list(urls)
+        pending: Dict[asyncio.Task, str] = {}
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            url = queue.pop(0)
+            pending[asyncio.create_task(self._attempt(url, pool))] = url
+
+        launch()
+        try:
+            while pending:
+                can_launch = queue and len(pending) < self.race_width
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.race_delay if can_launch else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # Still waiting on the first byte: race the next candidate
+                    launch()
+                    continue
+
+                winner = None
+                for task in done:
+                    url = pending.pop(task)
+                    if isinstance(task.exception(), SlotUnavailable):
+                        # The URL is fine, its provider is just busy
+                        last_error = task.exception()
+                        self.skipped_no_slot += 1
+                        logger.info(f"Skipping alternative {url}: {last_error}")
+                    elif task.exception() is not None:
+                        last_error = task.exception()
+                        self.record_failure(url)
+                        logger.warning(f"Upstream {url} failed to start: {last_error}")
+                    elif winner is None:
+                        winner = (url, *task.result())
+                    else:
+                        # Lost a photo finish
+                        holder, context = task.result()[:2]
+                        await self._close(holder, context)
+                if winner:
+                    return winner
+                while queue and len(pending) < self.race_width:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            for task in pending:
+                try:
+                    holder, context = (await task)[:2]
+                    await self._close(holder, context)
+                except BaseException:
+                    pass
+
+        raise last_error or httpx.ConnectError("No upstream URL available")
+
+    async def open_stream(self, urls: List[str], pool: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield upstream data, failing over between ``urls`` as needed.
+
+        ``pool`` is the playlist whose tuner slot the caller holds.
+        """
+        remaining = list(urls)
+        failovers = 0
+        while remaining:
+            url, holder, context, chunks, first = await self._connect_fastest(remaining, pool)
+            remaining.remove(url)
+            started = time.monotonic()
+            received = len(first)
+            try:
+                yield first
+                async for chunk in chunks:
+                    received += len(chunk)
+                    yield chunk
+                return
+            except httpx.HTTPError as e:
+                self.record_failure(url)
+                failovers += 1
+                self.failovers += 1
+                if not remaining or failovers > self.max_failovers:
+                    raise
+                logger.warning(f"Upstream {url} dropped ({e}); failing over")
+            finally:
+                self.record_throughput(url, received, time.monotonic() - started)
+                await self._close(holder, context)
+
+    def get_stats(self, urls: Optional[List[str]] = None) -> List[Dict]:
+        now = time.time()
+        stats = []
+        for url in (urls if urls is not None else list(self.health)):
+            health = self.health.get(url, StreamHealth())
+            stats.append({
+                "url": url,
+                "score": round(health.score(now), 3),
+                "ttfb": round(health.ttfb, 3) if health.ttfb is not None else None,
+                "throughput": int(health.throughput) if health.throughput else None,
+                "recent_failures": health.recent_failures(now),
+                "successes": health.successes,
+            })
+        return stats
+
+
+settings = get_settings()
+
+# Global stream sources instance
+stream_sources = StreamSources(
+    race_delay=settings.stream_race_delay,
+    race_width=settings.stream_race_width,
+    max_failovers=settings.stream_max_failovers,
+    explicit_groups=parse_alternatives(settings.stream_alternatives),
+)
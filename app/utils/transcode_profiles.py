@@ -0,0 +1,39 @@
+"""
+ffmpeg output profiles shared by the transcoder and the HLS segmenter
+"""
+
+from typing import Dict, List
+
+# Codec arguments per profile. "copy" keeps the provider's video untouched
+# and only normalises audio to AAC, which every browser can decode.
+PROFILES: Dict[str, List[str]] = {
+    "copy": [
+        '-c:v', 'copy',
+        '-c:a', 'aac', '-b:a', '128k',
+    ],
+    "720p": [
+        '-vf', 'scale=-2:720',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main',
+        '-b:v', '3000k', '-maxrate', '3000k', '-bufsize', '6000k',
+        '-g', '50', '-sc_threshold', '0',
+        '-c:a', 'aac', '-b:a', '128k',
+    ],
+    "480p": [
+        '-vf', 'scale=-2:480',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main',
+        '-b:v', '1200k', '-maxrate', '1200k', '-bufsize', '2400k',
+        '-g', '50', '-sc_threshold', '0',
+        '-c:a', 'aac', '-b:a', '96k',
+    ],
+}
+
+DEFAULT_PROFILE = "copy"
+
+
+def input_args(stream_url: str) -> List[str]:
+    """Common ffmpeg input options for a live upstream"""
+    args = ['-hide_banner', '-nostdin', '-loglevel', 'warning', '-fflags', '+genpts']
+    if stream_url.startswith(('http://', 'https://')):
+        # Ride out short provider hiccups instead of ending the stream
+        args += ['-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5']
+    return args + ['-i', stream_url]
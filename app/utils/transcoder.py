@@ -0,0 +1,214 @@
+"""
+ffmpeg process supervisor
+
+Every ffmpeg the proxy starts (MPEG-TS transcodes and HLS segmenters)
+goes through here so that:
+
+- the number of concurrent processes is capped (``transcode_max_processes``)
+- stderr is always drained, into a bounded per-process log, so ffmpeg can
+  never stall on a full pipe
+- processes nobody has read from for ``transcode_idle_timeout`` seconds
+  are reaped
+- per-process CPU and RSS are available for capacity planning
+
+De-duplication of identical (channel, profile) jobs is done by the
+callers: MPEG-TS transcodes are fanned out through ``stream_hub`` and HLS
+segmenters are shared by ``hls_sessions``.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Hashable, List, Optional
+
+import psutil
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class TranscodeCapacityError(Exception):
+    """All transcode slots are in use"""
+
+
+@dataclass
+class TranscodeJob:
+    """One supervised ffmpeg process"""
+    key: Hashable
+    kind: str
+    process: asyncio.subprocess.Process
+    log: Deque[str]
+    started_at: float = field(default_factory=time.time)
+    last_active: float = field(default_factory=time.time)
+    bytes_out: int = 0
+    ps: Optional[psutil.Process] = None
+    drain_task: Optional[asyncio.Task] = None
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    @property
+    def running(self) -> bool:
+        return self.process.returncode is None
+
+    def touch(self):
+        self.last_active = time.time()
+
+    def last_error(self) -> str:
+        return self.log[-1] if self.log else ""
+
+
+class TranscodeSupervisor:
+    """Starts, tracks and reaps ffmpeg processes"""
+
+    def __init__(self, max_processes: int, idle_timeout: int, log_lines: int):
+        self.max_processes = max_processes
+        self.idle_timeout = idle_timeout
+        self.log_lines = log_lines
+        self.jobs: Dict[int, TranscodeJob] = {}
+        self.rejected = 0
+        self._reaper_task: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.running)
+
+    def has_capacity(self) -> bool:
+        return self.active < self.max_processes
+
+    async def spawn(self, key: Hashable, kind: str, cmd: List[str], capture_stdout: bool = True) -> TranscodeJob:
+        """Start ffmpeg, or raise TranscodeCapacityError when at the cap"""
+        if not self.has_capacity():
+            self.rejected += 1
+            raise TranscodeCapacityError(
+                f"All {self.max_processes} transcode slots are in use"
+            )
+
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE if capture_stdout else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        job = TranscodeJob(key=key, kind=kind, process=process, log=deque(maxlen=self.log_lines))
+        try:
+            job.ps = psutil.Process(process.pid)
+            job.ps.cpu_percent(None)  # Prime the CPU counter
+        except psutil.Error:
+            job.ps = None
+        job.drain_task = asyncio.create_task(self._drain_stderr(job))
+        self.jobs[job.pid] = job
+
+        logger.info(f"Started ffmpeg {kind} for {key}, pid {job.pid} ({self.active}/{self.max_processes})")
+        self._ensure_reaper()
+        return job
+
+    async def read_output(self, job: TranscodeJob, chunk_size: int = 65536):
+        """Yield the job's stdout, stopping the process when the reader goes away"""
+        try:
+            while True:
+                chunk = await job.process.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                job.bytes_out += len(chunk)
+                job.touch()
+                yield chunk
+            await job.process.wait()
+            if job.process.returncode:
+                logger.warning(f"ffmpeg {job.pid} for {job.key} exited with {job.process.returncode}: {job.last_error()}")
+        finally:
+            await self.stop(job)
+
+    async def stop(self, job: TranscodeJob):
+        if job.running:
+            job.process.terminate()
+            try:
+                await asyncio.wait_for(job.process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                job.process.kill()
+                await job.process.wait()
+        if job.drain_task:
+            # stderr hits EOF once the process is gone
+            try:
+                await asyncio.wait_for(job.drain_task, timeout=1)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                job.drain_task.cancel()
+        self.jobs.pop(job.pid, None)
+
+    async def _drain_stderr(self, job: TranscodeJob):
+        try:
+            async for line in job.process.stderr:
+                text = line.decode("utf-8", errors="replace").rstrip()
+                if text:
+                    job.log.append(text)
+                    logger.debug(f"ffmpeg {job.pid}: {text}")
+        except Exception as e:
+            logger.debug(f"Stopped draining ffmpeg {job.pid} stderr: {e}")
+
+    def _ensure_reaper(self):
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self._reap_loop())
+
+    async def _reap_loop(self):
+        """Stop processes nobody is consuming; exits when none are left"""
+        while self.jobs:
+            await asyncio.sleep(min(10, self.idle_timeout))
+            now = time.time()
+            for job in list(self.jobs.values()):
+                if not job.running:
+                    # Exited on its own (e.g. HLS segmenter whose upstream died)
+                    logger.warning(f"ffmpeg {job.pid} for {job.key} exited with {job.process.returncode}: {job.last_error()}")
+                    await self.stop(job)
+                elif now - job.last_active > self.idle_timeout:
+                    logger.info(f"Reaping idle ffmpeg {job.pid} for {job.key}")
+                    await self.stop(job)
+
+    async def stop_all(self):
+        if self._reaper_task:
+            self._reaper_task.cancel()
+        for job in list(self.jobs.values()):
+            await self.stop(job)
+
+    def get_stats(self) -> Dict:
+        now = time.time()
+        processes = []
+        for job in self.jobs.values():
+            cpu_percent = rss = None
+            if job.ps and job.running:
+                try:
+                    cpu_percent = job.ps.cpu_percent(None)
+                    rss = job.ps.memory_info().rss
+                except psutil.Error:
+                    pass
+            processes.append({
+                "pid": job.pid,
+                "key": str(job.key),
+                "kind": job.kind,
+                "running": job.running,
+                "uptime_seconds": int(now - job.started_at),
+                "idle_seconds": int(now - job.last_active),
+                "bytes_out": job.bytes_out,
+                "cpu_percent": cpu_percent,
+                "rss_bytes": rss,
+                "last_log": list(job.log)[-5:],
+            })
+        return {
+            "max_processes": self.max_processes,
+            "active": self.active,
+            "rejected": self.rejected,
+            "processes": processes,
+        }
+
+
+settings = get_settings()
+
+# Global transcode supervisor instance
+transcoder = TranscodeSupervisor(
+    max_processes=settings.transcode_max_processes,
+    idle_timeout=settings.transcode_idle_timeout,
+    log_lines=settings.transcode_log_lines,
+)
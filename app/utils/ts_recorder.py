@@ -0,0 +1,218 @@
+"""
+In-process MPEG-TS recording engine
+
+Most providers already serve MPEG-TS, so recording them needs no remux:
+upstream bytes are packet-aligned, continuity-checked and written to disk
+as they arrive. Writes are batched into ``recording_write_buffer`` sized
+blocks and handed to a worker thread while the next block fills, so a
+slow disk never stalls the upstream read. The recording stops at its
+duration; upstream drops are bridged by reconnecting (with failover
+between alternative URLs) until then.
+
+Sources that aren't raw TS (HLS playlists, MP4, ...) raise
+``NotTransportStream`` from ``start`` so the caller can fall back to ffmpeg.
+"""
+
+import asyncio
+import logging
+import signal
+from typing import AsyncIterator, List, Optional
+
+import httpx
+
+from app.utils.mpegts import ContinuityChecker, PacketAligner
+from app.utils.stream_sources import stream_sources
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY = 2.0  # Seconds between attempts to reopen a dropped upstream
+
+
+class NotTransportStream(Exception):
+    """The source is not MPEG-TS and needs ffmpeg to remux"""
+
+
+def _write_all(output, block: bytes) -> int:
+    """Write all of ``block``; a raw (unbuffered) write may take only part of it"""
+    view = memoryview(block)
+    while view:
+        written = output.write(view)
+        if not written:
+            raise OSError(f"Short write to {output.name}")
+        view = view[written:]
+    return len(block)
+
+
+class TSRecording:
+    """One in-process recording.
+
+    Exposes ``terminate``/``wait``/``returncode`` like the ffmpeg process
+    it replaces, so the recorder can treat both engines alike.
+    """
+
+    def __init__(self, urls: List[str], pool: Optional[int], output_path: str, duration: float,
+                 write_buffer: int):
+        self.urls = urls
+        self.pool = pool
+        self.output_path = output_path
+        self.duration = duration
+        self.write_buffer = write_buffer
+        self.returncode: Optional[int] = None
+        self.error: Optional[str] = None
+        self.bytes_written = 0
+        self.reconnects = 0
+        self.continuity = ContinuityChecker()
+        self._deadline = 0.0
+        self._stream: Optional[AsyncIterator[bytes]] = None
+        self._aligner = PacketAligner()
+        self._head = b""
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def continuity_errors(self) -> int:
+        return self.continuity.errors
+
+    def _remaining(self) -> float:
+        return self._deadline - asyncio.get_running_loop().time()
+
+    async def _next_chunk(self) -> bytes:
+        remaining = self._remaining()
+        if remaining <= 0:
+            raise asyncio.TimeoutError
+        return await asyncio.wait_for(self._stream.__anext__(), remaining)
+
+    async def _close_stream(self):
+        if self._stream is not None:
+            await self._stream.aclose()
+            self._stream = None
+
+    async def start(self):
+        """Connect and sniff the source, then start writing in the background"""
+        self._deadline = asyncio.get_running_loop().time() + self.duration
+        self._stream = stream_sources.open_stream(self.urls, self.pool)
+        try:
+            while self._aligner.is_ts is None:
+                self._head += self._aligner.feed(await self._next_chunk())
+        except (StopAsyncIteration, asyncio.TimeoutError):
+            await self._close_stream()
+            raise NotTransportStream("Upstream ended before it could be identified")
+        except BaseException:
+            await self._close_stream()
+            raise
+        if not self._aligner.is_ts:
+            await self._close_stream()
+            raise NotTransportStream("Upstream is not MPEG-TS")
+        self._task = asyncio.create_task(self._run())
+
+    async def _reconnect(self) -> bool:
+        """Reopen the upstream; False once the recording's time is up"""
+        await self._close_stream()
+        while self._remaining() > 0 and not self._stopping:
+            await asyncio.sleep(min(RECONNECT_DELAY, self._remaining()))
+            if self._remaining() <= 0:
+                break
+            self._stream = stream_sources.open_stream(self.urls, self.pool)
+            self._aligner = PacketAligner()
+            try:
+                self._head = self._aligner.feed(await self._next_chunk())
+                self.reconnects += 1
+                return True
+            except asyncio.TimeoutError:
+                break
+            except (StopAsyncIteration, httpx.HTTPError) as e:
+                logger.warning(f"Recording {self.output_path}: reconnect failed ({e})")
+                await self._close_stream()
+        return False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        output = await asyncio.to_thread(open, self.output_path, "wb", buffering=0)
+        buffer = bytearray()
+        pending: Optional[asyncio.Future] = None
+
+        async def flush():
+            nonlocal buffer, pending
+            if pending is not None:
+                self.bytes_written += await pending
+                pending = None
+            if buffer:
+                block, buffer = buffer, bytearray()
+                pending = loop.run_in_executor(None, _write_all, output, block)
+
+        async def drain():
+            nonlocal pending
+            await flush()
+            if pending is not None:
+                self.bytes_written += await pending
+                pending = None
+
+        def add(data: bytes):
+            if data:
+                self.continuity.check(data)
+                buffer.extend(data)
+
+        try:
+            add(self._head)
+            self._head = b""
+            # wait_for can swallow a cancel that races a completed read, so check a flag too
+            while not self._stopping:
+                try:
+                    chunk = await self._next_chunk()
+                except asyncio.TimeoutError:
+                    break
+                except (StopAsyncIteration, httpx.HTTPError) as e:
+                    logger.warning(f"Recording {self.output_path}: upstream lost ({str(e) or 'ended'}), reconnecting")
+                    # Drop the partial packet the upstream was cut off in: the file only holds whole packets
+                    self._aligner.flush()
+                    if not await self._reconnect():
+                        break
+                    add(self._head)
+                    self._head = b""
+                    continue
+                add(self._aligner.feed(chunk))
+                if len(buffer) >= self.write_buffer:
+                    await flush()
+
+            await drain()
+            if self.returncode is None:
+                if self.bytes_written:
+                    self.returncode = 0
+                else:
+                    self.returncode = 1
+                    self.error = "No data received from upstream"
+        except asyncio.CancelledError:
+            # Stopped: keep what was recorded so far
+            await drain()
+            raise
+        except Exception as e:
+            self.returncode = 1
+            self.error = str(e)
+            logger.error(f"Recording {self.output_path} failed: {e}")
+        finally:
+            if pending is not None:
+                await asyncio.gather(pending, return_exceptions=True)
+            await asyncio.to_thread(output.close)
+            await self._close_stream()
+
+        if self.continuity.errors:
+            logger.warning(
+                f"Recording {self.output_path} finished with {self.continuity.errors} "
+                f"continuity errors and {self.reconnects} reconnects"
+            )
+
+    def terminate(self):
+        self._stopping = True
+        if self.returncode is None:
+            self.returncode = -signal.SIGTERM
+        if self._task is not None:
+            self._task.cancel()
+
+    async def wait(self) -> Optional[int]:
+        if self._task is not None:
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                if not self._task.cancelled():
+                    raise
+        return self.returncode
@@ -0,0 +1,251 @@
+"""
+Tuner-slot admission control
+
+Providers cap concurrent connections per account, so every upstream pull
+(live viewing, transcodes, HLS segmenters and recordings) must hold a
+slot in its playlist's pool before connecting. Viewers of the same channel
+share one slot because they share one upstream. Recordings take priority:
+when a pool is full they preempt a live holder, and live requests never
+jump ahead of a recording waiting for the provider. Holders that are open but unwatched
+(warm channels) give up their slot to any new request. Health probes
+take a slot only when one is free and nobody is waiting, and never evict
+anyone. ``max_concurrent_recordings`` is enforced here as well.
+
+Pool sizes come from ``tuner_slots_per_playlist`` (0 = unlimited) and the
+per-playlist ``tuner_slot_overrides`` ("playlist_id:slots,...").
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_PROBE = -1
+PRIORITY_LIVE = 0
+PRIORITY_RECORDING = 1
+
+Preempt = Callable[[], Awaitable[None]]
+
+
+class SlotUnavailable(Exception):
+    """No tuner slot became free in time"""
+
+
+@dataclass
+class SlotHolder:
+    """Something holding a provider connection"""
+    holder: Hashable
+    pool: Optional[int]
+    priority: int
+    acquired_at: float = field(default_factory=time.time)
+    preempt: Optional[Preempt] = None
+    idle: Optional[Callable[[], bool]] = None
+
+
+class TunerSlots:
+    """Slot pools per playlist with recording priority"""
+
+    def __init__(self, default_slots: int, overrides: Dict[int, int],
+                 max_recordings: int, queue_timeout: float):
+        self.default_slots = default_slots
+        self.overrides = overrides
+        self.max_recordings = max_recordings
+        self.queue_timeout = queue_timeout
+        self.holders: Dict[Hashable, SlotHolder] = {}
+        self.waiting: Dict[tuple, int] = {}  # (pool, priority) -> waiters
+        self.rejected = 0
+        self.preemptions = 0
+        self._cond: Optional[asyncio.Condition] = None
+
+    @property
+    def cond(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def capacity(self, pool: Optional[int]) -> int:
+        """Slots for ``pool``; 0 means unlimited"""
+        return self.overrides.get(pool, self.default_slots)
+
+    def used(self, pool: Optional[int]) -> int:
+        return sum(1 for h in self.holders.values() if h.pool == pool)
+
+    def recordings(self) -> int:
+        return sum(1 for h in self.holders.values() if h.priority == PRIORITY_RECORDING)
+
+    def holds(self, holder: Hashable) -> bool:
+        return holder in self.holders
+
+    def has_room(self, pool: Optional[int]) -> bool:
+        capacity = self.capacity(pool)
+        return capacity <= 0 or self.used(pool) < capacity
+
+    def _recordings_full(self) -> bool:
+        return self.max_recordings > 0 and self.recordings() >= self.max_recordings
+
+    def _can_admit(self, pool: Optional[int], priority: int) -> bool:
+        if priority == PRIORITY_RECORDING:
+            if self._recordings_full():
+                return False
+        elif self.waiting.get((pool, PRIORITY_RECORDING)) and not self._recordings_full():
+            # Recordings waiting on this provider go first (unless they wait for max_concurrent_recordings)
+            return False
+        elif priority == PRIORITY_PROBE and any(p == pool for p, _ in self.waiting):
+            return False
+        return self.has_room(pool)
+
+    def _preemptable(self, pool: Optional[int], idle_only: bool) -> Optional[SlotHolder]:
+        """Pick a live holder in ``pool`` to evict.
+
+        Unwatched holders go first; otherwise the newest live holder, the
+        viewer who has invested least.
+        """
+        live = [h for h in self.holders.values()
+                if h.pool == pool and h.priority == PRIORITY_LIVE and h.preempt]
+        idle = [h for h in live if h.idle and h.idle()]
+        if idle:
+            return min(idle, key=lambda h: h.acquired_at)
+        if idle_only or not live:
+            return None
+        return max(live, key=lambda h: h.acquired_at)
+
+    async def acquire(self, holder: Hashable, pool: Optional[int], priority: int = PRIORITY_LIVE,
+                      preempt: Optional[Preempt] = None, idle: Optional[Callable[[], bool]] = None,
+                      timeout: Optional[float] = None):
+        """Take a slot for ``holder`` or raise SlotUnavailable.
+
+        Idempotent: a holder that already has a slot keeps it. ``timeout``
+        defaults to ``tuner_queue_timeout``; 0 fails fast.
+        """
+        if holder in self.holders:
+            return
+        if timeout is None:
+            timeout = self.queue_timeout
+
+        victim = None
+        async with self.cond:
+            if not self._can_admit(pool, priority):
+                victim = self._take_victim(pool, priority)
+
+            if victim is None and not self._can_admit(pool, priority):
+                if timeout <= 0:
+                    if priority != PRIORITY_PROBE:
+                        self.rejected += 1
+                    raise SlotUnavailable(self._describe_full(pool, priority))
+                key = (pool, priority)
+                self.waiting[key] = self.waiting.get(key, 0) + 1
+                try:
+                    await asyncio.wait_for(
+                        self.cond.wait_for(lambda: holder in self.holders or self._can_admit(pool, priority)),
+                        timeout,
+                    )
+                except asyncio.TimeoutError:
+                    self.rejected += 1
+                    raise SlotUnavailable(self._describe_full(pool, priority))
+                finally:
+                    self.waiting[key] -= 1
+                    if not self.waiting[key]:
+                        del self.waiting[key]
+                if holder in self.holders:
+                    return
+
+            # A preempted holder's slot passes straight to this one
+            self.holders[holder] = SlotHolder(holder=holder, pool=pool, priority=priority,
+                                              preempt=preempt, idle=idle)
+            logger.info(f"Tuner slot acquired by {holder} (playlist {pool}: {self.used(pool)}/{self.capacity(pool) or 'unlimited'})")
+
+        if victim is not None:
+            # Tear the victim down outside the lock so other acquires and releases don't wait on it
+            try:
+                await victim.preempt()
+            except Exception as e:
+                logger.error(f"Preempting {victim.holder} failed: {e}")
+
+    def _take_victim(self, pool: Optional[int], priority: int) -> Optional[SlotHolder]:
+        """Remove and return a holder to make room for ``priority``, if only pool capacity is in the way"""
+        if priority == PRIORITY_PROBE or self.has_room(pool):
+            return None  # Blocked by max_concurrent_recordings or a waiting recording, not by the provider
+        if priority == PRIORITY_RECORDING and self._recordings_full():
+            return None
+        if priority == PRIORITY_LIVE and self.waiting.get((pool, PRIORITY_RECORDING)) and not self._recordings_full():
+            return None  # A freed slot belongs to the waiting recording
+        # Live requests may only evict unwatched holders; recordings may evict viewers
+        victim = self._preemptable(pool, idle_only=priority != PRIORITY_RECORDING)
+        if victim is None:
+            return None
+        logger.warning(f"Preempting live stream {victim.holder} on playlist {pool}")
+        self.preemptions += 1
+        self.holders.pop(victim.holder, None)
+        return victim
+
+    def _describe_full(self, pool: Optional[int], priority: int) -> str:
+        if priority == PRIORITY_RECORDING and self._recordings_full():
+            return f"Maximum of {self.max_recordings} concurrent recordings reached"
+        return f"All {self.capacity(pool)} tuner slots for this provider are in use"
+
+    def release(self, holder: Hashable):
+        """Free ``holder``'s slot (safe to call more than once)"""
+        if self.holders.pop(holder, None) is None:
+            return
+        logger.info(f"Tuner slot released by {holder}")
+        asyncio.get_running_loop().create_task(self._notify())
+
+    async def _notify(self):
+        async with self.cond:
+            self.cond.notify_all()
+
+    def get_stats(self) -> Dict:
+        pools = {}
+        for h in self.holders.values():
+            pools.setdefault(h.pool, []).append(h)
+        for (pool, _priority) in self.waiting:
+            pools.setdefault(pool, [])
+
+        now = time.time()
+        return {
+            "recordings": {"active": self.recordings(), "max": self.max_recordings},
+            "rejected": self.rejected,
+            "preemptions": self.preemptions,
+            "pools": [
+                {
+                    "playlist_id": pool,
+                    "capacity": self.capacity(pool) or None,
+                    "used": len(holders),
+                    "waiting": sum(n for (p, _), n in self.waiting.items() if p == pool),
+                    "holders": [
+                        {
+                            "holder": str(h.holder),
+                            "type": "recording" if h.priority == PRIORITY_RECORDING else "live",
+                            "held_seconds": int(now - h.acquired_at),
+                        }
+                        for h in holders
+                    ],
+                }
+                for pool, holders in pools.items()
+            ],
+        }
+
+
+def _parse_overrides(value: str) -> Dict[int, int]:
+    overrides = {}
+    for item in value.split(","):
+        if ":" in item:
+            playlist_id, slots = item.split(":", 1)
+            overrides[int(playlist_id)] = int(slots)
+    return overrides
+
+
+settings = get_settings()
+
+# Global tuner slot controller instance
+tuner_slots = TunerSlots(
+    default_slots=settings.tuner_slots_per_playlist,
+    overrides=_parse_overrides(settings.tuner_slot_overrides),
+    max_recordings=settings.max_concurrent_recordings,
+    queue_timeout=settings.tuner_queue_timeout,
+)
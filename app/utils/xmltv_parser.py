@@ -1,4 +1,4 @@
-import httpx
+from app.utils.http_clients import http_clients
 from lxml import etree
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
@@ -10,10 +10,10 @@ class XMLTVParser:
         self.programs = []
         
     async def parse_from_url(self, url: str) -> Dict:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            return self.parse(response.content)
+        client = http_clients.get("epg")
+        response = await client.get(url)
+        response.raise_for_status()
+        return self.parse(response.content)
     
     def parse_from_file(self, file_path: str) -> Dict:
         with open(file_path, 'rb') as f:
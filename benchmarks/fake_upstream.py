@@ -0,0 +1,259 @@
+"""
+Fake IPTV upstream for load testing
+
+A dependency-free asyncio HTTP server that behaves like a provider:
+
+    /live/{n}.ts             endless MPEG-TS paced at --bitrate
+    /hls/{n}/index.m3u8      live HLS playlist (sliding window)
+    /hls/{n}/{seq}.ts        HLS segments
+
+Streams are built from real 188-byte TS packets with continuity counters,
+a PAT and PMT announcing one H.264 video PID, and a random-access
+(keyframe) packet every --keyframe-interval seconds, so
+the proxy's packet alignment and keyframe-aligned joins do real work. The
+payload is filler and cannot be decoded, so this exercises the proxy path,
+not ffmpeg transcodes.
+
+Failure injection: --fail-rate refuses a share of requests with 503,
+--drop-rate closes a stream mid-flight (chance per second) and
+--stall-rate pauses it for --stall-seconds (chance per second).
+
+    python benchmarks/fake_upstream.py --port 9100 --bitrate 4000000
+"""
+
+import argparse
+import asyncio
+import random
+import re
+import time
+from dataclasses import dataclass
+
+TS_PACKET_SIZE = 188
+VIDEO_PID = 0x100
+PMT_PID = 0x1000
+TICK = 0.1  # Seconds of stream sent per write
+
+LIVE_RE = re.compile(r"^/live/(\d+)\.ts$")
+PLAYLIST_RE = re.compile(r"^/hls/(\d+)/index\.m3u8$")
+SEGMENT_RE = re.compile(r"^/hls/(\d+)/(\d+)\.ts$")
+
+
+@dataclass
+class UpstreamOptions:
+    bitrate: int = 4_000_000  # bits/sec
+    keyframe_interval: float = 2.0
+    segment_seconds: int = 4
+    playlist_size: int = 6
+    fail_rate: float = 0.0
+    drop_rate: float = 0.0
+    stall_rate: float = 0.0
+    stall_seconds: float = 3.0
+
+
+def _packet(counter: int, keyframe: bool) -> bytes:
+    if keyframe:
+        # Payload unit start, adaptation field (length 1) with random_access_indicator, then payload
+        header = bytes([0x47, 0x40 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0x30 | counter, 1, 0x40])
+    else:
+        header = bytes([0x47, VIDEO_PID >> 8, VIDEO_PID & 0xFF, 0x10 | counter])
+    return header + b"\xff" * (TS_PACKET_SIZE - len(header))
+
+
+def _crc32(data: bytes) -> int:
+    """CRC-32/MPEG-2 of a PSI section"""
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7 if crc & 0x80000000 else crc << 1) & 0xFFFFFFFF
+    return crc
+
+
+def _psi_packet(pid: int, table_id: int, body: bytes) -> bytes:
+    # Section header with section_syntax_indicator, version 0, current; CRC appended
+    section = bytes([table_id, 0xB0, len(body) + 9]) + b"\x00\x01\xc1\x00\x00" + body
+    section += _crc32(section).to_bytes(4, "big")
+    packet = bytes([0x47, 0x40 | (pid >> 8), pid & 0xFF, 0x10, 0]) + section
+    return packet + b"\xff" * (TS_PACKET_SIZE - len(packet))
+
+
+def build_gop(bitrate: int, keyframe_interval: float) -> bytes:
+    """One keyframe interval of TS: PAT, PMT, then a multiple of 16 video packets so it loops with continuous counters"""
+    pat = _psi_packet(0, 0x00, bytes([0x00, 0x01, 0xE0 | (PMT_PID >> 8), PMT_PID & 0xFF]))
+    pmt = _psi_packet(PMT_PID, 0x02, bytes([
+        0xE0 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0xF0, 0x00,  # PCR PID, no program descriptors
+        0x1B, 0xE0 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0xF0, 0x00,  # H.264 video
+    ]))
+    packets = int(bitrate / 8 * keyframe_interval / TS_PACKET_SIZE) - 2
+    packets = max(16, packets - packets % 16)
+    return pat + pmt + b"".join(_packet(i % 16, i == 0) for i in range(packets))
+
+
+class FakeUpstream:
+    """Serves live TS and HLS from a looped GOP"""
+
+    def __init__(self, options: UpstreamOptions):
+        self.options = options
+        self.gop = build_gop(options.bitrate, options.keyframe_interval)
+        self.bytes_per_tick = max(TS_PACKET_SIZE, int(options.bitrate / 8 * TICK) // TS_PACKET_SIZE * TS_PACKET_SIZE)
+        self.requests = 0
+        self.active = 0
+        self.refused = 0
+        self.dropped = 0
+        self.stalled = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                parts = request_line.decode("latin-1").split()
+                if len(parts) < 2:
+                    return
+                self.requests += 1
+                path = parts[1].split("?", 1)[0]
+                if random.random() < self.options.fail_rate:
+                    self.refused += 1
+                    await self._respond(writer, 503, b"injected failure", "text/plain")
+                    continue
+                if LIVE_RE.match(path):
+                    await self._live(writer)
+                    return
+                match = PLAYLIST_RE.match(path)
+                if match:
+                    await self._respond(writer, 200, self._playlist().encode(), "application/vnd.apple.mpegurl")
+                    continue
+                match = SEGMENT_RE.match(path)
+                if match:
+                    await self._respond(writer, 200, self._segment(int(match.group(2))), "video/mp2t")
+                    continue
+                await self._respond(writer, 404, b"not found", "text/plain")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str):
+        writer.write(
+            f"HTTP/1.1 {status} X\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def _live(self, writer: asyncio.StreamWriter):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: video/mp2t\r\nConnection: close\r\n\r\n")
+        self.active += 1
+        options = self.options
+        offset = 0
+        next_send = time.monotonic()
+        try:
+            while True:
+                chunk = self._slice(offset, self.bytes_per_tick)
+                offset = (offset + self.bytes_per_tick) % len(self.gop)
+                writer.write(chunk)
+                await writer.drain()
+
+                # Per-second probabilities, applied per tick
+                if random.random() < options.drop_rate * TICK:
+                    self.dropped += 1
+                    return
+                if random.random() < options.stall_rate * TICK:
+                    self.stalled += 1
+                    await asyncio.sleep(options.stall_seconds)
+                    next_send = time.monotonic()
+
+                next_send += TICK
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        finally:
+            self.active -= 1
+
+    def _slice(self, offset: int, size: int) -> bytes:
+        gop = self.gop
+        if offset + size <= len(gop):
+            return gop[offset:offset + size]
+        data = gop[offset:]
+        while len(data) < size:
+            data += gop[:size - len(data)]
+        return data
+
+    def _playlist(self) -> str:
+        options = self.options
+        newest = int(time.time() // options.segment_seconds)
+        first = newest - options.playlist_size + 1
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{options.segment_seconds}",
+            f"#EXT-X-MEDIA-SEQUENCE:{first}",
+        ]
+        for seq in range(first, newest + 1):
+            lines.append(f"#EXTINF:{options.segment_seconds}.0,")
+            lines.append(f"{seq}.ts")
+        return "\n".join(lines) + "\n"
+
+    def _segment(self, seq: int) -> bytes:
+        # Segments start on a keyframe, like a real segmenter's output
+        size = int(self.options.bitrate / 8 * self.options.segment_seconds)
+        size -= size % TS_PACKET_SIZE
+        return self._slice(0, size)
+
+    def get_stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "active_streams": self.active,
+            "refused": self.refused,
+            "dropped": self.dropped,
+            "stalled": self.stalled,
+        }
+
+
+async def serve(host: str, port: int, options: UpstreamOptions):
+    upstream = FakeUpstream(options)
+    server = await asyncio.start_server(upstream.handle, host, port, backlog=4096)
+    print(f"Fake upstream on http://{host}:{port} ({options.bitrate / 1e6:.1f} Mbit/s, "
+          f"keyframe every {options.keyframe_interval}s)", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def add_upstream_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--bitrate", type=int, default=4_000_000, help="bits/sec per stream")
+    parser.add_argument("--keyframe-interval", type=float, default=2.0, help="seconds between keyframes")
+    parser.add_argument("--segment-seconds", type=int, default=4, help="HLS segment duration")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests refused with 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="chance per second a stream is cut")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="chance per second a stream pauses")
+    parser.add_argument("--stall-seconds", type=float, default=3.0, help="length of an injected pause")
+
+
+def options_from_args(args) -> UpstreamOptions:
+    return UpstreamOptions(
+        bitrate=args.bitrate,
+        keyframe_interval=args.keyframe_interval,
+        segment_seconds=args.segment_seconds,
+        fail_rate=args.fail_rate,
+        drop_rate=args.drop_rate,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake MPEG-TS/HLS upstream for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_upstream_arguments(parser)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, options_from_args(args)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,482 @@
+"""
+Stream proxy load test
+
+Measures how many concurrent viewers one server process sustains through
+``/api/stream-proxy/channels/{id}/stream``. Runs offline on one Linux box.
+
+    # Everything in one go: fake upstream, seeded SQLite DB, uvicorn, swarm
+    python benchmarks/stream_load.py run --clients 200 --channels 20 --duration 60
+
+    # Against a server you started yourself (channels must point at the fake upstream)
+    python benchmarks/fake_upstream.py --port 9100 &
+    python benchmarks/stream_load.py swarm --url 'http://127.0.0.1:8000/api/stream-proxy/channels/{channel}/stream' \\
+        --channels 1-20 --clients 200 --server-pid $(pgrep -f 'uvicorn app.main:app')
+
+The swarm uses plain asyncio sockets rather than an HTTP library so that
+the load generator itself stays cheap. The report covers aggregate
+throughput, time to first byte, per-client stalls (gaps longer than
+--stall-threshold between reads), errors and the server's CPU and RSS
+(children included, so ffmpeg counts).
+
+``--mode hls`` plays HLS instead: it polls the playlist and downloads new
+segments, counting a stall whenever a segment takes longer to fetch than
+it lasts.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstream import add_upstream_arguments  # noqa: E402
+
+READ_SIZE = 65536
+
+
+@dataclass
+class ClientResult:
+    channel: str
+    ttfb: Optional[float] = None
+    bytes: int = 0
+    stalls: int = 0
+    stalled_seconds: float = 0.0
+    error: Optional[str] = None
+    started: float = 0.0
+    finished: float = 0.0
+
+
+# ---- Minimal HTTP/1.1 client ----
+
+async def _open(url: str, token: Optional[str]) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, int, Dict[str, str]]:
+    """Send a GET and read the response head; follows one redirect"""
+    for _ in range(3):
+        parts = urlsplit(url)
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        headers = f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nUser-Agent: stream-load\r\n"
+        if token:
+            headers += f"Authorization: Bearer {token}\r\n"
+        writer.write((headers + "\r\n").encode())
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            writer.close()
+            raise ConnectionError("connection closed before response")
+        status = int(status_line.split()[1])
+        response_headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        if status in (301, 302, 307, 308) and "location" in response_headers:
+            # Redirect passthrough: the client goes to the upstream itself
+            writer.close()
+            url = urljoin(url, response_headers["location"])
+            continue
+        return reader, writer, status, response_headers
+    raise ConnectionError("too many redirects")
+
+
+async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+    if "content-length" in headers:
+        return await reader.readexactly(int(headers["content-length"]))
+    if headers.get("transfer-encoding") == "chunked":
+        body = b""
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await reader.readline()
+                return body
+            body += await reader.readexactly(size)
+            await reader.readline()
+    return await reader.read()
+
+
+# ---- Clients ----
+
+async def ts_client(url: str, channel: str, duration: float, stall_threshold: float,
+                    token: Optional[str]) -> ClientResult:
+    result = ClientResult(channel, started=time.monotonic())
+    deadline = result.started + duration
+    writer = None
+    try:
+        reader, writer, status, _ = await _open(url, token)
+        if status != 200:
+            result.error = f"HTTP {status}"
+            return result
+        last = None
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                data = await asyncio.wait_for(reader.read(READ_SIZE), remaining)
+            except asyncio.TimeoutError:
+                break
+            now = time.monotonic()
+            if not data:
+                result.error = "upstream closed"
+                break
+            if result.ttfb is None:
+                result.ttfb = now - result.started
+            elif now - last > stall_threshold:
+                result.stalls += 1
+                result.stalled_seconds += now - last
+            last = now
+            result.bytes += len(data)
+    except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        result.finished = time.monotonic()
+        if writer:
+            writer.close()
+    return result
+
+
+async def hls_client(url: str, channel: str, duration: float, stall_threshold: float,
+                     token: Optional[str]) -> ClientResult:
+    result = ClientResult(channel, started=time.monotonic())
+    deadline = result.started + duration
+    seen = set()
+    try:
+        while time.monotonic() < deadline:
+            reader, writer, status, headers = await _open(url, token)
+            if status != 200:
+                writer.close()
+                result.error = f"HTTP {status}"
+                return result
+            playlist = (await _read_body(reader, headers)).decode("utf-8", "replace")
+            writer.close()
+
+            uris = [line for line in playlist.splitlines() if line and not line.startswith("#")]
+            if "#EXT-X-STREAM-INF" in playlist and uris:
+                url = urljoin(url, uris[0])
+                continue
+            target = 4.0
+            for line in playlist.splitlines():
+                if line.startswith("#EXT-X-TARGETDURATION:"):
+                    target = float(line.split(":", 1)[1])
+            # Join near the live edge like a player would
+            for uri in (uris[-3:] if not seen else uris):
+                if uri in seen:
+                    continue
+                seen.add(uri)
+                fetch_started = time.monotonic()
+                reader, writer, status, headers = await _open(urljoin(url, uri), token)
+                body = await _read_body(reader, headers)
+                writer.close()
+                now = time.monotonic()
+                if status != 200:
+                    result.error = f"segment HTTP {status}"
+                    return result
+                if result.ttfb is None:
+                    result.ttfb = now - result.started
+                elif now - fetch_started > max(target, stall_threshold):
+                    result.stalls += 1
+                    result.stalled_seconds += now - fetch_started - target
+                result.bytes += len(body)
+            await asyncio.sleep(target / 2)
+    except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        result.finished = time.monotonic()
+    return result
+
+
+# ---- Server sampling ----
+
+class ServerSampler:
+    """CPU and RSS of a process and its children, sampled once a second"""
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self.cpu: List[float] = []
+        self.rss: List[int] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.pid:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        import psutil
+        try:
+            root = psutil.Process(self.pid)
+        except psutil.NoSuchProcess:
+            return
+        known: Dict[int, "psutil.Process"] = {}
+        while True:
+            cpu, rss = 0.0, 0
+            try:
+                processes = [root] + root.children(recursive=True)
+            except psutil.NoSuchProcess:
+                return
+            for process in processes:
+                # Reuse Process objects so cpu_percent measures since the last sample
+                process = known.setdefault(process.pid, process)
+                try:
+                    cpu += process.cpu_percent(None)
+                    rss += process.memory_info().rss
+                except psutil.NoSuchProcess:
+                    known.pop(process.pid, None)
+            self.cpu.append(cpu)
+            self.rss.append(rss)
+            await asyncio.sleep(1.0)
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def summary(self) -> Optional[Dict]:
+        samples = self.cpu[1:]  # The first cpu_percent reading is always 0
+        if not samples:
+            return None
+        return {
+            "cpu_percent_avg": round(statistics.mean(samples), 1),
+            "cpu_percent_max": round(max(samples), 1),
+            "rss_mb_max": round(max(self.rss) / 1024 / 1024, 1),
+        }
+
+
+# ---- Swarm ----
+
+def parse_channels(spec: str) -> List[str]:
+    channels = []
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" in part:
+            start, end = part.split("-", 1)
+            channels.extend(str(n) for n in range(int(start), int(end) + 1))
+        elif part:
+            channels.append(part)
+    return channels
+
+
+async def swarm(url_template: str, channels: List[str], clients: int, duration: float, ramp: float,
+                mode: str, stall_threshold: float, token: Optional[str], server_pid: Optional[int]) -> Dict:
+    sampler = ServerSampler(server_pid)
+    sampler.start()
+    client = hls_client if mode == "hls" else ts_client
+
+    async def start_client(index: int) -> ClientResult:
+        await asyncio.sleep(ramp * index / clients if clients else 0)
+        channel = channels[index % len(channels)]
+        return await client(url_template.format(channel=channel), channel, duration, stall_threshold, token)
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(start_client(i) for i in range(clients)))
+    elapsed = time.monotonic() - started
+    sampler.stop()
+    return build_report(results, elapsed, sampler.summary())
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * pct / 100))], 3)
+
+
+def build_report(results: List[ClientResult], elapsed: float, server: Optional[Dict]) -> Dict:
+    ok = [r for r in results if r.ttfb is not None]
+    ttfbs = [r.ttfb for r in ok]
+    total_bytes = sum(r.bytes for r in results)
+    per_client = [r.bytes * 8 / (r.finished - r.started) / 1e6 for r in ok if r.finished > r.started]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r.error:
+            errors[r.error] = errors.get(r.error, 0) + 1
+    return {
+        "clients": len(results),
+        "connected": len(ok),
+        "seconds": round(elapsed, 1),
+        "throughput_mbps": round(total_bytes * 8 / elapsed / 1e6, 1) if elapsed else 0.0,
+        "per_client_mbps": {
+            "min": round(min(per_client), 2) if per_client else None,
+            "median": round(statistics.median(per_client), 2) if per_client else None,
+        },
+        "ttfb": {"p50": _percentile(ttfbs, 50), "p95": _percentile(ttfbs, 95), "p99": _percentile(ttfbs, 99)},
+        "stalls": {
+            "total": sum(r.stalls for r in results),
+            "clients_with_stalls": sum(1 for r in results if r.stalls),
+            "stalled_seconds": round(sum(r.stalled_seconds for r in results), 1),
+        },
+        "errors": errors,
+        "server": server,
+    }
+
+
+def print_report(report: Dict):
+    print()
+    print(f"Clients          {report['connected']}/{report['clients']} connected over {report['seconds']}s")
+    print(f"Throughput       {report['throughput_mbps']} Mbit/s aggregate, per client "
+          f"min {report['per_client_mbps']['min']} / median {report['per_client_mbps']['median']} Mbit/s")
+    ttfb = report["ttfb"]
+    print(f"TTFB             p50 {ttfb['p50']}s  p95 {ttfb['p95']}s  p99 {ttfb['p99']}s")
+    stalls = report["stalls"]
+    print(f"Stalls           {stalls['total']} on {stalls['clients_with_stalls']} clients, "
+          f"{stalls['stalled_seconds']}s total")
+    if report["errors"]:
+        print("Errors           " + ", ".join(f"{n}x {e}" for e, n in sorted(report["errors"].items())))
+    if report["server"]:
+        server = report["server"]
+        print(f"Server           CPU avg {server['cpu_percent_avg']}% max {server['cpu_percent_max']}%, "
+              f"RSS max {server['rss_mb_max']} MB")
+
+
+# ---- Self-contained run ----
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_for_port(port: int, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args[0]} exited with code {process.returncode}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"nothing listening on port {port} after {timeout}s")
+
+
+def seed_database(database_url: str, channels: int, upstream: str, upstream_format: str):
+    """Create the schema and one channel per fake upstream stream"""
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, ROOT)
+    from app.database import Base, SessionLocal, engine
+    import app.models  # noqa: F401  (registers every table)
+    from app.models.channel import Channel
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        for n in range(1, channels + 1):
+            url = f"{upstream}/live/{n}.ts" if upstream_format == "ts" else f"{upstream}/hls/{n}/index.m3u8"
+            db.add(Channel(id=n, channel_id=f"load-{n}", name=f"Load {n}", number=str(n),
+                           stream_url=url, is_active=True))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run(args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix="stream-load-")
+    upstream_port = _free_port()
+    server_port = args.port or _free_port()
+    upstream = f"http://127.0.0.1:{upstream_port}"
+    database_url = f"sqlite:///{os.path.join(workdir, 'load.db')}"
+    seed_database(database_url, args.channels, upstream, args.upstream_format)
+
+    upstream_cmd = [
+        sys.executable, os.path.join(ROOT, "benchmarks", "fake_upstream.py"),
+        "--port", str(upstream_port),
+        "--bitrate", str(args.bitrate),
+        "--keyframe-interval", str(args.keyframe_interval),
+        "--segment-seconds", str(args.segment_seconds),
+        "--fail-rate", str(args.fail_rate),
+        "--drop-rate", str(args.drop_rate),
+        "--stall-rate", str(args.stall_rate),
+        "--stall-seconds", str(args.stall_seconds),
+    ]
+    server_env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "RECORDING_PATH": os.path.join(workdir, "recordings"),
+        "RENDER_CACHE_PATH": os.path.join(workdir, "render"),
+        "CHANNEL_INDEX_PATH": os.path.join(workdir, "channel_index.json"),
+        "REQUIRE_AUTH_FOR_STREAMING": "false",
+    }
+    server_cmd = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", "127.0.0.1", "--port", str(server_port),
+        "--log-level", "warning", "--no-access-log",
+    ]
+
+    processes = []
+    try:
+        upstream_process = subprocess.Popen(upstream_cmd, stdout=subprocess.DEVNULL)
+        processes.append(upstream_process)
+        server_process = subprocess.Popen(server_cmd, cwd=ROOT, env=server_env)
+        processes.append(server_process)
+        await _wait_for_port(upstream_port, upstream_process)
+        await _wait_for_port(server_port, server_process)
+
+        # HLS upstreams are relayed as HLS from the same endpoint; play them with --mode hls
+        url = f"http://127.0.0.1:{server_port}/api/stream-proxy/channels/{{channel}}/stream"
+        print(f"Load test: {args.clients} clients over {args.channels} channels for {args.duration}s "
+              f"({args.mode}, upstream {args.upstream_format})", flush=True)
+        return await swarm(url, [str(n) for n in range(1, args.channels + 1)], args.clients,
+                           args.duration, args.ramp, args.mode, args.stall_threshold, None, server_process.pid)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream proxy load test")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_swarm_arguments(p):
+        p.add_argument("--clients", type=int, default=100)
+        p.add_argument("--duration", type=float, default=30.0, help="seconds each client stays connected")
+        p.add_argument("--ramp", type=float, default=5.0, help="seconds over which clients connect")
+        p.add_argument("--mode", choices=("ts", "hls"), default="ts", help="how clients play")
+        p.add_argument("--stall-threshold", type=float, default=1.0, help="read gap counted as a stall")
+        p.add_argument("--json", action="store_true", help="print the report as JSON")
+
+    swarm_parser = commands.add_parser("swarm", help="load an already running server")
+    swarm_parser.add_argument("--url", required=True, help="stream URL with a {channel} placeholder")
+    swarm_parser.add_argument("--channels", default="1", help="channel ids, e.g. 1-20,35")
+    swarm_parser.add_argument("--token", help="bearer token, if streaming requires auth")
+    swarm_parser.add_argument("--server-pid", type=int, help="sample this process for CPU and RSS")
+    add_swarm_arguments(swarm_parser)
+
+    run_parser = commands.add_parser("run", help="start upstream and server, then load them")
+    run_parser.add_argument("--channels", type=int, default=10, help="channels to seed")
+    run_parser.add_argument("--port", type=int, help="server port (default: a free one)")
+    run_parser.add_argument("--upstream-format", choices=("ts", "hls"), default="ts")
+    add_upstream_arguments(run_parser)
+    add_swarm_arguments(run_parser)
+
+    args = parser.parse_args()
+    if args.command == "swarm":
+        report = asyncio.run(swarm(args.url, parse_channels(args.channels), args.clients, args.duration,
+                                   args.ramp, args.mode, args.stall_threshold, args.token, args.server_pid))
+    else:
+        report = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+Test settings
+
+Keeps everything the app writes (database, recordings, caches) in a
+temporary directory instead of the working tree. Runs before any app
+module reads its settings.
+"""
+
+import os
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="iptv-pvr-tests-")
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_scratch}/test.db")
+os.environ.setdefault("RECORDING_PATH", os.path.join(_scratch, "recordings"))
+os.environ.setdefault("POSTPROCESS_STATE_PATH", os.path.join(_scratch, "cache", "postprocess.json"))
+os.environ.setdefault("RENDER_CACHE_PATH", os.path.join(_scratch, "cache", "render"))
+os.environ.setdefault("CHANNEL_INDEX_PATH", os.path.join(_scratch, "cache", "channel_index.json"))
+os.environ.setdefault("HLS_SESSION_PATH", os.path.join(_scratch, "hls"))
+os.environ.setdefault("HLS_PROXY_CACHE_PATH", os.path.join(_scratch, "cache", "hls-proxy"))
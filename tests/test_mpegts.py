@@ -0,0 +1,164 @@
+from app.utils.mpegts import (
+    TS_PACKET_SIZE,
+    ContinuityChecker,
+    PacketAligner,
+    ProgramMap,
+    pes_pts,
+    random_access_offsets,
+    split_at_random_access,
+)
+from tests.ts_packets import AAC, AUDIO_PID, H264, VIDEO_PID, packet, pat, pes_packet, pmt, program
+
+
+def _offsets_of(data: bytes, pid: int):
+    return [
+        offset for offset in range(0, len(data), TS_PACKET_SIZE)
+        if ((data[offset + 1] & 0x1F) << 8) | data[offset + 2] == pid
+    ]
+
+
+# ---- PacketAligner ----
+
+def test_aligner_rechunks_into_whole_packets():
+    stream = program(gops=3)
+    aligner = PacketAligner()
+    out = b""
+    # Odd chunk sizes split packets everywhere
+    for i in range(0, len(stream), 1000):
+        aligned = aligner.feed(stream[i:i + 1000])
+        assert len(aligned) % TS_PACKET_SIZE == 0
+        out += aligned
+    assert aligner.is_ts is True
+    assert out + aligner.flush() == stream
+
+
+def test_aligner_skips_leading_garbage():
+    stream = program()
+    aligner = PacketAligner()
+    out = aligner.feed(b"HTTP junk\x47\x00" + stream)
+    assert out == stream[:len(out)]
+    assert len(out) == len(stream)
+
+
+def test_aligner_resyncs_after_losing_sync():
+    first, second = program(gops=1), program(gops=1)
+    aligner = PacketAligner()
+    assert aligner.feed(first) == first
+    # The next chunk starts mid-packet: skip to the following boundary
+    assert aligner.feed(second[50:]) == second[TS_PACKET_SIZE:]
+
+
+def test_aligner_passes_through_non_ts():
+    aligner = PacketAligner(probe_limit=1024)
+    assert aligner.feed(b"x" * 600) == b""
+    assert aligner.is_ts is None
+    assert aligner.feed(b"y" * 600) == b"x" * 600 + b"y" * 600
+    assert aligner.is_ts is False
+    assert aligner.feed(b"z") == b"z"
+
+
+def test_aligner_flush_returns_partial_packet():
+    stream = program()
+    aligner = PacketAligner()
+    out = aligner.feed(stream[:-10])
+    assert aligner.flush() == stream[len(out):-10]
+    assert aligner.flush() == b""
+
+
+# ---- Random access ----
+
+def test_only_video_random_access_counts():
+    stream = program(gops=2, gop_packets=4)
+    video_keyframes = [o for o in _offsets_of(stream, VIDEO_PID)
+                       if stream[o + 3] & 0x20 and stream[o + 5] & 0x40]
+    assert len(video_keyframes) == 2
+    assert random_access_offsets(stream, ProgramMap()) == video_keyframes
+
+
+def test_no_keyframes_before_the_pmt():
+    stream = program(gops=2)
+    without_psi = stream[TS_PACKET_SIZE * 2:]
+    assert random_access_offsets(without_psi, ProgramMap()) == []
+
+
+def test_program_map_carries_over_between_chunks():
+    stream = program(gops=2, gop_packets=4)
+    programs = ProgramMap()
+    assert random_access_offsets(stream[:TS_PACKET_SIZE * 2], programs) == []
+    assert programs.video_pid == VIDEO_PID
+    rest = stream[TS_PACKET_SIZE * 2:]
+    assert random_access_offsets(rest, programs) == [0, 8 * TS_PACKET_SIZE]
+
+
+def test_program_map_finds_video_listed_after_audio():
+    programs = ProgramMap()
+    random_access_offsets(pat() + pmt([(AAC, AUDIO_PID), (H264, VIDEO_PID)]), programs)
+    assert programs.video_pid == VIDEO_PID
+    assert programs.is_keyframe(packet(VIDEO_PID, keyframe=True))
+    assert not programs.is_keyframe(packet(AUDIO_PID, keyframe=True))
+    assert not programs.is_keyframe(packet(VIDEO_PID))
+
+
+def test_radio_program_has_no_keyframes():
+    stream = pat() + pmt([(AAC, AUDIO_PID)]) + packet(AUDIO_PID, keyframe=True) * 4
+    programs = ProgramMap()
+    assert random_access_offsets(stream, programs) == []
+    assert programs.video_pid is None
+
+
+def test_split_at_random_access():
+    stream = program(gops=2, gop_packets=4)
+    pieces = split_at_random_access(stream, ProgramMap())
+    assert b"".join(piece for piece, _ in pieces) == stream
+    assert [keyframe for _, keyframe in pieces] == [False, True, True]
+    # PAT + PMT come before the first keyframe
+    assert len(pieces[0][0]) == 2 * TS_PACKET_SIZE
+    for piece, keyframe in pieces[1:]:
+        assert ((piece[1] & 0x1F) << 8) | piece[2] == VIDEO_PID
+
+
+def test_split_without_keyframes_is_one_piece():
+    stream = program(gops=1)[TS_PACKET_SIZE * 2:]
+    assert split_at_random_access(stream, ProgramMap()) == [(stream, False)]
+    assert split_at_random_access(b"", ProgramMap()) == []
+
+
+# ---- Continuity ----
+
+def test_continuity_clean_stream():
+    checker = ContinuityChecker()
+    assert checker.check(program(gops=3)) == 0
+    assert checker.packets == 2 + 3 * 8 * 2
+
+
+def test_continuity_counts_gaps_per_pid():
+    checker = ContinuityChecker()
+    data = b"".join(packet(VIDEO_PID, c) for c in (0, 1, 2, 5, 6))
+    data += b"".join(packet(AUDIO_PID, c) for c in (14, 15, 0, 1))
+    assert checker.check(data) == 1
+    assert checker.check(packet(AUDIO_PID, 3)) == 1
+    assert checker.errors == 2
+
+
+def test_continuity_allows_one_duplicate_and_wraps():
+    checker = ContinuityChecker()
+    data = b"".join(packet(VIDEO_PID, c) for c in (15, 15, 0, 1))
+    assert checker.check(data) == 0
+
+
+def test_continuity_ignores_adaptation_only_and_null_packets():
+    checker = ContinuityChecker()
+    adaptation_only = bytearray(packet(VIDEO_PID, 3))
+    adaptation_only[3] = 0x20 | 3  # Counter doesn't advance without payload
+    data = packet(VIDEO_PID, 3) + bytes(adaptation_only) + packet(VIDEO_PID, 4)
+    data += packet(0x1FFF, 7) + packet(0x1FFF, 2)
+    assert checker.check(data) == 0
+
+
+# ---- PES ----
+
+def test_pes_pts():
+    assert pes_pts(pes_packet(VIDEO_PID, 0)) == 0
+    assert pes_pts(pes_packet(VIDEO_PID, 90000 * 3600)) == 90000 * 3600
+    assert pes_pts(pes_packet(VIDEO_PID, (1 << 33) - 1, keyframe=True)) == (1 << 33) - 1
+    assert pes_pts(packet(VIDEO_PID)) is None
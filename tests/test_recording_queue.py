@@ -0,0 +1,170 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+
+from app.models.user import UserRole
+from app.utils.recording_queue import RecordingQueue, recording_priority
+from app.utils.recorder import recorder
+
+START = datetime(2026, 1, 1, 20, 0)
+
+
+def _recording(recording_id, channel_id=None, series=False, admin=False):
+    return SimpleNamespace(
+        id=recording_id,
+        channel_id=channel_id if channel_id is not None else recording_id,
+        start_time=START,
+        end_time=START + timedelta(hours=1),
+        user_id=recording_id,
+        user=SimpleNamespace(role=UserRole.ADMIN if admin else UserRole.USER),
+        title=f"Programme {recording_id}",
+        schedule_id=7 if series else None,
+    )
+
+
+class FakeRecorder:
+    """Stands in for recorder.record: each recording runs until finished"""
+
+    def __init__(self):
+        self.started = []
+        self.done = {}
+
+    async def record(self, recording_id):
+        self.started.append(recording_id)
+        self.done[recording_id] = asyncio.Event()
+        await self.done[recording_id].wait()
+
+    def finish(self, recording_id):
+        self.done[recording_id].set()
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest_asyncio.fixture
+async def fake_recorder(monkeypatch):
+    fake = FakeRecorder()
+    monkeypatch.setattr(recorder, "record", fake.record)
+    monkeypatch.setattr(recorder, "captures", {})
+    yield fake
+    for done in fake.done.values():
+        done.set()
+    await _settle()
+
+
+@pytest_asyncio.fixture
+async def make_queue(fake_recorder):
+    queues = []
+
+    def make(max_running, spacing=0):
+        queues.append(RecordingQueue(max_running=max_running, spacing=spacing))
+        return queues[-1]
+
+    yield make
+    for queue in queues:
+        if queue._dispatcher:
+            queue._dispatcher.cancel()
+    await _settle()
+
+
+def test_recording_priority():
+    assert recording_priority(_recording(1)) == 0
+    assert recording_priority(_recording(1, admin=True)) == 1
+    assert recording_priority(_recording(1, series=True)) == 2
+    assert recording_priority(_recording(1, series=True, admin=True)) == 3
+
+
+@pytest.mark.asyncio
+async def test_jobs_start_in_priority_order(make_queue, fake_recorder):
+    queue = make_queue(1)
+    for recording in (_recording(1), _recording(2, admin=True), _recording(3, series=True), _recording(4)):
+        assert queue.submit(recording)
+    await _settle()
+    assert fake_recorder.started == [3]
+
+    for expected in (2, 1, 4):
+        fake_recorder.finish(fake_recorder.started[-1])
+        await _settle()
+        assert fake_recorder.started[-1] == expected
+    assert queue.started == 4
+
+
+@pytest.mark.asyncio
+async def test_max_running(make_queue, fake_recorder):
+    queue = make_queue(2)
+    for recording_id in (1, 2, 3):
+        queue.submit(_recording(recording_id))
+    await _settle()
+    assert fake_recorder.started == [1, 2]
+    stats = queue.get_stats()
+    assert stats["running_count"] == 2
+    assert [job["recording_id"] for job in stats["queued"]] == [3]
+
+    fake_recorder.finish(2)
+    await _settle()
+    assert fake_recorder.started == [1, 2, 3]
+    assert 2 not in queue.running
+
+
+@pytest.mark.asyncio
+async def test_submit_twice_and_discard(make_queue, fake_recorder):
+    queue = make_queue(1)
+    assert queue.submit(_recording(1))
+    assert queue.submit(_recording(2))
+    assert not queue.submit(_recording(2))
+    assert queue.discard(2)
+    assert not queue.discard(2)
+    await _settle()
+    assert not queue.submit(_recording(1))  # Running
+    assert fake_recorder.started == [1]
+    assert not queue.is_queued(2)
+
+
+@pytest.mark.asyncio
+async def test_same_programme_joins_the_running_capture(make_queue, fake_recorder):
+    queue = make_queue(1)
+    queue.submit(_recording(1, channel_id=5))
+    queue.submit(_recording(2, channel_id=5))
+    queue.submit(_recording(3, channel_id=6))
+    await _settle()
+    # Recording 2 shares recording 1's capture instead of waiting for a slot
+    assert sorted(fake_recorder.started) == [1, 2]
+    assert queue.joined == 1
+    assert list(queue.running) == [1]
+    assert queue.is_queued(2)
+
+    fake_recorder.finish(2)
+    await _settle()
+    assert not queue.is_queued(2)
+
+
+@pytest.mark.asyncio
+async def test_programme_already_being_captured_joins_at_once(make_queue, fake_recorder):
+    queue = make_queue(1)
+    queue.submit(_recording(1))
+    recording = _recording(2, channel_id=9)
+    recorder.captures[(9, recording.start_time, recording.end_time)] = object()
+    assert queue.submit(recording)
+    await _settle()
+    assert sorted(fake_recorder.started) == [1, 2]
+    assert queue.queued == []
+    assert queue.joined == 1
+
+
+@pytest.mark.asyncio
+async def test_starts_are_spaced(make_queue, fake_recorder):
+    spacing = 0.05
+    queue = make_queue(0, spacing)
+    for recording_id in (1, 2, 3):
+        queue.submit(_recording(recording_id))
+    await _settle()
+    assert fake_recorder.started == [1]
+    await asyncio.sleep(spacing * 1.5)
+    assert fake_recorder.started == [1, 2]
+    await asyncio.sleep(spacing)
+    assert fake_recorder.started == [1, 2, 3]
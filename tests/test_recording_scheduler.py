@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.utils import recording_scheduler as scheduler_module
+from app.utils.recording_scheduler import START, STOP, STOP_GRACE_SECONDS, RecordingScheduler
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """Scheduler whose start/stop events are recorded instead of touching the database"""
+    scheduler = RecordingScheduler(jitter=0)
+    scheduler.fired = []
+    monkeypatch.setattr(scheduler, "_start", lambda recording_id: scheduler.fired.append((START, recording_id)))
+    monkeypatch.setattr(scheduler, "_stop", lambda recording_id: scheduler.fired.append((STOP, recording_id)))
+    monkeypatch.setattr(scheduler, "load", lambda: None)
+    return scheduler
+
+
+def _ago(seconds: float) -> datetime:
+    return datetime.utcnow() - timedelta(seconds=seconds)
+
+
+def _from_now(seconds: float) -> datetime:
+    return datetime.utcnow() + timedelta(seconds=seconds)
+
+
+def test_overdue_start_fires_now(scheduler):
+    scheduler.schedule(1, _ago(60), _from_now(3600))
+    scheduler._fire_due()
+    assert scheduler.fired == [(START, 1)]
+    assert scheduler.started == 1
+    # The stop event is still pending
+    assert scheduler.get_stats()["pending_events"] == 1
+
+
+def test_stop_fires_after_the_grace_period(scheduler):
+    scheduler.schedule(1, _ago(3600), _ago(STOP_GRACE_SECONDS // 2))
+    scheduler._fire_due()
+    assert scheduler.fired == [(START, 1)]
+
+    scheduler.schedule(1, _ago(3600), _ago(STOP_GRACE_SECONDS + 1))
+    scheduler._fire_due()
+    # The stop comes first, so the late start is skipped
+    assert scheduler.fired == [(START, 1), (STOP, 1)]
+    assert scheduler.versions == {}
+
+
+def test_reschedule_fires_only_the_latest_version(scheduler):
+    scheduler.schedule(1, _ago(60), _from_now(3600))
+    scheduler.schedule(1, _from_now(600), _from_now(3600))
+    scheduler._fire_due()
+    assert scheduler.fired == []
+
+    scheduler.schedule(1, _ago(1), _from_now(3600))
+    scheduler._fire_due()
+    assert scheduler.fired == [(START, 1)]
+
+
+def test_cancelled_events_are_skipped(scheduler):
+    scheduler.schedule(1, _ago(60), _from_now(3600))
+    scheduler.schedule(2, _ago(60), _from_now(3600))
+    scheduler.cancel(1)
+    scheduler.cancel(1)
+    scheduler._fire_due()
+    assert scheduler.fired == [(START, 2)]
+    stats = scheduler.get_stats()
+    assert stats["pending_recordings"] == 1
+    assert stats["next_event"]["recording_id"] == 2
+
+
+def test_start_jitter_fires_early(scheduler, monkeypatch):
+    scheduler.jitter = 30
+    monkeypatch.setattr(scheduler_module.random, "uniform", lambda low, high: high)
+    scheduler.schedule(1, _from_now(20), _from_now(3600))
+    scheduler._fire_due()
+    assert scheduler.fired == [(START, 1)]
+
+
+def test_superseded_events_are_compacted(scheduler):
+    for _ in range(500):
+        scheduler.schedule(1, _from_now(600), _from_now(3600))
+    assert len(scheduler.events) <= 4 * len(scheduler.versions) + 64 + 2
+    assert scheduler.get_stats()["pending_events"] == 2
+
+
+def test_failing_event_does_not_stop_the_others(scheduler, monkeypatch):
+    def start(recording_id):
+        if recording_id == 1:
+            raise RuntimeError("database is locked")
+        scheduler.fired.append((START, recording_id))
+
+    monkeypatch.setattr(scheduler, "_start", start)
+    scheduler.schedule(1, _ago(60), _from_now(3600))
+    scheduler.schedule(2, _ago(30), _from_now(3600))
+    scheduler._fire_due()
+    assert scheduler.fired == [(START, 2)]
+
+
+@pytest.mark.asyncio
+async def test_run_forever_wakes_for_a_new_recording(scheduler):
+    runner = asyncio.create_task(scheduler.run_forever())
+    try:
+        await asyncio.sleep(0.01)
+        scheduler.schedule(1, _from_now(0.05), _from_now(3600))
+        for _ in range(100):
+            if scheduler.fired:
+                break
+            await asyncio.sleep(0.01)
+        assert scheduler.fired == [(START, 1)]
+    finally:
+        runner.cancel()
@@ -0,0 +1,86 @@
+from app.utils.series_matcher import RuleIndex, SeriesRule, like_regex
+
+
+def _rule(rule_id, pattern=None, series_id=None, channel_id=None):
+    return SeriesRule(
+        id=rule_id,
+        user_id=1,
+        channel_id=channel_id,
+        max_recordings=None,
+        series_id=series_id,
+        title=like_regex(pattern) if pattern is not None else None,
+    )
+
+
+def _ids(rules):
+    return sorted(rule.id for rule in rules)
+
+
+# ---- like_regex ----
+
+def test_like_regex_matches_substrings_case_insensitively():
+    regex = like_regex("doctor who")
+    assert regex.search("Doctor Who")
+    assert regex.search("The DOCTOR WHO Christmas Special")
+    assert not regex.search("Doctor Foster")
+
+
+def test_like_regex_wildcards():
+    assert like_regex("news%weather").search("News, Sport and Weather")
+    assert like_regex("f_rmula").search("Formula 1")
+    assert not like_regex("f_rmula").search("Frmula 1")
+    assert like_regex("%").search("")
+
+
+def test_like_regex_escapes_regex_syntax():
+    assert like_regex("C++ (live)").search("Learning C++ (live)")
+    assert not like_regex("a.c").search("abc")
+    assert like_regex("line\nbreak").search("Line\nBreak")
+
+
+# ---- RuleIndex ----
+
+def test_series_id_rules_match_by_series_only():
+    index = RuleIndex([_rule(1, series_id="EP123"), _rule(2, series_id="EP456")])
+    assert _ids(index.match("EP123", "Anything", channel_id=5)) == [1]
+    assert index.match(None, "EP123", channel_id=5) == []
+
+
+def test_title_rules_match_like_ilike():
+    index = RuleIndex([
+        _rule(1, "doctor who"),
+        _rule(2, "news%weather"),
+        _rule(3, "f_rmula"),
+        _rule(4, "who"),
+    ])
+    assert index.size == 4
+    assert _ids(index.match(None, "Doctor Who: The Movie", channel_id=1)) == [1, 4]
+    assert _ids(index.match(None, "Evening News and Weather", channel_id=1)) == [2]
+    assert _ids(index.match(None, "FORMULA 1 Qualifying", channel_id=1)) == [3]
+    # Pattern words may sit inside longer title words, as with ILIKE
+    assert _ids(index.match(None, "Whoever Wins", channel_id=1)) == [4]
+    assert index.match(None, "Cooking Show", channel_id=1) == []
+
+
+def test_title_rules_respect_their_channel():
+    index = RuleIndex([_rule(1, "match of the day", channel_id=7), _rule(2, "match of the day")])
+    assert _ids(index.match(None, "Match of the Day", channel_id=7)) == [1, 2]
+    assert _ids(index.match(None, "Match of the Day", channel_id=8)) == [2]
+
+
+def test_patterns_without_words_are_checked_for_every_title():
+    index = RuleIndex([_rule(1, "%"), _rule(2, "__")])
+    assert index.unindexed and not index.by_word
+    assert _ids(index.match(None, "Anything", channel_id=1)) == [1, 2]
+    assert _ids(index.match(None, "A", channel_id=1)) == [1]
+
+
+def test_series_and_title_rules_both_match():
+    index = RuleIndex([_rule(1, series_id="EP1"), _rule(2, "quiz")])
+    assert _ids(index.match("EP1", "Pub Quiz", channel_id=1)) == [1, 2]
+    assert _ids(index.match("EP2", "Pub Quiz", channel_id=1)) == [2]
+
+
+def test_empty_index():
+    index = RuleIndex([])
+    assert index.match("EP1", "Anything", channel_id=1) == []
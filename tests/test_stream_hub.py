@@ -0,0 +1,166 @@
+import asyncio
+
+import pytest
+
+from app.utils.mpegts import TS_PACKET_SIZE
+from app.utils.stream_hub import StreamHub
+from tests.ts_packets import VIDEO_PID, program
+
+LINGER = 0.05
+
+
+def _hub(warm_top_n=0):
+    return StreamHub(buffer_size=1024 * 1024, max_skips=3, linger=LINGER, warm_channels=set(),
+                     warm_top_n=warm_top_n, warm_idle_timeout=60, warm_memory_budget=1024 * 1024)
+
+
+class Upstream:
+    """Upstream factory that sends ``data`` once ``go`` is set, then stays open until closed"""
+
+    def __init__(self, data: bytes, chunk_size: int = 1000):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.opened = 0
+        self.closed = 0
+        self.go = asyncio.Event()
+
+    def __call__(self):
+        return self._stream()
+
+    async def _stream(self):
+        self.opened += 1
+        try:
+            await self.go.wait()
+            for i in range(0, len(self.data), self.chunk_size):
+                yield self.data[i:i + self.chunk_size]
+                await asyncio.sleep(0)
+            await asyncio.Event().wait()
+        finally:
+            self.closed += 1
+
+
+async def _read(viewer, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        data += await asyncio.wait_for(viewer.__anext__(), 1)
+    return data
+
+
+async def _watch(hub, key, upstream, size: int):
+    """Subscribe and read ``size`` bytes, holding the upstream until the viewer has registered"""
+    viewer = hub.subscribe(key, upstream)
+    reading = asyncio.create_task(_read(viewer, size))
+    await asyncio.sleep(0.01)
+    upstream.go.set()
+    return viewer, await reading
+
+
+def _is_video_keyframe(data: bytes) -> bool:
+    return (((data[1] & 0x1F) << 8) | data[2]) == VIDEO_PID and bool(data[3] & 0x20) and bool(data[5] & 0x40)
+
+
+@pytest.mark.asyncio
+async def test_viewers_share_one_upstream():
+    hub = _hub()
+    stream = program(gops=2)
+    upstream = Upstream(stream)
+    first, data = await _watch(hub, 1, upstream, len(stream))
+    assert data == stream
+
+    second = hub.subscribe(1, upstream)
+    await _read(second, TS_PACKET_SIZE)
+    assert upstream.opened == 1
+    await first.aclose()
+    await second.aclose()
+    await hub.stop_all()
+
+
+@pytest.mark.asyncio
+async def test_late_viewer_joins_at_the_latest_keyframe():
+    hub = _hub()
+    gop_packets = 8
+    stream = program(gops=3, gop_packets=gop_packets)
+    upstream = Upstream(stream)
+    first, _ = await _watch(hub, 1, upstream, len(stream))
+
+    # The last GOP holds interleaved video and audio packets
+    last_gop = len(stream) - gop_packets * 2 * TS_PACKET_SIZE
+    second = hub.subscribe(1, upstream)
+    joined = await _read(second, len(stream) - last_gop)
+    assert _is_video_keyframe(joined)
+    assert joined == stream[last_gop:]
+    await first.aclose()
+    await second.aclose()
+    await hub.stop_all()
+
+
+@pytest.mark.asyncio
+async def test_unstarted_viewer_is_closed_after_the_linger():
+    hub = _hub()
+    closed = []
+    upstream = Upstream(program())
+    # The response body never starts, so the viewer never registers
+    hub.subscribe(1, upstream, on_close=closed.append)
+    await asyncio.sleep(0.01)
+    assert hub.is_active(1)
+
+    await asyncio.sleep(LINGER * 3)
+    assert not hub.is_active(1)
+    assert len(closed) == 1
+    assert upstream.closed == 1
+
+
+@pytest.mark.asyncio
+async def test_rejoin_within_the_linger_keeps_the_upstream():
+    hub = _hub()
+    stream = program()
+    upstream = Upstream(stream)
+    viewer, _ = await _watch(hub, 1, upstream, len(stream))
+    await viewer.aclose()
+    assert hub.is_idle(1)
+
+    viewer = hub.subscribe(1, upstream)
+    await _read(viewer, TS_PACKET_SIZE)
+    await asyncio.sleep(LINGER * 3)
+    assert hub.is_active(1)
+    assert upstream.opened == 1
+
+    await viewer.aclose()
+    await asyncio.sleep(LINGER * 3)
+    assert not hub.is_active(1)
+    assert upstream.closed == 1
+
+
+@pytest.mark.asyncio
+async def test_non_ts_broadcast_is_not_shared():
+    hub = _hub()
+    body = b"not a transport stream" * 5000
+    upstream = Upstream(body, chunk_size=16 * 1024)
+    first, data = await _watch(hub, 1, upstream, len(body))
+    assert data == body
+    assert not hub.is_active(1)
+
+    # A second viewer gets its own upstream from the start
+    second = hub.subscribe(1, upstream)
+    assert await _read(second, len(body)) == body
+    assert upstream.opened == 2
+    await first.aclose()
+    await second.aclose()
+    # Both upstreams close on their own once the linger runs out
+    await asyncio.sleep(LINGER * 3)
+    assert upstream.closed == 2
+
+
+@pytest.mark.asyncio
+async def test_popular_channel_stays_warm_without_viewers():
+    hub = _hub(warm_top_n=1)
+    stream = program()
+    upstream = Upstream(stream)
+    viewer, _ = await _watch(hub, 1, upstream, len(stream))
+    await viewer.aclose()
+
+    await asyncio.sleep(LINGER * 3)
+    assert hub.is_active(1) and hub.is_idle(1)
+    assert hub.broadcasts[1].warm
+    await hub.stop_all()
+    assert upstream.closed == 1
@@ -0,0 +1,95 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.utils import ts_recorder
+from app.utils.mpegts import TS_PACKET_SIZE
+from app.utils.ts_recorder import NotTransportStream, TSRecording
+from tests.ts_packets import program
+
+
+class FakeUpstream:
+    """Stands in for stream_sources.open_stream: one list of chunks per connection.
+
+    Every connection but the last drops with a read error after its
+    chunks; the last one stays open until the recording is stopped.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = list(sessions)
+        self.opened = 0
+
+    async def open_stream(self, urls, pool=None):
+        chunks = self.sessions[self.opened]
+        self.opened += 1
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(0)
+        if self.opened < len(self.sessions):
+            raise httpx.ReadError("connection reset")
+        await asyncio.Event().wait()
+
+
+def _chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+async def _record(tmp_path, monkeypatch, sessions, write_buffer=TS_PACKET_SIZE * 4):
+    upstream = FakeUpstream(sessions)
+    monkeypatch.setattr(ts_recorder.stream_sources, "open_stream", upstream.open_stream)
+    monkeypatch.setattr(ts_recorder, "RECONNECT_DELAY", 0.01)
+    recording = TSRecording(["http://upstream/1.ts"], None, str(tmp_path / "out.ts"), 30, write_buffer)
+    await recording.start()
+    while upstream.opened < len(sessions) or recording.bytes_written == 0:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+    recording.terminate()
+    await recording.wait()
+    return recording, (tmp_path / "out.ts").read_bytes()
+
+
+@pytest.mark.asyncio
+async def test_writes_whole_packets_from_unaligned_chunks(tmp_path, monkeypatch):
+    stream = program(gops=4)
+    recording, written = await _record(tmp_path, monkeypatch, [_chunks(stream, 1000)])
+    assert written == stream[:len(written)]
+    assert len(written) == len(stream)
+    assert recording.bytes_written == len(written)
+    assert recording.continuity_errors == 0
+
+
+@pytest.mark.asyncio
+async def test_reconnect_keeps_packet_alignment(tmp_path, monkeypatch):
+    first, second = program(gops=2), program(gops=2)
+    # The first connection is cut off mid-packet; the second starts mid-packet
+    cut = len(first) - 100
+    recording, written = await _record(tmp_path, monkeypatch, [
+        _chunks(first[:cut], 500),
+        _chunks(second[60:], 700),
+    ])
+
+    assert recording.reconnects == 1
+    assert len(written) % TS_PACKET_SIZE == 0
+    assert all(written[i] == 0x47 for i in range(0, len(written), TS_PACKET_SIZE))
+    # The partial packets at the drop are left out entirely
+    whole_first = cut - cut % TS_PACKET_SIZE
+    assert written == first[:whole_first] + second[TS_PACKET_SIZE:]
+
+
+@pytest.mark.asyncio
+async def test_small_write_buffer_batches_every_byte(tmp_path, monkeypatch):
+    stream = program(gops=8)
+    recording, written = await _record(tmp_path, monkeypatch, [_chunks(stream, 188 * 3 + 7)],
+                                       write_buffer=TS_PACKET_SIZE)
+    assert written == stream
+    assert recording.bytes_written == len(stream)
+
+
+@pytest.mark.asyncio
+async def test_non_ts_source_is_refused(tmp_path, monkeypatch):
+    upstream = FakeUpstream([[b"<html>" * 20000]])
+    monkeypatch.setattr(ts_recorder.stream_sources, "open_stream", upstream.open_stream)
+    recording = TSRecording(["http://upstream/page"], None, str(tmp_path / "out.ts"), 30, 1024)
+    with pytest.raises(NotTransportStream):
+        await recording.start()
@@ -0,0 +1,175 @@
+import asyncio
+
+import pytest
+
+from app.utils.tuner_slots import (
+    PRIORITY_LIVE,
+    PRIORITY_PROBE,
+    PRIORITY_RECORDING,
+    SlotUnavailable,
+    TunerSlots,
+    _parse_overrides,
+)
+
+POOL = 1
+
+
+def _slots(default_slots=1, overrides=None, max_recordings=0):
+    return TunerSlots(default_slots, overrides or {}, max_recordings, queue_timeout=1)
+
+
+class Viewer:
+    """A live holder whose preemption is recorded"""
+
+    def __init__(self, watched=True):
+        self.watched = watched
+        self.preempted = False
+
+    async def preempt(self):
+        self.preempted = True
+
+    def idle(self):
+        return not self.watched
+
+
+async def _acquire_viewer(slots, holder, viewer, timeout=0):
+    await slots.acquire(holder, POOL, PRIORITY_LIVE, preempt=viewer.preempt, idle=viewer.idle,
+                        timeout=timeout)
+
+
+def test_parse_overrides():
+    assert _parse_overrides("") == {}
+    assert _parse_overrides("3:2, 7:0") == {3: 2, 7: 0}
+
+
+def test_capacity_uses_overrides_and_zero_is_unlimited():
+    slots = _slots(default_slots=2, overrides={5: 0})
+    assert slots.capacity(POOL) == 2
+    assert slots.capacity(5) == 0
+    assert slots.has_room(5)
+
+
+@pytest.mark.asyncio
+async def test_acquire_is_idempotent_and_release_is_safe_twice():
+    slots = _slots()
+    await slots.acquire("a", POOL, timeout=0)
+    await slots.acquire("a", POOL, timeout=0)
+    assert slots.used(POOL) == 1
+    slots.release("a")
+    slots.release("a")
+    assert slots.used(POOL) == 0
+    await slots.acquire("b", POOL, timeout=0)
+    assert slots.holds("b")
+
+
+@pytest.mark.asyncio
+async def test_full_pool_fails_fast():
+    slots = _slots()
+    await slots.acquire("a", POOL, timeout=0)
+    with pytest.raises(SlotUnavailable):
+        await slots.acquire("b", POOL, timeout=0)
+    assert slots.rejected == 1
+    # Other pools are unaffected
+    await slots.acquire("c", POOL + 1, timeout=0)
+
+
+@pytest.mark.asyncio
+async def test_waiter_gets_the_released_slot():
+    slots = _slots()
+    await slots.acquire("a", POOL, timeout=0)
+    waiter = asyncio.create_task(slots.acquire("b", POOL, timeout=1))
+    await asyncio.sleep(0.01)
+    assert slots.waiting == {(POOL, PRIORITY_LIVE): 1}
+    slots.release("a")
+    await waiter
+    assert slots.holds("b")
+    assert slots.waiting == {}
+
+
+@pytest.mark.asyncio
+async def test_live_preempts_only_unwatched_holders():
+    slots = _slots()
+    watched = Viewer()
+    await _acquire_viewer(slots, "watched", watched)
+    with pytest.raises(SlotUnavailable):
+        await slots.acquire("new", POOL, timeout=0)
+    assert not watched.preempted
+
+    watched.watched = False
+    await slots.acquire("new", POOL, timeout=0)
+    assert watched.preempted
+    assert slots.holds("new") and not slots.holds("watched")
+    assert slots.preemptions == 1
+
+
+@pytest.mark.asyncio
+async def test_recording_preempts_the_newest_viewer():
+    slots = _slots(default_slots=2)
+    first, second = Viewer(), Viewer()
+    await _acquire_viewer(slots, "first", first)
+    await asyncio.sleep(0.01)
+    await _acquire_viewer(slots, "second", second)
+    await slots.acquire("recording", POOL, PRIORITY_RECORDING, timeout=0)
+    assert second.preempted and not first.preempted
+    assert slots.holds("recording") and slots.holds("first")
+
+
+@pytest.mark.asyncio
+async def test_recordings_are_never_preempted():
+    slots = _slots()
+    await slots.acquire("recording", POOL, PRIORITY_RECORDING, timeout=0)
+    with pytest.raises(SlotUnavailable):
+        await slots.acquire("other", POOL, PRIORITY_RECORDING, timeout=0)
+    assert slots.holds("recording")
+
+
+@pytest.mark.asyncio
+async def test_live_does_not_jump_a_waiting_recording():
+    slots = _slots()
+    await slots.acquire("recording-1", POOL, PRIORITY_RECORDING, timeout=0)
+    waiting = asyncio.create_task(slots.acquire("recording-2", POOL, PRIORITY_RECORDING, timeout=1))
+    await asyncio.sleep(0.01)
+    slots.release("recording-1")
+    # The freed slot is the recording's even if a viewer asks first
+    with pytest.raises(SlotUnavailable):
+        await slots.acquire("live", POOL, timeout=0)
+    await waiting
+    assert slots.holds("recording-2") and not slots.holds("live")
+
+
+@pytest.mark.asyncio
+async def test_probes_never_wait_in_line_or_preempt():
+    slots = _slots()
+    idle = Viewer(watched=False)
+    await _acquire_viewer(slots, "idle", idle)
+    with pytest.raises(SlotUnavailable):
+        await slots.acquire("probe", POOL, PRIORITY_PROBE, timeout=0)
+    assert not idle.preempted
+    assert slots.rejected == 0  # Probes aren't counted as rejections
+
+    slots.release("idle")
+    slots.waiting[(POOL, PRIORITY_LIVE)] = 1  # Someone queued for the free slot
+    with pytest.raises(SlotUnavailable):
+        await slots.acquire("probe", POOL, PRIORITY_PROBE, timeout=0)
+    del slots.waiting[(POOL, PRIORITY_LIVE)]
+    await slots.acquire("probe", POOL, PRIORITY_PROBE, timeout=0)
+    assert slots.holds("probe")
+
+
+@pytest.mark.asyncio
+async def test_max_concurrent_recordings():
+    slots = _slots(default_slots=0, max_recordings=1)
+    viewer = Viewer(watched=False)
+    await _acquire_viewer(slots, "viewer", viewer)
+    await slots.acquire("recording-1", POOL, PRIORITY_RECORDING, timeout=0)
+    with pytest.raises(SlotUnavailable, match="Maximum of 1 concurrent recordings"):
+        await slots.acquire("recording-2", POOL, PRIORITY_RECORDING, timeout=0)
+    assert not viewer.preempted
+
+    # A recording held back by the cap doesn't block live viewers
+    waiting = asyncio.create_task(slots.acquire("recording-2", POOL, PRIORITY_RECORDING, timeout=1))
+    await asyncio.sleep(0.01)
+    await slots.acquire("live", POOL, timeout=0)
+    slots.release("recording-1")
+    await waiting
+    assert slots.recordings() == 1 and slots.holds("recording-2")
@@ -0,0 +1,76 @@
+"""Builders for small synthetic MPEG-TS streams"""
+
+from typing import List, Optional, Tuple
+
+TS_PACKET_SIZE = 188
+
+PMT_PID = 0x1000
+VIDEO_PID = 0x100
+AUDIO_PID = 0x101
+
+H264 = 0x1B
+AAC = 0x0F
+
+
+def packet(pid: int, counter: int = 0, keyframe: bool = False, unit_start: bool = False,
+           payload: bytes = b"") -> bytes:
+    """One packet; ``keyframe`` sets random_access_indicator in an adaptation field"""
+    pusi = 0x40 if unit_start or keyframe else 0
+    header = bytes([0x47, pusi | (pid >> 8), pid & 0xFF])
+    if keyframe:
+        header += bytes([0x30 | (counter & 0x0F), 1, 0x40])
+    else:
+        header += bytes([0x10 | (counter & 0x0F)])
+    data = header + payload
+    return data + b"\xff" * (TS_PACKET_SIZE - len(data))
+
+
+def _section(pid: int, table_id: int, body: bytes) -> bytes:
+    # CRC left as zeros: the parsers under test don't check it
+    section = bytes([table_id, 0xB0, len(body) + 9, 0x00, 0x01, 0xC1, 0x00, 0x00]) + body + b"\x00" * 4
+    return packet(pid, unit_start=True, payload=b"\x00" + section)
+
+
+def pat(pmt_pid: int = PMT_PID) -> bytes:
+    return _section(0, 0x00, bytes([0x00, 0x01, 0xE0 | (pmt_pid >> 8), pmt_pid & 0xFF]))
+
+
+def pmt(streams: List[Tuple[int, int]], pmt_pid: int = PMT_PID) -> bytes:
+    """PMT listing ``(stream_type, pid)`` elementary streams"""
+    body = bytes([0xE0 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0xF0, 0x00])
+    for stream_type, pid in streams:
+        body += bytes([stream_type, 0xE0 | (pid >> 8), pid & 0xFF, 0xF0, 0x00])
+    return _section(pmt_pid, 0x02, body)
+
+
+def pes_packet(pid: int, pts: int, counter: int = 0, keyframe: bool = False) -> bytes:
+    """Packet starting a PES header that carries ``pts``"""
+    pes = b"\x00\x00\x01\xe0\x00\x00\x80\x80\x05" + bytes([
+        0x21 | ((pts >> 29) & 0x0E),
+        (pts >> 22) & 0xFF,
+        0x01 | ((pts >> 14) & 0xFE),
+        (pts >> 7) & 0xFF,
+        0x01 | ((pts << 1) & 0xFE),
+    ])
+    return packet(pid, counter, keyframe=keyframe, unit_start=True, payload=pes)
+
+
+def program(gops: int = 2, gop_packets: int = 8, audio_keyframes: bool = True,
+            pts_step: Optional[int] = None) -> bytes:
+    """PAT, PMT (H.264 video + AAC audio), then ``gops`` GOPs of video with interleaved audio.
+
+    Audio packets carry random_access_indicator too, as real audio
+    encoders set it on every frame.
+    """
+    data = pat() + pmt([(H264, VIDEO_PID), (AAC, AUDIO_PID)])
+    video = audio = 0
+    for gop in range(gops):
+        for i in range(gop_packets):
+            if i == 0 and pts_step is not None:
+                data += pes_packet(VIDEO_PID, gop * pts_step, video, keyframe=True)
+            else:
+                data += packet(VIDEO_PID, video, keyframe=i == 0)
+            data += packet(AUDIO_PID, audio, keyframe=audio_keyframes)
+            video += 1
+            audio += 1
+    return data